@@ -2,12 +2,28 @@ import os
 import sys
 import json
 import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session, stream_with_context
 
 # codebase_token_counter is installed via pip install -e ., no need for sys.path modification
 from codebase_token_counter.token_counter import (
-    process_repository, format_number, FILE_EXTENSIONS
+    process_repository, format_number, scan_directory, FILE_EXTENSIONS, DEFAULT_BATCH_SIZE, TOKENIZER_NAME,
+    ScanOptions, ScanProgress, ScanCancelled, create_tokenizer_pool, resolve_workers
+)
+from codebase_token_counter.backends import resolve_model_tokenizer
+from codebase_token_counter.cache import TokenCache, DEFAULT_CACHE_DIR
+from codebase_token_counter.dir_tree import DirectoryTree
+from codebase_token_counter.file_stats import TokenHistogram, TopFiles
+from codebase_token_counter.exclusions import preset_exclusions
+from codebase_token_counter.ignore_files import IGNORE_FILES
+from codebase_token_counter.live_index import DEFAULT_POLL_INTERVAL, LiveIndexManager
+from codebase_token_counter.pack import (
+    PACK_LARGE_FILE_POLICIES, PACK_ORDERS, count_pack_files, iter_bundle, pack_files, with_bundle_overhead
 )
 
 app = Flask(__name__, 
@@ -17,6 +33,49 @@ app = Flask(__name__,
 app.config['SECRET_KEY'] = os.urandom(24)
 app.config['SESSION_TYPE'] = 'filesystem'
 
+# Tokenizer processes shared by every analysis, pack and live index (0 = one per CPU),
+# and files per tokenizer batch
+app.config['ANALYZE_WORKERS'] = resolve_workers(int(os.environ.get('TOKEN_COUNTER_WORKERS', '0')))
+app.config['ANALYZE_BATCH_SIZE'] = int(os.environ.get('TOKEN_COUNTER_BATCH_SIZE', str(DEFAULT_BATCH_SIZE)))
+# Threads listing directories in parallel; hides the latency of bind-mounted drives
+app.config['WALK_THREADS'] = int(os.environ.get('TOKEN_COUNTER_WALK_THREADS', '8'))
+# Per-file token cache so re-analyzing a project only tokenizes changed files
+app.config['CACHE_ENABLED'] = os.environ.get('TOKEN_COUNTER_CACHE', '1') != '0'
+app.config['CACHE_DIR'] = DEFAULT_CACHE_DIR
+# Files above TOKEN_COUNTER_MAX_FILE_SIZE bytes are counted exactly by streaming
+# ('exact'), left out ('skip') or estimated from samples ('sample')
+app.config['MAX_FILE_SIZE'] = int(os.environ['TOKEN_COUNTER_MAX_FILE_SIZE']) if os.environ.get('TOKEN_COUNTER_MAX_FILE_SIZE') else None
+app.config['LARGE_FILE_POLICY'] = os.environ.get('TOKEN_COUNTER_LARGE_FILES', 'exact')
+# Background analysis jobs: at most ANALYZE_MAX_JOBS scans run at once and at most
+# ANALYZE_MAX_QUEUED more wait for a free slot. Finished jobs are kept for
+# JOB_RETENTION seconds so their results can still be fetched.
+app.config['ANALYZE_MAX_JOBS'] = int(os.environ.get('TOKEN_COUNTER_MAX_JOBS', '2'))
+app.config['ANALYZE_MAX_QUEUED'] = int(os.environ.get('TOKEN_COUNTER_MAX_QUEUED_JOBS', '8'))
+app.config['JOB_RETENTION'] = int(os.environ.get('TOKEN_COUNTER_JOB_RETENTION', '3600'))
+# Seconds between partial-result events on /jobs/<id>/events. An open event stream
+# holds one of the server's threads, so at most JOB_EVENT_MAX_STREAMS are open at once
+# (beyond that the page polls /jobs/<id> instead) and each connection ends after
+# JOB_EVENT_STREAM_SECONDS, after which the browser reconnects by itself.
+app.config['JOB_EVENT_INTERVAL'] = 0.5
+app.config['JOB_EVENT_MAX_STREAMS'] = int(os.environ.get('TOKEN_COUNTER_MAX_EVENT_STREAMS', '2'))
+app.config['JOB_EVENT_STREAM_SECONDS'] = 15
+# Milliseconds browsers wait before reconnecting to an event stream that ended
+JOB_EVENT_RETRY_MS = 500
+# Live indexes keep the counts of projects under INDEX_ROOT in memory and update them as
+# files change, so analyzing an indexed project again is instant. They share a budget of
+# TOKEN_COUNTER_INDEX_MEMORY_MB; the least recently used are dropped beyond it. Changes
+# come from inotify, or with TOKEN_COUNTER_INDEX_WATCH=poll from walking each project every
+# TOKEN_COUNTER_INDEX_POLL_INTERVAL seconds, for bind mounts without inotify events
+# (Docker Desktop on Windows and macOS).
+app.config['INDEX_ROOT'] = os.environ.get('TOKEN_COUNTER_INDEX_ROOT', '/mnt/projects')
+app.config['INDEX_MEMORY_LIMIT'] = int(os.environ.get('TOKEN_COUNTER_INDEX_MEMORY_MB', '256')) * 1024 * 1024
+app.config['INDEX_WATCH'] = os.environ.get('TOKEN_COUNTER_INDEX_WATCH', 'auto')
+app.config['INDEX_POLL_INTERVAL'] = float(os.environ.get('TOKEN_COUNTER_INDEX_POLL_INTERVAL', str(DEFAULT_POLL_INTERVAL)))
+# Files listed as the largest of each analysis
+app.config['TOP_FILES'] = int(os.environ.get('TOKEN_COUNTER_TOP_FILES', '20'))
+# Directory trees of the most recent analyses kept for /tree drill-down
+app.config['TREE_RETENTION'] = int(os.environ.get('TOKEN_COUNTER_TREE_RETENTION', '32'))
+
 # Define the models and their context windows (Updated per user request May 2025)
 LLM_MODELS = {
     "OpenAI": {
@@ -43,6 +102,20 @@ LLM_MODELS = {
     }
 }
 
+# Tokenizer of each model in LLM_MODELS, when one is public. Usage is computed with
+# it when the tokenizer file is available locally (TOKEN_COUNTER_TOKENIZER_DIR),
+# otherwise with the default tokenizer and reported as approximate.
+MODEL_TOKENIZERS = {
+    "GPT-4.1 / mini (1M)": "o200k_base",
+    "GPT-4o / Turbo (128K)": "o200k_base",
+    "Llama 4 Scout (10M)": "llama4",
+    "Mistral Large 2 (128K)": "mistral-large",
+    "Mistral Small 3.1 (128K)": "mistral-small",
+    "Mistral NeMo (128K)": "mistral-nemo",
+    "Cohere Command R+ (128K)": "command-r-plus",
+    "DBRX Instruct (32K)": "cl100k_base",
+}
+
 @app.route('/')
 def index():
     # Get the mounted volumes for display in the UI
@@ -105,8 +178,252 @@ def get_drives():
     
     return jsonify(drives)
 
+# GUI exclusion options and the preset each one enables
+EXCLUDE_OPTIONS = {
+    'excludeTests': 'tests',
+    'excludeDocs': 'docs',
+    'excludeDependencies': 'dependencies',
+}
+
+def build_exclusions(options):
+    """Return (exclude_dirs, exclude_patterns) for the GUI's exclusion options."""
+    return preset_exclusions(preset for option, preset in EXCLUDE_OPTIONS.items() if options.get(option))
+
+def group_by_technology(extension_stats, file_counts):
+    """Return (tech_stats, tech_file_counts) summed over the extensions of each technology."""
+    tech_stats = {}
+    tech_file_counts = {}
+    for ext, count in extension_stats.items():
+        tech = FILE_EXTENSIONS.get(ext, "Other")  # Default to "Other" if extension not found
+        tech_stats[tech] = tech_stats.get(tech, 0) + count
+        tech_file_counts[tech] = tech_file_counts.get(tech, 0) + file_counts.get(ext, 0)
+    return tech_stats, tech_file_counts
+
+def get_model_tokenizers():
+    """Return the tokenizer to count each model with: its own where one is available locally."""
+    return {
+        model: resolve_model_tokenizer(MODEL_TOKENIZERS.get(model), TOKENIZER_NAME)
+        for models in LLM_MODELS.values() for model in models
+    }
+
+_tokenizer_pool = None
+_tokenizer_pool_lock = threading.Lock()
+
+def get_tokenizer_pool():
+    """Return the tokenizer processes every scan shares, starting them on first use; None with one worker."""
+    global _tokenizer_pool
+    with _tokenizer_pool_lock:
+        if _tokenizer_pool is None and app.config['ANALYZE_WORKERS'] > 1:
+            _tokenizer_pool = create_tokenizer_pool(app.config['ANALYZE_WORKERS'])
+        return _tokenizer_pool
+
+def get_scan_options(options=None):
+    """Return the ScanOptions of the app's settings, with the exclusions of the GUI's options if given."""
+    scan_options = ScanOptions(
+        extra_tokenizers=sorted(set(get_model_tokenizers().values()) - {TOKENIZER_NAME}),
+        workers=app.config['ANALYZE_WORKERS'],
+        batch_size=app.config['ANALYZE_BATCH_SIZE'],
+        walk_threads=app.config['WALK_THREADS'],
+        max_file_size=app.config['MAX_FILE_SIZE'],
+        large_file_policy=app.config['LARGE_FILE_POLICY']
+    )
+    if options is not None:
+        exclude_dirs_set, exclude_patterns_list, ignore_files = index_settings(options)
+        scan_options = scan_options._replace(
+            exclude_dirs=exclude_dirs_set, exclude_patterns=exclude_patterns_list, ignore_files=ignore_files
+        )
+    return scan_options
+
+_index_manager = None
+_index_manager_lock = threading.Lock()
+
+def get_index_manager():
+    """Return the manager of the live indexes, creating it on first use."""
+    global _index_manager
+    with _index_manager_lock:
+        if _index_manager is None:
+            _index_manager = LiveIndexManager(
+                memory_limit=app.config['INDEX_MEMORY_LIMIT'],
+                options=get_scan_options(),
+                cache_dir=app.config['CACHE_DIR'] if app.config['CACHE_ENABLED'] else None,
+                executor=get_tokenizer_pool(),
+                watch=app.config['INDEX_WATCH'],
+                poll_interval=app.config['INDEX_POLL_INTERVAL']
+            )
+        return _index_manager
+
+def is_indexable(path):
+    """Return True if path is a project directory a live index may be kept for."""
+    index_root = os.path.abspath(app.config['INDEX_ROOT'])
+    path = os.path.abspath(path)
+    return os.path.isdir(path) and path != index_root and os.path.commonpath([path, index_root]) == index_root
+
+def index_settings(options):
+    """Return (exclude_dirs, exclude_patterns, ignore_files) for the GUI's options."""
+    exclude_dirs_set, exclude_patterns_list = build_exclusions(options)
+    return exclude_dirs_set, exclude_patterns_list, IGNORE_FILES if options.get('respectIgnoreFiles') else ()
+
+def wait_for_index(index, progress=None):
+    """Wait for a live index to be built, showing its progress on progress; return True if it is ready."""
+    while not index.wait(0.2):
+        if not index.active:
+            return False
+        if progress is not None:
+            progress.check_cancelled()
+            snapshot = index.progress.snapshot()
+            progress.stage = snapshot['stage']
+            progress.files_discovered = snapshot['files_discovered']
+            progress.files_to_process = snapshot['files_to_process']
+            progress.files_tokenized = snapshot['files_tokenized']
+            progress.bytes_processed = snapshot['bytes_processed']
+    return True
+
+_trees = OrderedDict()
+_trees_lock = threading.Lock()
+
+def store_tree(tree):
+    """
+    Keep a DirectoryTree, or a function building one on first use, for /tree; return its id.
+
+    Only the TREE_RETENTION most recent trees are kept.
+    """
+    tree_id = uuid.uuid4().hex
+    with _trees_lock:
+        _trees[tree_id] = tree
+        while len(_trees) > app.config['TREE_RETENTION']:
+            _trees.popitem(last=False)
+    return tree_id
+
+def get_tree(tree_id):
+    """Return a stored DirectoryTree, or None if it is unknown or was dropped."""
+    with _trees_lock:
+        tree = _trees.get(tree_id)
+    if tree is not None and not isinstance(tree, DirectoryTree):
+        tree = tree()
+        with _trees_lock:
+            if tree_id in _trees:
+                _trees[tree_id] = tree
+    return tree
+
+def run_analysis(path, options, progress=None, on_file=None):
+    """
+    Analyze a directory or file and return the results as sent to the GUI.
+
+    Paths with a ready live index are answered from it. With the liveIndex
+    option, a project's index is started if needed and waited for.
+    """
+    exclude_dirs_set, exclude_patterns_list, ignore_files = index_settings(options)
+
+    # Count with each model's own tokenizer where one is available locally
+    model_tokenizers = get_model_tokenizers()
+    tokenizer_totals = {}
+
+    index = None
+    if is_indexable(path):
+        manager = get_index_manager()
+        if options.get('liveIndex'):
+            index = manager.start(path, exclude_dirs_set, exclude_patterns_list, ignore_files)
+            wait_for_index(index, progress)
+        else:
+            index = manager.get(path, exclude_dirs_set, exclude_patterns_list, ignore_files)
+
+    cache = None
+    if index is not None and index.status == 'ready':
+        total_tokens, extension_stats, file_counts = index.results(tokenizer_totals)
+        top_files = index.top_files(app.config['TOP_FILES'])
+        token_histogram = index.token_histogram()
+        # Built from the index only if the GUI drills down
+        tree_id = store_tree(index.directory_tree)
+    else:
+        index = None
+        directory_tree = DirectoryTree()
+        top_files = TopFiles(app.config['TOP_FILES'])
+        token_histogram = TokenHistogram()
+        cache = TokenCache(app.config['CACHE_DIR']) if app.config['CACHE_ENABLED'] else None
+        try:
+            total_tokens, extension_stats, file_counts = process_repository(
+                path,
+                options=get_scan_options(options),
+                cache=cache,
+                executor=get_tokenizer_pool(),
+                tokenizer_totals=tokenizer_totals,
+                progress=progress,
+                on_file=on_file,
+                directory_tree=directory_tree,
+                top_files=top_files,
+                token_histogram=token_histogram
+            )
+        finally:
+            if cache is not None:
+                cache.close()
+        tree_id = store_tree(directory_tree)
+
+    # Group results by technology category
+    tech_stats, tech_file_counts = group_by_technology(extension_stats, file_counts)
+
+    # Calculate model percentages
+    model_percentages = {}
+    for category, models in LLM_MODELS.items():
+        for model, window in models.items():
+            model_tokenizer = model_tokenizers[model]
+            percentage = (tokenizer_totals[model_tokenizer] / window) * 100
+            color = "danger" if percentage > 100 else "success"
+            model_percentages[model] = {
+                'percentage': round(percentage, 1),
+                'color': color,
+                'tokenizer': model_tokenizer,
+                'approximate': MODEL_TOKENIZERS.get(model) != model_tokenizer
+            }
+
+    # Format extensions for display
+    formatted_extensions = []
+    for ext, count in sorted(extension_stats.items(), key=lambda x: x[1], reverse=True):
+        formatted_extensions.append({
+            'extension': ext,
+            'tokens': count,
+            'tokens_formatted': f"{format_number(count)} ({count:,})",
+            'files': file_counts[ext],
+            'files_text': f"{file_counts[ext]} file{'s' if file_counts[ext] != 1 else ''}"
+        })
+
+    # Format technologies for display
+    formatted_technologies = []
+    for tech, count in sorted(tech_stats.items(), key=lambda x: x[1], reverse=True):
+        formatted_technologies.append({
+            'technology': tech,
+            'tokens': count,
+            'tokens_formatted': f"{format_number(count)} ({count:,})",
+            'files': tech_file_counts[tech],
+            'files_text': f"{tech_file_counts[tech]} file{'s' if tech_file_counts[tech] != 1 else ''}"
+        })
+
+    # Paths relative to the analyzed directory, or the file's name
+    report_root = path if os.path.isdir(path) else os.path.dirname(path)
+    largest_files = [
+        {
+            'path': os.path.relpath(file_path, report_root),
+            'tokens': count,
+            'tokens_formatted': f"{format_number(count)} ({count:,})"
+        }
+        for file_path, count in top_files.largest()
+    ]
+
+    return {
+        'total_tokens': total_tokens,
+        'total_tokens_formatted': f"{format_number(total_tokens)} ({total_tokens:,})",
+        'extensions': formatted_extensions,
+        'technologies': formatted_technologies,
+        'models': model_percentages,
+        'cache': cache.stats() if cache is not None else None,
+        'index': index.to_dict() if index is not None else None,
+        'tree_id': tree_id,
+        'largest_files': largest_files,
+        'token_histogram': token_histogram.describe()
+    }
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
+    """Analyze synchronously; the GUI uses the /jobs endpoints instead."""
     data = request.get_json()
     path = data.get('directory')
     options = data.get('options', {}) # Get exclusion options
@@ -116,106 +433,362 @@ def analyze():
          return jsonify({'error': f"Path does not exist or is not accessible: {path}"}), 400
 
     try:
-        # Prepare exclusion arguments based on options
-        exclude_dirs_set = set()
-        exclude_patterns_list = []
-
-        if options.get('excludeTests'):
-            # Exclude common test directory names
-            exclude_dirs_set.update(['tests', '__tests__', 'test', 'spec', 'specs'])
-            # Exclude common test file patterns
-            exclude_patterns_list.extend(['*_test.py', 'test_*.py', '*.spec.js', '*.test.js', '*.spec.ts', '*.test.ts'])
-
-        if options.get('excludeDocs'):
-            # Exclude common documentation directory names
-            exclude_dirs_set.update(['docs', 'documentation', 'doc'])
-            # Exclude common documentation file patterns/extensions
-            exclude_patterns_list.extend(['*.md', '*.rst', '*.wiki', '*.adoc'])
-
-        if options.get('excludeDependencies'):
-            # Exclude common dependency/build artifact directory names/patterns
-            # Using path patterns (with '/') to avoid excluding unrelated files/dirs
-            exclude_patterns_list.extend([
-                'node_modules/',
-                'vendor/',
-                'packages/',
-                'dist/',
-                'build/',
-                'target/',
-                'out/',
-                'bin/',
-                'obj/',
-                '.next/',
-                '.nuxt/',
-                '.svelte-kit/',
-                '.cache/',
-                '*.egg-info/',
-            ])
-            exclude_dirs_set.update(['bower_components']) # Also exclude by name
-
-        # Call the updated process_repository with exclusions
-        total_tokens, extension_stats, file_counts = process_repository(
-            path,
-            exclude_dirs=exclude_dirs_set,
-            exclude_patterns=exclude_patterns_list
-        )
-
-        # --- Post-processing remains largely the same ---
-
-        # Group results by technology category
-        tech_stats = {}
-        tech_file_counts = {}
-        for ext, count in extension_stats.items():
-            tech = FILE_EXTENSIONS.get(ext, "Other")  # Default to "Other" if extension not found
-            tech_stats[tech] = tech_stats.get(tech, 0) + count
-            tech_file_counts[tech] = tech_file_counts.get(tech, 0) + file_counts[ext]
-        
-        # Calculate model percentages
-        model_percentages = {}
-        for category, models in LLM_MODELS.items():
-            for model, window in models.items():
-                percentage = (total_tokens / window) * 100
-                color = "danger" if percentage > 100 else "success"
-                model_percentages[model] = {
-                    'percentage': round(percentage, 1),
-                    'color': color
-                }
-        
-        # Format extensions for display
-        formatted_extensions = []
-        for ext, count in sorted(extension_stats.items(), key=lambda x: x[1], reverse=True):
-            formatted_extensions.append({
-                'extension': ext,
-                'tokens': count,
-                'tokens_formatted': f"{format_number(count)} ({count:,})",
-                'files': file_counts[ext],
-                'files_text': f"{file_counts[ext]} file{'s' if file_counts[ext] != 1 else ''}"
-            })
-        
-        # Format technologies for display
-        formatted_technologies = []
-        for tech, count in sorted(tech_stats.items(), key=lambda x: x[1], reverse=True):
-            formatted_technologies.append({
-                'technology': tech,
-                'tokens': count,
-                'tokens_formatted': f"{format_number(count)} ({count:,})",
-                'files': tech_file_counts[tech],
-                'files_text': f"{tech_file_counts[tech]} file{'s' if tech_file_counts[tech] != 1 else ''}"
-            })
-        
-        return jsonify({
-            'total_tokens': total_tokens,
-            'total_tokens_formatted': f"{format_number(total_tokens)} ({total_tokens:,})",
-            'extensions': formatted_extensions,
-            'technologies': formatted_technologies,
-            'models': model_percentages
-        })
-    
+        return jsonify(run_analysis(path, options))
     except Exception as e:
         return jsonify({
             'error': f"Error analyzing directory: {str(e)}"
         }), 500
 
+class AnalysisJob:
+    """An analysis that runs in the background job executor."""
+
+    def __init__(self, path, options):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.options = options
+        self.status = 'queued' # queued -> running -> done / failed / cancelled
+        self.progress = ScanProgress()
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        # Tokens and files per extension counted so far, for partial results
+        self.partial_tokens = {}
+        self.partial_files = {}
+        self._partial_lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def run(self):
+        if self.progress.cancelled: # Cancelled before a slot became free
+            self.finish('cancelled')
+            return
+        self.status = 'running'
+        try:
+            self.result = run_analysis(self.path, self.options, self.progress, self.add_file)
+            self.finish('done')
+        except ScanCancelled:
+            self.finish('cancelled')
+        except Exception as e:
+            app.logger.exception(f"Analysis job {self.id} failed")
+            self.error = f"Error analyzing directory: {str(e)}"
+            self.finish('failed')
+
+    def add_file(self, file_path, extension, counts):
+        """process_repository on_file hook: record a counted file in the partial results."""
+        with self._partial_lock:
+            self.partial_tokens[extension] = self.partial_tokens.get(extension, 0) + counts[TOKENIZER_NAME]
+            self.partial_files[extension] = self.partial_files.get(extension, 0) + 1
+
+    def partial_results(self):
+        """Return copies of (tokens per extension, files per extension) counted so far."""
+        with self._partial_lock:
+            return dict(self.partial_tokens), dict(self.partial_files)
+
+    def finish(self, status):
+        self.finished = time.time()
+        self.status = status
+
+    def cancel(self):
+        self.progress.cancel()
+        if self.future is not None and self.future.cancel():
+            self.finish('cancelled')
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'path': self.path,
+            'status': self.status,
+            'progress': self.progress.snapshot(),
+            'elapsed': round((self.finished or time.time()) - self.created, 1)
+        }
+        if self.result is not None:
+            data['result'] = self.result
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_job_executor = None
+
+def get_job_executor():
+    """Return the executor that runs analysis jobs, creating it on first use."""
+    global _job_executor
+    if _job_executor is None:
+        _job_executor = ThreadPoolExecutor(
+            max_workers=max(1, app.config['ANALYZE_MAX_JOBS']),
+            thread_name_prefix='analysis-job'
+        )
+    return _job_executor
+
+def prune_jobs():
+    """Forget finished jobs older than JOB_RETENTION seconds. Call with _jobs_lock held."""
+    cutoff = time.time() - app.config['JOB_RETENTION']
+    for job_id in [job.id for job in _jobs.values() if job.finished is not None and job.finished < cutoff]:
+        del _jobs[job_id]
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Start an analysis in the background and return its job id immediately."""
+    data = request.get_json()
+    path = data.get('directory')
+    options = data.get('options', {})
+
+    if not path or not os.path.exists(path):
+         return jsonify({'error': f"Path does not exist or is not accessible: {path}"}), 400
+
+    with _jobs_lock:
+        prune_jobs()
+        active_jobs = sum(1 for job in _jobs.values() if job.active)
+        if active_jobs >= app.config['ANALYZE_MAX_JOBS'] + app.config['ANALYZE_MAX_QUEUED']:
+            return jsonify({
+                'error': f"Too many analyses in progress ({active_jobs}), try again later"
+            }), 429
+        job = AnalysisJob(path, options)
+        _jobs[job.id] = job
+        job.future = get_job_executor().submit(job.run)
+
+    return jsonify(job.to_dict()), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status and progress of a job, and its results once done."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+def stats_delta(tokens, files, sent_tokens, sent_files):
+    """Return {key: {'tokens', 'files'}} for the keys whose counts changed since they were sent."""
+    return {
+        key: {'tokens': tokens[key] - sent_tokens.get(key, 0), 'files': files.get(key, 0) - sent_files.get(key, 0)}
+        for key in tokens
+        if tokens[key] != sent_tokens.get(key, 0) or files.get(key, 0) != sent_files.get(key, 0)
+    }
+
+def format_event(event, data, retry=None):
+    """Format one Server-Sent Event, optionally with the reconnection delay in milliseconds."""
+    prefix = f"retry: {retry}\n" if retry is not None else ''
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+def close_stream():
+    """Free the slot of an event stream once its response is closed."""
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Stream a job's partial results as Server-Sent Events.
+
+    'partial' events carry the progress and the tokens/files added per extension
+    and technology since the previous event; the first event of every connection
+    has reset=true and carries everything counted so far. A final 'summary'
+    event carries the same data as GET /jobs/<id>, then the stream ends.
+
+    A connection ends after JOB_EVENT_STREAM_SECONDS without a summary; the
+    browser then reconnects and starts over from a reset event, so no server
+    thread is held for the whole scan. Beyond JOB_EVENT_MAX_STREAMS open
+    streams, requests get 503 and the page polls GET /jobs/<id> instead.
+    """
+    global _open_streams
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}"}), 404
+    interval = app.config['JOB_EVENT_INTERVAL']
+    deadline = time.monotonic() + app.config['JOB_EVENT_STREAM_SECONDS']
+
+    with _open_streams_lock:
+        if _open_streams >= app.config['JOB_EVENT_MAX_STREAMS']:
+            return jsonify({'error': "Too many open event streams, poll the job instead"}), 503
+        _open_streams += 1
+
+    def generate():
+        sent_tokens, sent_files, sent_tech_tokens, sent_tech_files = {}, {}, {}, {}
+        reset = True
+        while True:
+            # Read the status first so the last partial event includes every file
+            finished = not job.active
+            tokens, files = job.partial_results()
+            tech_tokens, tech_files = group_by_technology(tokens, files)
+            yield format_event('partial', {
+                'reset': reset,
+                'progress': job.progress.snapshot(),
+                'total_tokens': sum(tokens.values()) - sum(sent_tokens.values()),
+                'extensions': stats_delta(tokens, files, sent_tokens, sent_files),
+                'technologies': stats_delta(tech_tokens, tech_files, sent_tech_tokens, sent_tech_files)
+            }, retry=JOB_EVENT_RETRY_MS if reset else None)
+            sent_tokens, sent_files, sent_tech_tokens, sent_tech_files = tokens, files, tech_tokens, tech_files
+            reset = False
+            if finished:
+                yield format_event('summary', job.to_dict())
+                return
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(interval)
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server closes the response, however the stream ended
+    response.call_on_close(close_stream)
+    return response
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job."""
+    job = _jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job: {job_id}"}), 404
+    if job.active:
+        job.cancel()
+    return jsonify(job.to_dict())
+
+@app.route('/tree/<tree_id>', methods=['GET'])
+def expand_tree(tree_id):
+    """
+    Return a directory of an analysis and its subdirectories, with their token and file totals.
+
+    The directory is given by ?path=, relative to the analyzed path ('' or
+    absent for the root). Subdirectories come largest first, with the number
+    of their own subdirectories, so the GUI can expand them one at a time.
+    """
+    tree = get_tree(tree_id)
+    if tree is None:
+        return jsonify({'error': f"Unknown or expired directory tree: {tree_id}"}), 404
+    directory = request.args.get('path', '')
+    node = tree.find(directory)
+    if node is None:
+        return jsonify({'error': f"No counted files below: {directory}"}), 404
+    return jsonify(tree.describe(node))
+
+def pack_candidates(path, options, tokenizer):
+    """
+    Return the counted files of path for pack_files, from its live index when one is ready.
+
+    An index whose large files were estimated from samples is not used, since
+    packs need exact counts.
+    """
+    exclude_dirs_set, exclude_patterns_list, ignore_files = index_settings(options)
+    if is_indexable(path):
+        index = get_index_manager().get(path, exclude_dirs_set, exclude_patterns_list, ignore_files)
+        if (index is not None and index.status == 'ready' and tokenizer in index.options.tokenizers
+                and index.options.large_file_policy in PACK_LARGE_FILE_POLICIES):
+            return with_bundle_overhead(index.pack_files(tokenizer), tokenizer)
+
+    cache = TokenCache(app.config['CACHE_DIR']) if app.config['CACHE_ENABLED'] else None
+    try:
+        return count_pack_files(
+            path, get_scan_options(options), cache=cache, executor=get_tokenizer_pool(), tokenizer=tokenizer
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+
+@app.route('/pack', methods=['POST'])
+def pack():
+    """
+    Select the files of a directory that fit a model's context window.
+
+    Takes the directory and analysis options, a model of LLM_MODELS, tokens
+    to reserve for the prompt and answer, priority globs (most important
+    first) and the order within a priority, as for `token-counter pack`.
+    Returns the selected files, or with bundle, streams them concatenated
+    as a text download.
+    """
+    data = request.get_json()
+    path = data.get('directory')
+    options = data.get('options', {})
+    model = data.get('model')
+    windows = {name: window for models in LLM_MODELS.values() for name, window in models.items()}
+
+    if not path or not os.path.exists(path):
+        return jsonify({'error': f"Path does not exist or is not accessible: {path}"}), 400
+    if model not in windows:
+        return jsonify({'error': f"Unknown model: {model}"}), 400
+    order = data.get('order', 'recent')
+    if order not in PACK_ORDERS:
+        return jsonify({'error': f"Unknown order: {order}"}), 400
+    try:
+        reserve = max(0, int(data.get('reserve') or 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': f"Invalid number of tokens to reserve: {data.get('reserve')}"}), 400
+
+    tokenizer = get_model_tokenizers()[model]
+    try:
+        result = pack_files(
+            pack_candidates(path, options, tokenizer), max(0, windows[model] - reserve),
+            [priority for priority in data.get('priorities', []) if priority], order
+        )
+    except Exception as e:
+        return jsonify({'error': f"Error packing files: {str(e)}"}), 500
+
+    if data.get('bundle'):
+        response = Response(stream_with_context(iter_bundle(result.selected)), mimetype='text/plain; charset=utf-8')
+        response.headers['Content-Disposition'] = 'attachment; filename="bundle.txt"'
+        return response
+    return jsonify({
+        'model': model,
+        'window': windows[model],
+        'tokenizer': tokenizer,
+        'budget': result.budget,
+        'tokens': result.tokens,
+        'tokens_formatted': f"{format_number(result.tokens)} ({result.tokens:,})",
+        'total_files': result.files,
+        'files': [
+            {'path': file.relative_path, 'tokens': file.tokens, 'tokens_formatted': f"{format_number(file.tokens)} ({file.tokens:,})"}
+            for file in result.selected
+        ]
+    })
+
+@app.route('/index', methods=['POST'])
+def start_index():
+    """Start keeping a live index of a project, and return it; analyses of the project then use it."""
+    data = request.get_json()
+    path = data.get('directory')
+    options = data.get('options', {})
+
+    if not path or not is_indexable(path):
+        return jsonify({'error': f"Only project directories under {app.config['INDEX_ROOT']} can be indexed: {path}"}), 400
+
+    index = get_index_manager().start(path, *index_settings(options))
+    return jsonify(index.to_dict()), 202
+
+@app.route('/index', methods=['GET'])
+def list_indexes():
+    """Return every live index, most recently used first, and their estimated memory."""
+    manager = get_index_manager()
+    return jsonify({
+        'indexes': [index.to_dict() for index in manager.indexes()],
+        'memory_bytes': manager.memory_bytes(),
+        'memory_limit': manager.memory_limit
+    })
+
+@app.route('/index/<index_id>', methods=['GET'])
+def get_index(index_id):
+    index = get_index_manager().find(index_id)
+    if index is None:
+        return jsonify({'error': f"Unknown index: {index_id}"}), 404
+    return jsonify(index.to_dict())
+
+@app.route('/index/<index_id>', methods=['DELETE'])
+def stop_index(index_id):
+    """Stop a live index and free its memory."""
+    index = get_index_manager().stop(index_id)
+    if index is None:
+        return jsonify({'error': f"Unknown index: {index_id}"}), 404
+    return jsonify(index.to_dict())
+
 @app.route('/browse', methods=['POST'])
 def browse_directories():
     data = request.get_json()
@@ -252,30 +825,23 @@ def browse_directories():
             'is_parent': True
         }
         
-        # Get all items in the directory
+        # Get all items in the directory; entry types come from the listing itself,
+        # so slow bind mounts are not stat'ed once per entry
         items = []
-        listed_items = os.listdir(current_path)
-        app.logger.info(f"Found {len(listed_items)} items in {current_path}") # Logging
-        for item in listed_items:
-            full_path = os.path.join(current_path, item)
-            # Use try-except for isdir in case of broken symlinks etc.
-            try:
-                 is_dir = os.path.isdir(full_path)
-            except OSError:
-                 is_dir = False # Treat inaccessible items as non-directories
-                 app.logger.warning(f"Could not determine type for: {full_path}")
-            
-            # Skip hidden files starting with . (like .git)
-            if item.startswith('.'):
-                continue
-                
-            item_info = {
-                'name': item,
-                'path': full_path,
-                'is_dir': is_dir,
-                'is_parent': False
-            }
-            items.append(item_info)
+        dir_entries, file_entries = scan_directory(current_path)
+        app.logger.info(f"Found {len(dir_entries) + len(file_entries)} items in {current_path}") # Logging
+        for entries, is_dir in ((dir_entries, True), (file_entries, False)):
+            for entry in entries:
+                # Skip hidden files starting with . (like .git)
+                if entry.name.startswith('.'):
+                    continue
+
+                items.append({
+                    'name': entry.name,
+                    'path': entry.path,
+                    'is_dir': is_dir,
+                    'is_parent': False
+                })
         
         # Sort: directories first, then alphabetically
         items = sorted(items, key=lambda x: (not x['is_dir'], x['name'].lower()))
@@ -20,16 +20,44 @@ document.addEventListener('DOMContentLoaded', function() {
     const resultsContainer = document.getElementById('results-container');
     const errorContainer = document.getElementById('error-container');
     const errorMessage = document.getElementById('error-message');
+    const jobProgressBar = document.getElementById('job-progress-bar');
+    const jobProgressText = document.getElementById('job-progress-text');
+    const cancelBtn = document.getElementById('cancel-btn');
+    
+    // Analysis job being watched, if any, and its partial results so far
+    let currentJobId = null;
+    let partialResults = null;
+    const JOB_POLL_INTERVAL = 500;
+    // Path and options of the analysis shown, which files are packed from
+    let analyzedPath = null;
+    let analyzedOptions = null;
     
     // Result display elements
     const totalTokensElement = document.getElementById('total-tokens');
     const extensionsTable = document.getElementById('extensions-table');
     const technologiesTable = document.getElementById('technologies-table');
+    const fileStatsSection = document.getElementById('file-stats-section');
+    const largestFilesTable = document.getElementById('largest-files-table');
+    const histogramTable = document.getElementById('histogram-table');
+    const directoriesSection = document.getElementById('directories-section');
+    const directoriesTable = document.getElementById('directories-table');
+    const modelsContainer = document.getElementById('models-container');
+    const packSection = document.getElementById('pack-section');
+    const packModel = document.getElementById('pack-model');
+    const packPriorities = document.getElementById('pack-priorities');
+    const packOrder = document.getElementById('pack-order');
+    const packReserve = document.getElementById('pack-reserve');
+    const packBtn = document.getElementById('pack-btn');
+    const packBundleBtn = document.getElementById('pack-bundle-btn');
+    const packSummary = document.getElementById('pack-summary');
+    const packTable = document.getElementById('pack-table');
     
     // Advanced options
     const excludeTests = document.getElementById('exclude-tests');
     const excludeDocs = document.getElementById('exclude-docs');
     const excludeDependencies = document.getElementById('exclude-dependencies');
+    const respectIgnoreFiles = document.getElementById('respect-ignore-files');
+    const liveIndex = document.getElementById('live-index');
     
     // Theme handling
     const savedTheme = localStorage.getItem('theme');
@@ -88,12 +116,22 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    cancelBtn.addEventListener('click', function() {
+        if (currentJobId) {
+            cancelBtn.disabled = true;
+            fetch(`/jobs/${currentJobId}`, { method: 'DELETE' });
+        }
+    });
+    
     analyzeBtn.addEventListener('click', function() {
         if (selectedPathInput.value) {
             analyzeRepository(selectedPathInput.value);
         }
     });
     
+    packBtn.addEventListener('click', () => packFiles(false));
+    packBundleBtn.addEventListener('click', () => packFiles(true));
+    
     // Toggle drives browser visibility
     function toggleDrivesBrowser() {
         if (drivesBrowser.style.display === 'none') {
@@ -382,11 +420,21 @@ document.addEventListener('DOMContentLoaded', function() {
         const options = {
             excludeTests: excludeTests.checked,
             excludeDocs: excludeDocs.checked,
-            excludeDependencies: excludeDependencies.checked
+            excludeDependencies: excludeDependencies.checked,
+            respectIgnoreFiles: respectIgnoreFiles.checked,
+            liveIndex: liveIndex.checked
         };
         
-        // Call API to analyze repository
-        fetch('/analyze', {
+        jobProgressBar.style.width = '0%';
+        jobProgressText.textContent = '';
+        cancelBtn.disabled = false;
+        analyzedPath = path;
+        analyzedOptions = options;
+        packSummary.textContent = '';
+        packTable.innerHTML = '';
+        
+        // Start a background analysis job, then poll it until it finishes
+        fetch('/jobs', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -397,55 +445,358 @@ document.addEventListener('DOMContentLoaded', function() {
             }),
         })
         .then(response => response.json())
-        .then(data => {
-            loadingContainer.style.display = 'none';
-            
-            if (data.error) {
-                errorMessage.textContent = data.error;
-                errorContainer.style.display = 'block';
+        .then(job => {
+            if (job.error) {
+                showAnalysisError(job.error);
                 return;
             }
-            
-            displayResults(data);
-            resultsContainer.style.display = 'block';
+            currentJobId = job.id;
+            watchJob(job.id);
         })
         .catch(error => {
-            loadingContainer.style.display = 'none';
-            errorMessage.textContent = `Error: ${error.message}`;
-            errorContainer.style.display = 'block';
+            showAnalysisError(`Error: ${error.message}`);
         });
     }
     
-    // Display analysis results
-    function displayResults(data) {
-        // Update total tokens
-        totalTokensElement.textContent = data.total_tokens_formatted;
+    // Follow a job's event stream, filling in the tables as files are counted
+    function watchJob(jobId) {
+        if (!window.EventSource) {
+            pollJob(jobId);
+            return;
+        }
+        partialResults = null;
+        const events = new EventSource(`/jobs/${jobId}/events`);
         
-        // Update extensions table
-        extensionsTable.innerHTML = '';
-        data.extensions.forEach(ext => {
+        events.addEventListener('partial', event => {
+            if (jobId !== currentJobId) {
+                events.close(); // A newer analysis was started
+                return;
+            }
+            const data = JSON.parse(event.data);
+            // Every (re)connection starts with everything counted so far
+            if (data.reset || !partialResults) {
+                partialResults = { total: 0, extensions: {}, technologies: {} };
+            }
+            partialResults.total += data.total_tokens;
+            mergeStats(partialResults.extensions, data.extensions);
+            mergeStats(partialResults.technologies, data.technologies);
+            displayProgress(data.progress);
+            if (partialResults.total > 0) {
+                displayPartialResults();
+            }
+        });
+        
+        events.addEventListener('summary', event => {
+            events.close();
+            if (jobId === currentJobId) {
+                finishJob(JSON.parse(event.data));
+            }
+        });
+        
+        events.onerror = () => {
+            // The stream could not be opened (e.g. the job expired, or too many
+            // streams are open); poll instead. A stream that just ended reconnects.
+            if (events.readyState === EventSource.CLOSED && jobId === currentJobId) {
+                pollJob(jobId);
+            }
+        };
+    }
+    
+    function pollJob(jobId) {
+        fetch(`/jobs/${jobId}`)
+        .then(response => response.json())
+        .then(job => {
+            if (jobId !== currentJobId) {
+                return; // A newer analysis was started
+            }
+            if (job.status === 'queued' || job.status === 'running') {
+                displayProgress(job.progress);
+                setTimeout(() => pollJob(jobId), JOB_POLL_INTERVAL);
+                return;
+            }
+            finishJob(job);
+        })
+        .catch(error => {
+            currentJobId = null;
+            showAnalysisError(`Error: ${error.message}`);
+        });
+    }
+    
+    function finishJob(job) {
+        currentJobId = null;
+        partialResults = null;
+        loadingContainer.style.display = 'none';
+        if (job.status === 'done') {
+            displayResults(job.result);
+            resultsContainer.style.display = 'block';
+        } else if (job.status === 'cancelled') {
+            resultsContainer.style.display = 'none';
+            welcomeContainer.style.display = 'block';
+        } else {
+            resultsContainer.style.display = 'none';
+            showAnalysisError(job.error || 'Analysis failed');
+        }
+    }
+    
+    // Add {key: {tokens, files}} deltas to accumulated stats
+    function mergeStats(stats, delta) {
+        Object.entries(delta).forEach(([key, value]) => {
+            const current = stats[key] || { tokens: 0, files: 0 };
+            stats[key] = { tokens: current.tokens + value.tokens, files: current.files + value.files };
+        });
+    }
+    
+    // Same format as format_number() on the server
+    function formatNumber(num) {
+        if (num >= 1000000000) {
+            return `${(num / 1000000000).toFixed(1)}B`;
+        } else if (num >= 1000000) {
+            return `${(num / 1000000).toFixed(1)}M`;
+        }
+        return num.toLocaleString('en-US');
+    }
+    
+    function partialRows(stats) {
+        return Object.entries(stats)
+            .sort((a, b) => b[1].tokens - a[1].tokens)
+            .map(([name, value]) => ({
+                name: name,
+                tokens_formatted: `${formatNumber(value.tokens)} (${value.tokens.toLocaleString('en-US')})`,
+                files_text: `${value.files} file${value.files !== 1 ? 's' : ''}`
+            }));
+    }
+    
+    // Show the tables for the files counted so far; model usage waits for the final totals
+    function displayPartialResults() {
+        totalTokensElement.textContent = `${formatNumber(partialResults.total)} (${partialResults.total.toLocaleString('en-US')})`;
+        renderStatsTable(extensionsTable, partialRows(partialResults.extensions));
+        renderStatsTable(technologiesTable, partialRows(partialResults.technologies));
+        modelsContainer.style.display = 'none';
+        fileStatsSection.style.display = 'none';
+        directoriesSection.style.display = 'none';
+        packSection.style.display = 'none';
+        resultsContainer.style.display = 'block';
+    }
+    
+    function renderStatsTable(table, rows) {
+        table.innerHTML = '';
+        rows.forEach(item => {
             const row = document.createElement('tr');
             row.innerHTML = `
-                <td>${ext.extension}</td>
-                <td>${ext.tokens_formatted}</td>
-                <td>${ext.files_text}</td>
+                <td>${item.name}</td>
+                <td>${item.tokens_formatted}</td>
+                <td>${item.files_text}</td>
             `;
-            extensionsTable.appendChild(row);
+            table.appendChild(row);
+        });
+    }
+    
+    // Show the largest files and how many files have how many tokens
+    function displayFileStats(largestFiles, histogram) {
+        largestFilesTable.innerHTML = '';
+        largestFiles.forEach(file => {
+            const row = document.createElement('tr');
+            const pathCell = document.createElement('td');
+            pathCell.textContent = file.path;
+            pathCell.className = 'text-break';
+            const tokensCell = document.createElement('td');
+            tokensCell.textContent = file.tokens_formatted;
+            row.append(pathCell, tokensCell);
+            largestFilesTable.appendChild(row);
         });
         
-        // Update technologies table
-        technologiesTable.innerHTML = '';
-        data.technologies.forEach(tech => {
+        histogramTable.innerHTML = '';
+        const mostFiles = Math.max(0, ...histogram.map(bucket => bucket.files));
+        histogram.forEach(bucket => {
+            let label = `${bucket.min.toLocaleString('en-US')}+`;
+            if (bucket.max === bucket.min) {
+                label = bucket.min.toLocaleString('en-US');
+            } else if (bucket.max !== null) {
+                label = `${bucket.min.toLocaleString('en-US')}-${bucket.max.toLocaleString('en-US')}`;
+            }
+            const width = mostFiles > 0 ? Math.round(100 * bucket.files / mostFiles) : 0;
             const row = document.createElement('tr');
             row.innerHTML = `
-                <td>${tech.technology}</td>
-                <td>${tech.tokens_formatted}</td>
-                <td>${tech.files_text}</td>
+                <td>${label}</td>
+                <td>${bucket.files.toLocaleString('en-US')}</td>
+                <td><div class="progress"><div class="progress-bar" role="progressbar" style="width: ${width}%;"></div></div></td>
             `;
-            technologiesTable.appendChild(row);
+            histogramTable.appendChild(row);
         });
+        fileStatsSection.style.display = largestFiles.length > 0 ? '' : 'none';
+    }
+    
+    // Show the top-level directories of an analysis; the others are fetched as they are expanded
+    function displayDirectoryTree(treeId) {
+        directoriesTable.innerHTML = '';
+        directoriesSection.style.display = 'none';
+        if (!treeId) {
+            return;
+        }
+        fetch(`/tree/${treeId}`)
+            .then(response => response.json())
+            .then(node => {
+                if (!node.error && node.children.length > 0) {
+                    insertDirectoryRows(treeId, node.children, null, 0);
+                    directoriesSection.style.display = '';
+                }
+            });
+    }
+    
+    // Insert a row per directory after afterRow (at the end if null), indented by depth
+    function insertDirectoryRows(treeId, directories, afterRow, depth) {
+        let previous = afterRow;
+        directories.forEach(directory => {
+            const row = document.createElement('tr');
+            row.dataset.depth = depth;
+            const nameCell = document.createElement('td');
+            nameCell.style.paddingLeft = `${0.5 + depth * 1.25}rem`;
+            const icon = document.createElement('i');
+            icon.className = directory.directories > 0 ? 'bi bi-caret-right-fill me-1' : 'bi bi-folder me-1';
+            nameCell.appendChild(icon);
+            nameCell.appendChild(document.createTextNode(directory.name));
+            const tokensCell = document.createElement('td');
+            tokensCell.textContent = `${formatNumber(directory.tokens)} (${directory.tokens.toLocaleString('en-US')})`;
+            const filesCell = document.createElement('td');
+            filesCell.textContent = `${directory.files} file${directory.files !== 1 ? 's' : ''}`;
+            row.append(nameCell, tokensCell, filesCell);
+            if (directory.directories > 0) {
+                row.style.cursor = 'pointer';
+                row.addEventListener('click', () => toggleDirectory(treeId, directory.path, row, icon));
+            }
+            if (previous) {
+                previous.after(row);
+            } else {
+                directoriesTable.appendChild(row);
+            }
+            previous = row;
+        });
+    }
+    
+    function toggleDirectory(treeId, path, row, icon) {
+        const depth = Number(row.dataset.depth);
+        if (row.dataset.expanded) {
+            // Remove the rows of every expanded level below this directory
+            while (row.nextElementSibling && Number(row.nextElementSibling.dataset.depth) > depth) {
+                row.nextElementSibling.remove();
+            }
+            delete row.dataset.expanded;
+            icon.className = 'bi bi-caret-right-fill me-1';
+            return;
+        }
+        row.dataset.expanded = 'true';
+        icon.className = 'bi bi-caret-down-fill me-1';
+        fetch(`/tree/${treeId}?path=${encodeURIComponent(path)}`)
+            .then(response => response.json())
+            .then(node => {
+                if (!node.error && row.dataset.expanded) {
+                    insertDirectoryRows(treeId, node.children, row, depth + 1);
+                }
+            });
+    }
+    
+    // Select the analyzed files that fit the chosen model, and list them or download them as one file
+    function packFiles(bundle) {
+        if (!analyzedPath) {
+            return;
+        }
+        const request = {
+            directory: analyzedPath,
+            options: analyzedOptions,
+            model: packModel.value,
+            priorities: packPriorities.value.split(',').map(priority => priority.trim()).filter(Boolean),
+            order: packOrder.value,
+            reserve: Number(packReserve.value) || 0,
+            bundle: bundle
+        };
+        packBtn.disabled = true;
+        packBundleBtn.disabled = true;
+        packSummary.textContent = 'Selecting files...';
+        fetch('/pack', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(request)
+        })
+        .then(response => {
+            if (!response.ok) {
+                return response.json().then(data => { throw new Error(data.error); });
+            }
+            if (!bundle) {
+                return response.json().then(displayPack);
+            }
+            return response.blob().then(blob => {
+                const link = document.createElement('a');
+                link.href = URL.createObjectURL(blob);
+                link.download = 'bundle.txt';
+                link.click();
+                URL.revokeObjectURL(link.href);
+                packSummary.textContent = `Downloaded ${formatNumber(blob.size)} bytes`;
+            });
+        })
+        .catch(error => {
+            packSummary.textContent = `Error: ${error.message}`;
+        })
+        .finally(() => {
+            packBtn.disabled = false;
+            packBundleBtn.disabled = false;
+        });
+    }
+    
+    function displayPack(data) {
+        packSummary.textContent = `${data.files.length.toLocaleString('en-US')} of ${data.total_files.toLocaleString('en-US')} files, ` +
+            `${data.tokens_formatted} of ${data.budget.toLocaleString('en-US')} tokens (${data.tokenizer})`;
+        packTable.innerHTML = '';
+        data.files.forEach(file => {
+            const row = document.createElement('tr');
+            const pathCell = document.createElement('td');
+            pathCell.textContent = file.path;
+            pathCell.className = 'text-break';
+            const tokensCell = document.createElement('td');
+            tokensCell.textContent = file.tokens_formatted;
+            row.append(pathCell, tokensCell);
+            packTable.appendChild(row);
+        });
+    }
+    
+    function displayProgress(progress) {
+        if (progress.stage === 'pending') {
+            jobProgressText.textContent = 'Waiting for other analyses to finish...';
+            return;
+        }
+        if (progress.stage === 'tokenizing' && progress.files_to_process > 0) {
+            const percent = Math.round(100 * progress.files_tokenized / progress.files_to_process);
+            jobProgressBar.style.width = `${percent}%`;
+            const megabytes = (progress.bytes_processed / (1024 * 1024)).toFixed(1);
+            jobProgressText.textContent = `Tokenized ${progress.files_tokenized.toLocaleString()} of ${progress.files_to_process.toLocaleString()} files (${megabytes} MB)`;
+        } else {
+            // Files are tokenized while the walk is still discovering more
+            jobProgressText.textContent = `Discovered ${progress.files_discovered.toLocaleString()} files, tokenized ${progress.files_tokenized.toLocaleString()}...`;
+        }
+    }
+    
+    function showAnalysisError(message) {
+        loadingContainer.style.display = 'none';
+        errorMessage.textContent = message;
+        errorContainer.style.display = 'block';
+    }
+    
+    // Display analysis results
+    function displayResults(data) {
+        // Update total tokens
+        totalTokensElement.textContent = data.total_tokens_formatted;
+        
+        // Update extensions table
+        renderStatsTable(extensionsTable, data.extensions.map(ext => ({ ...ext, name: ext.extension })));
+        
+        // Update technologies table
+        renderStatsTable(technologiesTable, data.technologies.map(tech => ({ ...tech, name: tech.technology })));
+        
+        displayFileStats(data.largest_files, data.token_histogram);
+        displayDirectoryTree(data.tree_id);
+        packSection.style.display = '';
         
         // Update model percentages
+        modelsContainer.style.display = '';
         document.querySelectorAll('.model-progress').forEach(progress => {
             const modelName = progress.dataset.model;
             const modelData = data.models[modelName];
@@ -456,6 +807,12 @@ document.addEventListener('DOMContentLoaded', function() {
                 progressBar.textContent = `${modelData.percentage}%`;
                 progressBar.classList.add(`bg-${modelData.color}`);
                 progressBar.setAttribute('aria-valuenow', modelData.percentage);
+
+                // Show which tokenizer the percentage was computed with
+                const tokenizerLabel = progress.parentElement.querySelector('.model-tokenizer');
+                tokenizerLabel.textContent = modelData.approximate
+                    ? `Approximated with ${modelData.tokenizer}`
+                    : `Counted with ${modelData.tokenizer}`;
             }
         });
     }
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark the count-only tokenizer path against the original encode-based count.
+
+Usage: python benchmarks/bench_count_tokens.py [path] [batch_size]
+
+Reads every recognized text file under path (default: current directory) into
+memory, then times:
+  - baseline:   len(AutoTokenizer.encode(content)) per file (the original count_tokens)
+  - per-file:   count_tokens(content), which only reads the Encoding length
+  - batched:    count_tokens_batch() over batches of batch_size files
+and checks that all three produce identical counts.
+"""
+
+import os
+import sys
+import time
+
+from transformers import AutoTokenizer
+
+from codebase_token_counter.token_counter import (
+    FILE_EXTENSIONS, TOKENIZER_NAME, count_tokens, count_tokens_batch, get_backend, is_binary
+)
+
+def load_contents(root):
+    contents = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in {'.git', 'node_modules', 'venv', '.venv'}]
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.splitext(name)[1].lower() in FILE_EXTENSIONS and not is_binary(path):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    contents.append(f.read())
+    return contents
+
+def timed(label, func):
+    start = time.perf_counter()
+    counts = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.3f}s  {sum(counts):>14,} tokens")
+    return counts, elapsed
+
+def main():
+    root = sys.argv[1] if len(sys.argv) > 1 else '.'
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    contents = load_contents(root)
+    print(f"{len(contents):,} files, {sum(map(len, contents)):,} characters from {root}\n")
+
+    hf_tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+    get_backend(TOKENIZER_NAME)  # Load outside the timed sections
+
+    baseline, baseline_time = timed("baseline", lambda: [len(hf_tokenizer.encode(c)) for c in contents])
+    per_file, per_file_time = timed("per-file", lambda: [count_tokens(c) for c in contents])
+    batched, batched_time = timed("batched", lambda: [
+        n for i in range(0, len(contents), batch_size) for n in count_tokens_batch(contents[i:i + batch_size])
+    ])
+
+    assert baseline == per_file == batched, "token counts differ"
+    print(f"\nper-file speedup: {baseline_time / per_file_time:.2f}x, batched speedup: {baseline_time / batched_time:.2f}x")
+
+if __name__ == "__main__":
+    main()
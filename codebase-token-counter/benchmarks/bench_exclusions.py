@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark the compiled ExclusionMatcher against the per-path fnmatch loops it replaced.
+
+Usage: python benchmarks/bench_exclusions.py [num_paths]
+
+Generates a synthetic, node_modules-heavy tree of num_paths file paths
+(default 1,000,000) plus their directories, without touching the disk. Both
+implementations then decide every directory and file with all exclusion
+presets enabled (tests, docs, dependencies), as the GUI does with every
+option checked:
+  - loop:     os.path.relpath + Path.as_posix + fnmatch over every pattern
+              (the previous Stage 1 / Stage 2 code)
+  - compiled: ExclusionMatcher.excludes_dir / excludes_file
+Every path is decided, pruned or not, so this measures matching cost only.
+The script checks that both give identical answers.
+"""
+
+import fnmatch
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+from codebase_token_counter.exclusions import DEFAULT_EXCLUDE_DIRS, EXCLUDE_PRESETS, ExclusionMatcher
+
+REPO = '/repo'
+
+TOP_DIRS = ['src', 'lib', 'node_modules', 'packages', 'tests', 'docs', 'build', 'app', 'vendor', 'tools']
+SUB_DIRS = ['components', 'utils', 'node_modules', 'dist', '__tests__', 'core', 'api', 'models', 'bower_components', 'pkg.egg-info']
+FILE_NAMES = ['index.js', 'README.md', 'main.py', 'test_main.py', 'app.test.js', 'types.d.ts', 'style.css',
+              'package.json', 'widget.spec.ts', 'LICENSE', 'setup.cfg', 'guide.rst', 'server.go', 'lib.rs']
+
+def synthetic_tree(num_paths, seed=0):
+    """Return (directories, files) as absolute paths under REPO."""
+    rng = random.Random(seed)
+    # Weight node_modules heavily, as in typical JavaScript projects
+    top_weights = [6, 3, 40, 15, 5, 3, 4, 10, 8, 6]
+    directories = set()
+    files = []
+    for i in range(num_paths):
+        parts = [rng.choices(TOP_DIRS, top_weights)[0]]
+        for _ in range(rng.randint(0, 5)):
+            parts.append(rng.choice(SUB_DIRS) if rng.random() < 0.5 else f"mod{rng.randint(0, 2000)}")
+        for depth in range(1, len(parts) + 1):
+            directories.add('/'.join(parts[:depth]))
+        files.append(f"{REPO}/{'/'.join(parts)}/{i}_{rng.choice(FILE_NAMES)}")
+    return [f"{REPO}/{d}" for d in sorted(directories)], files
+
+def legacy_rules(exclude_dirs, exclude_patterns):
+    combined_exclude_dirs = DEFAULT_EXCLUDE_DIRS | exclude_dirs
+    path_patterns = [p.replace(os.sep, '/') for p in exclude_patterns if '/' in p]
+    name_patterns = [p for p in exclude_patterns if '/' not in p]
+    path_patterns.extend([f"{d.strip('/')}/" for d in combined_exclude_dirs])
+    return combined_exclude_dirs, path_patterns, name_patterns
+
+def legacy_excludes_dir(dir_path, combined_exclude_dirs, path_patterns):
+    if os.path.basename(dir_path) in combined_exclude_dirs:
+        return True
+    normalized_relative_dir_path = Path(os.path.relpath(dir_path, REPO)).as_posix()
+    return any(fnmatch.fnmatch(normalized_relative_dir_path, pattern.strip('/')) or
+               fnmatch.fnmatch(normalized_relative_dir_path + '/', pattern)
+               for pattern in path_patterns)
+
+def legacy_excludes_file(file_path, path_patterns, name_patterns):
+    file_name = os.path.basename(file_path)
+    if any(fnmatch.fnmatch(file_name, pattern) for pattern in name_patterns):
+        return True
+    normalized_relative_path = Path(os.path.relpath(file_path, REPO)).as_posix()
+    return any(fnmatch.fnmatch(normalized_relative_path, pattern) for pattern in path_patterns)
+
+def timed(label, func, count):
+    start = time.perf_counter()
+    decisions = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.3f}s  {count / elapsed:>12,.0f} paths/s  {sum(decisions):>10,} excluded")
+    return decisions, elapsed
+
+def main():
+    num_paths = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    exclude_dirs = set()
+    exclude_patterns = []
+    for preset_dirs, preset_patterns in EXCLUDE_PRESETS.values():
+        exclude_dirs |= preset_dirs
+        exclude_patterns += preset_patterns
+
+    directories, files = synthetic_tree(num_paths)
+    count = len(directories) + len(files)
+    print(f"{len(directories):,} directories, {len(files):,} files, {len(exclude_patterns)} patterns\n")
+
+    def run_legacy():
+        combined_exclude_dirs, path_patterns, name_patterns = legacy_rules(exclude_dirs, exclude_patterns)
+        return ([legacy_excludes_dir(d, combined_exclude_dirs, path_patterns) for d in directories] +
+                [legacy_excludes_file(f, path_patterns, name_patterns) for f in files])
+
+    def run_compiled():
+        matcher = ExclusionMatcher(exclude_dirs, exclude_patterns)
+        start = len(REPO) + 1
+        return ([matcher.excludes_dir(os.path.basename(d), d[start:]) for d in directories] +
+                [matcher.excludes_file(os.path.basename(f), f[start:]) for f in files])
+
+    legacy, legacy_time = timed("loop", run_legacy, count)
+    compiled, compiled_time = timed("compiled", run_compiled, count)
+
+    assert legacy == compiled, "exclusion decisions differ"
+    print(f"\nspeedup: {legacy_time / compiled_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
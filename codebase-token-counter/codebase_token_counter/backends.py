@@ -0,0 +1,213 @@
+"""Registry of tokenizer backends that load from local files."""
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from .cache import DEFAULT_CACHE_DIR
+
+# Hugging Face tokenizer used when no other tokenizer is requested
+DEFAULT_TOKENIZER = "gpt2"
+
+# Path to a pre-serialized tokenizer.json for the default tokenizer (see
+# export_tokenizer). When set, it is loaded without importing transformers.
+TOKENIZER_FILE_ENV = 'TOKEN_COUNTER_TOKENIZER_FILE'
+
+# Directory searched for tokenizer files by name: <name>.json (Hugging Face
+# tokenizers), <name>.tiktoken (tiktoken BPE ranks) or <name>.model (SentencePiece)
+TOKENIZER_DIR = os.environ.get('TOKEN_COUNTER_TOKENIZER_DIR', os.path.join(DEFAULT_CACHE_DIR, 'tokenizers'))
+
+# Pre-tokenization patterns of the OpenAI encodings, so their .tiktoken rank
+# files can be loaded from disk instead of downloaded by tiktoken
+_R50K_PATTERN = r"""'(?:[sdmt]|ll|ve|re)| ?\p{L}++| ?\p{N}++| ?[^\s\p{L}\p{N}]++|\s++$|\s+(?!\S)|\s"""
+_CL100K_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+_O200K_PATTERN = "|".join([
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]*[\p{Ll}\p{Lm}\p{Lo}\p{M}]+(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""[^\r\n\p{L}\p{N}]?[\p{Lu}\p{Lt}\p{Lm}\p{Lo}\p{M}]+[\p{Ll}\p{Lm}\p{Lo}\p{M}]*(?i:'s|'t|'re|'ve|'m|'ll|'d)?""",
+    r"""\p{N}{1,3}""",
+    r""" ?[^\s\p{L}\p{N}]+[\r\n/]*""",
+    r"""\s*[\r\n]+""",
+    r"""\s+(?!\S)""",
+    r"""\s+""",
+])
+TIKTOKEN_PATTERNS = {
+    'r50k_base': _R50K_PATTERN,
+    'p50k_base': _R50K_PATTERN,
+    'cl100k_base': _CL100K_PATTERN,
+    'o200k_base': _O200K_PATTERN,
+}
+
+class TokenizerBackend:
+    """A loaded tokenizer that only counts tokens."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def count(self, text: str) -> int:
+        """Count the tokens in text, without special tokens."""
+        raise NotImplementedError
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """Count the tokens in each of several texts."""
+        return [self.count(text) for text in texts]
+
+class HuggingFaceBackend(TokenizerBackend):
+    """Backend for a Hugging Face `tokenizers.Tokenizer`."""
+
+    def __init__(self, name: str, tokenizer):
+        super().__init__(name)
+        self.tokenizer = tokenizer
+
+    def count(self, text: str) -> int:
+        # len() of the Rust-side Encoding never builds a Python list of token IDs
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        # encode_batch_fast (tokenizers >= 0.20) additionally skips offset tracking
+        encode_batch = getattr(self.tokenizer, 'encode_batch_fast', self.tokenizer.encode_batch)
+        return [len(encoding) for encoding in encode_batch(texts, add_special_tokens=False)]
+
+class TiktokenBackend(TokenizerBackend):
+    """Backend for a `tiktoken.Encoding`."""
+
+    def __init__(self, name: str, encoding):
+        super().__init__(name)
+        self.encoding = encoding
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode_ordinary(text))
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+
+class SentencePieceBackend(TokenizerBackend):
+    """Backend for a `sentencepiece.SentencePieceProcessor`."""
+
+    def __init__(self, name: str, processor):
+        super().__init__(name)
+        self.processor = processor
+
+    def count(self, text: str) -> int:
+        return len(self.processor.encode(text))
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [len(ids) for ids in self.processor.encode(texts)] if texts else []
+
+def load_tokenizer_json(name: str, path: str) -> HuggingFaceBackend:
+    """Load a serialized Hugging Face tokenizer.json."""
+    from tokenizers import Tokenizer
+    return HuggingFaceBackend(name, Tokenizer.from_file(path))
+
+def load_tiktoken_file(name: str, path: str) -> TiktokenBackend:
+    """Load tiktoken BPE ranks from a local .tiktoken file."""
+    import tiktoken
+    from tiktoken.load import load_tiktoken_bpe
+    encoding = tiktoken.Encoding(
+        name=name,
+        pat_str=TIKTOKEN_PATTERNS.get(name, _CL100K_PATTERN),
+        mergeable_ranks=load_tiktoken_bpe(path),
+        special_tokens={}
+    )
+    return TiktokenBackend(name, encoding)
+
+def load_sentencepiece_file(name: str, path: str) -> SentencePieceBackend:
+    """Load a local SentencePiece .model file."""
+    import sentencepiece
+    return SentencePieceBackend(name, sentencepiece.SentencePieceProcessor(model_file=path))
+
+# Loaders by file extension for tokenizers found in TOKENIZER_DIR
+FILE_LOADERS = {
+    '.json': load_tokenizer_json,
+    '.tiktoken': load_tiktoken_file,
+    '.model': load_sentencepiece_file,
+}
+
+def find_tokenizer_file(name: str) -> Optional[str]:
+    """Return the path of the tokenizer file for name in TOKENIZER_DIR, if one exists."""
+    for extension in FILE_LOADERS:
+        path = os.path.join(TOKENIZER_DIR, name + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def _load_default_tokenizer() -> HuggingFaceBackend:
+    """
+    Load GPT-2 from TOKEN_COUNTER_TOKENIZER_FILE, TOKENIZER_DIR, or the Hugging Face cache.
+
+    Nothing is downloaded; raises LookupError, pointing to --save-tokenizer,
+    when none of them has the tokenizer.
+    """
+    path = os.environ.get(TOKENIZER_FILE_ENV) or find_tokenizer_file(DEFAULT_TOKENIZER)
+    if path:
+        return load_tokenizer_json(DEFAULT_TOKENIZER, path)
+    from transformers import AutoTokenizer
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(DEFAULT_TOKENIZER, local_files_only=True)
+    except OSError as e:
+        raise LookupError(
+            f"The {DEFAULT_TOKENIZER} tokenizer is not available locally. Save it once with network access, "
+            f"using 'token-counter --save-tokenizer {os.path.join(TOKENIZER_DIR, DEFAULT_TOKENIZER + '.json')}', "
+            f"or point {TOKENIZER_FILE_ENV} at a saved tokenizer.json"
+        ) from e
+    return HuggingFaceBackend(DEFAULT_TOKENIZER, tokenizer.backend_tokenizer)
+
+# Loaders for tokenizers that are not simply a file in TOKENIZER_DIR
+_loaders: Dict[str, Callable[[], TokenizerBackend]] = {DEFAULT_TOKENIZER: _load_default_tokenizer}
+_backends: Dict[str, TokenizerBackend] = {}
+_lock = threading.Lock()
+
+def register_tokenizer(name: str, loader: Callable[[], TokenizerBackend]):
+    """
+    Register a loader for a tokenizer name, replacing any earlier one.
+
+    Registrations are per process: tokenizer worker processes (workers > 1)
+    only see built-in loaders and files in TOKENIZER_DIR.
+    """
+    with _lock:
+        _loaders[name] = loader
+        _backends.pop(name, None)
+
+def get_backend(name: str = DEFAULT_TOKENIZER) -> TokenizerBackend:
+    """
+    Return the backend for a tokenizer name, loading it on first use.
+
+    Registered loaders take precedence; otherwise <name>.json, <name>.tiktoken
+    or <name>.model is loaded from TOKENIZER_DIR. Raises LookupError when no
+    loader or file exists for the name.
+    """
+    backend = _backends.get(name)
+    if backend is not None:
+        return backend
+    with _lock:
+        backend = _backends.get(name)
+        if backend is None:
+            loader = _loaders.get(name)
+            if loader is not None:
+                backend = loader()
+            else:
+                path = find_tokenizer_file(name)
+                if path is None:
+                    raise LookupError(f"No tokenizer named {name!r} is registered or found in {TOKENIZER_DIR}")
+                backend = FILE_LOADERS[os.path.splitext(path)[1]](name, path)
+            _backends[name] = backend
+    return backend
+
+def is_available(name: str) -> bool:
+    """Return True if a tokenizer can be loaded for name, without loading it."""
+    return name in _backends or name in _loaders or find_tokenizer_file(name) is not None
+
+def available_tokenizers() -> List[str]:
+    """List registered tokenizer names and the tokenizer files found in TOKENIZER_DIR."""
+    names = set(_loaders)
+    if os.path.isdir(TOKENIZER_DIR):
+        for file_name in os.listdir(TOKENIZER_DIR):
+            stem, extension = os.path.splitext(file_name)
+            if extension in FILE_LOADERS:
+                names.add(stem)
+    return sorted(names)
+
+def resolve_model_tokenizer(name: Optional[str], default: str = DEFAULT_TOKENIZER) -> str:
+    """Return name if that tokenizer is available locally, otherwise default."""
+    return name if name and is_available(name) else default
@@ -0,0 +1,210 @@
+"""Token counts of many repositories from a manifest: `token-counter batch`."""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from .cache import TokenCache
+from .git_scan import clone_for_scan, update_mirror
+from .token_counter import (
+    DEFAULT_BATCH_SIZE, TOKENIZER_NAME, ScanOptions, add_exclusion_arguments, create_tokenizer_pool,
+    exclusions_from_args, ignore_files_from_args, process_repository, resolve_workers, scan_options
+)
+
+# Remote repositories cloned at the same time by default
+DEFAULT_CLONE_JOBS = 4
+
+class BatchTarget(NamedTuple):
+    """A manifest entry: a local path or remote URL, and optionally the ref to count."""
+    target: str
+    ref: Optional[str] = None
+
+def read_manifest(lines: Iterator[str]) -> List[BatchTarget]:
+    """
+    Parse manifest lines of "<path or URL> [ref]", where ref is a branch, tag or full commit ID.
+
+    Blank lines and lines starting with '#' are ignored.
+    """
+    targets = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            parts = line.split()
+            targets.append(BatchTarget(parts[0], parts[1] if len(parts) > 1 else None))
+    return targets
+
+def _prepare(target: BatchTarget, mirror_dir: Optional[str] = None) -> Dict[str, object]:
+    """
+    Make a target ready for scanning, cloning it if it is remote.
+
+    Remote repositories are cloned bare at depth 1 and scanned from their git
+    objects, so nothing is checked out; with a mirror_dir, their mirror is
+    updated and scanned in place instead. Local directories are scanned as
+    they are, or at ref if one is given.
+    """
+    if os.path.isdir(target.target):
+        return {'path': target.target, 'git_ref': target.ref, 'temp_dir': None}
+    if mirror_dir is not None:
+        return {'path': update_mirror(target.target, mirror_dir or None), 'git_ref': target.ref or 'HEAD', 'temp_dir': None}
+    temp_dir = tempfile.mkdtemp(prefix='token-counter-')
+    try:
+        clone_for_scan(target.target, temp_dir, target.ref)
+    except BaseException:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+    return {'path': temp_dir, 'git_ref': 'HEAD', 'temp_dir': temp_dir}
+
+def iter_batch_results(
+    targets: List[BatchTarget],
+    clone_jobs: int = DEFAULT_CLONE_JOBS,
+    options: Optional[ScanOptions] = None,
+    cache: Optional[TokenCache] = None,
+    executor: Optional[Executor] = None,
+    mirror_dir: Optional[str] = None,
+    **settings
+) -> Iterator[Dict[str, object]]:
+    """
+    Count every target, yielding one result dict per target as it finishes.
+
+    Up to clone_jobs remote targets are cloned concurrently, and targets are
+    scanned one at a time in the order their clones complete, all tokenizing
+    in the same executor. Each clone is deleted as soon as it has been
+    scanned, so at most clone_jobs + 1 clones exist at any time. A failed
+    target yields a result with its error instead of stopping the batch.
+    mirror_dir ('' for the default) keeps mirrors of remote targets instead
+    of cloning them (see update_mirror). The options' ignore_files only
+    apply to local directories, as remote targets are scanned from their git
+    objects. The other arguments, and settings overriding options, are as
+    for process_repository.
+    """
+    options = scan_options(options, **settings)
+    pending = iter(targets)
+    in_flight = {}
+
+    def start_next(cloner):
+        target = next(pending, None)
+        if target is not None:
+            in_flight[cloner.submit(_prepare, target, mirror_dir)] = (target, time.monotonic())
+
+    with ThreadPoolExecutor(max_workers=max(1, clone_jobs), thread_name_prefix='clone') as cloner:
+        try:
+            for _ in range(max(1, clone_jobs)):
+                start_next(cloner)
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    target, started = in_flight.pop(future)
+                    start_next(cloner)
+                    result = {'target': target.target, 'ref': target.ref}
+                    try:
+                        prepared = future.result()
+                    except Exception as e:
+                        result['error'] = f"Clone failed: {e}"
+                        yield result
+                        continue
+                    try:
+                        total_tokens, extension_stats, file_counts = process_repository(
+                            prepared['path'],
+                            total_only=True,
+                            options=options,
+                            cache=cache,
+                            executor=executor,
+                            git_ref=prepared['git_ref']
+                        )
+                        result.update(
+                            total_tokens=total_tokens,
+                            extensions=extension_stats,
+                            files=file_counts,
+                            seconds=round(time.monotonic() - started, 3)
+                        )
+                    except Exception as e:
+                        result['error'] = str(e)
+                    finally:
+                        if prepared['temp_dir']:
+                            shutil.rmtree(prepared['temp_dir'], ignore_errors=True)
+                    yield result
+        finally:
+            # Stopped early: let running clones finish, then remove them
+            for future in in_flight:
+                future.cancel()
+            for future in in_flight:
+                if not future.cancelled():
+                    try:
+                        prepared = future.result()
+                    except Exception:
+                        continue
+                    if prepared['temp_dir']:
+                        shutil.rmtree(prepared['temp_dir'], ignore_errors=True)
+
+def batch_main(argv: List[str]):
+    """Entry point of `token-counter batch`."""
+    parser = argparse.ArgumentParser(
+        prog='token-counter batch',
+        description='Count tokens in every repository of a manifest, writing one JSON line per repository.'
+    )
+    parser.add_argument('manifest', help="File with one '<path or URL> [ref]' per line ('-' for stdin)")
+    parser.add_argument('--output', help='Write to this file instead of stdout')
+    parser.add_argument('--clone-jobs', type=int, default=DEFAULT_CLONE_JOBS,
+                        help=f'Repositories cloned at the same time (default: {DEFAULT_CLONE_JOBS})')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Tokenizer processes shared by all repositories (default: 0, one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Files per tokenizer batch')
+    parser.add_argument('--cache', nargs='?', const='', default=None,
+                        help='Cache counts in this directory (default cache without a value)')
+    parser.add_argument('--tokenizer', default=TOKENIZER_NAME, help='Tokenizer to count with')
+    parser.add_argument('--mirror-cache', nargs='?', const='', default=None,
+                        help='Keep mirrors of remote repositories in this directory (default without a value) '
+                             'and only fetch their changes on later runs')
+    add_exclusion_arguments(parser)
+    args = parser.parse_args(argv)
+    exclude_dirs, exclude_patterns = exclusions_from_args(args)
+
+    from rich.console import Console
+    # stdout carries the results
+    console = Console(stderr=True)
+    if args.manifest == '-':
+        targets = read_manifest(sys.stdin)
+    else:
+        with open(args.manifest, encoding='utf-8') as manifest:
+            targets = read_manifest(manifest)
+    console.print(f"[green]Counting tokens in {len(targets):,} repositories[/green]")
+
+    workers = resolve_workers(args.workers)
+    executor = create_tokenizer_pool(workers) if workers > 1 else None
+    cache = TokenCache(args.cache or None) if args.cache is not None else None
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    failed = 0
+    try:
+        options = ScanOptions(
+            exclude_dirs=exclude_dirs,
+            exclude_patterns=exclude_patterns,
+            ignore_files=ignore_files_from_args(args),
+            tokenizer=args.tokenizer,
+            workers=workers,
+            batch_size=args.batch_size
+        )
+        results = iter_batch_results(
+            targets, args.clone_jobs, options, cache=cache, executor=executor, mirror_dir=args.mirror_cache
+        )
+        for result in results:
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+            if 'error' in result:
+                failed += 1
+                console.print(f"[red]{result['target']}: {result['error']}[/red]")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if cache is not None:
+            cache.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    console.print(f"[green]{len(targets) - failed:,} repositories counted, {failed:,} failed[/green]")
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,389 @@
+"""Persistent on-disk cache of per-file token counts."""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Default location of the cache database; override with TOKEN_COUNTER_CACHE_DIR
+DEFAULT_CACHE_DIR = os.environ.get(
+    'TOKEN_COUNTER_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'codebase-token-counter')
+)
+CACHE_FILE_NAME = 'tokens.sqlite3'
+
+# Maximum number of cached files kept after eviction, and the size their
+# entries may take up in the database; override with TOKEN_COUNTER_CACHE_MAX_MB
+DEFAULT_MAX_ENTRIES = 500_000
+DEFAULT_MAX_BYTES = int(os.environ.get('TOKEN_COUNTER_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_tokens (
+    tokenizer TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (tokenizer, path)
+);
+CREATE INDEX IF NOT EXISTS file_tokens_digest ON file_tokens (tokenizer, digest);
+CREATE INDEX IF NOT EXISTS file_tokens_last_used ON file_tokens (last_used);
+
+-- Token counts of git blobs; tokens is NULL for binary blobs
+CREATE TABLE IF NOT EXISTS blob_tokens (
+    tokenizer TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    tokens INTEGER,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (tokenizer, sha)
+);
+CREATE INDEX IF NOT EXISTS blob_tokens_last_used ON blob_tokens (last_used);
+
+-- Per-extension results of scanning a commit with a given set of scan options
+CREATE TABLE IF NOT EXISTS commit_scans (
+    commit_sha TEXT NOT NULL,
+    scan_key TEXT NOT NULL,
+    tokenizer TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (commit_sha, scan_key, tokenizer)
+);
+CREATE TABLE IF NOT EXISTS commit_tokens (
+    commit_sha TEXT NOT NULL,
+    scan_key TEXT NOT NULL,
+    tokenizer TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    files INTEGER NOT NULL,
+    PRIMARY KEY (commit_sha, scan_key, tokenizer, extension)
+);
+
+-- Sums over files tokenized to calibrate bytes-per-token estimates (see estimate.py)
+CREATE TABLE IF NOT EXISTS extension_ratios (
+    tokenizer TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    bytes INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    bytes_sq REAL NOT NULL,
+    tokens_sq REAL NOT NULL,
+    bytes_tokens REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (tokenizer, extension)
+);
+"""
+
+# Blob SHAs per SELECT ... IN (...) query, below SQLite's variable limit
+_QUERY_CHUNK = 500
+
+# Per-extension results of a commit: ({tokenizer: {extension: tokens}}, {extension: files})
+CommitCounts = Tuple[Dict[str, Dict[str, int]], Dict[str, int]]
+
+# Calibration sums of an extension: (files, bytes, tokens, sum of bytes², of tokens², of bytes × tokens)
+RatioSums = Tuple[int, int, int, float, float, float]
+
+class TokenCache:
+    """
+    SQLite-backed cache of per-file token counts.
+
+    Entries are keyed by tokenizer name and absolute file path, and are valid
+    while the file's size and mtime are unchanged. A file counted with several
+    tokenizers is a hit only when all of them are cached. When the stat key
+    misses, callers can fall back to the content digest via lookup_digest(), so
+    files that were touched or copied without changing are not re-tokenized.
+
+    Scans of git objects use two more tables: counts by blob SHA, shared by
+    every commit and repository, and the per-extension results of scanned
+    commits, from which later commits are updated by their diff. Estimates
+    keep per-extension sums of sampled files' sizes and token counts, which
+    calibrate their bytes-per-token ratios.
+
+    Writes are committed by commit(), which scans call after storing each
+    batch, so the database's write lock is only held briefly and other caches
+    on the same database (another scan, a live index) can write in between.
+    The cache counts stat hits, content hits and misses for reporting, and
+    on close() evicts the least recently used entries beyond max_entries per
+    table, then more until the database's pages in use fit max_bytes.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        tokenizer_name: str = 'gpt2',
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES
+    ):
+        cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self.tokenizer_name = tokenizer_name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.content_hits = 0
+        self.misses = 0
+        self._touched: List[Tuple[float, str, str]] = []
+        self._touched_blobs: List[Tuple[float, str, str]] = []
+
+        self._conn = sqlite3.connect(self.path, timeout=30)
+        # WAL lets worker processes read digests while this connection writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, path: str, size: int, mtime_ns: int) -> Optional[int]:
+        """Return the cached token count for an unchanged file, or None."""
+        counts = self.get_counts(path, size, mtime_ns, (self.tokenizer_name,))
+        return counts[self.tokenizer_name] if counts is not None else None
+
+    def get_counts(self, path: str, size: int, mtime_ns: int, tokenizers: Sequence[str]) -> Optional[Dict[str, int]]:
+        """Return {tokenizer: tokens} for an unchanged file if every tokenizer is cached, or None."""
+        path = os.path.abspath(path)
+        placeholders = ', '.join('?' * len(tokenizers))
+        rows = self._conn.execute(
+            f"SELECT tokenizer, tokens FROM file_tokens WHERE path = ? AND size = ? AND mtime_ns = ? "
+            f"AND tokenizer IN ({placeholders})",
+            (path, size, mtime_ns, *tokenizers)
+        ).fetchall()
+        if len(rows) < len(tokenizers):
+            return None
+        self.hits += 1
+        now = time.time()
+        self._touched.extend((now, name, path) for name in tokenizers)
+        return dict(rows)
+
+    def put(self, path: str, size: int, mtime_ns: int, digest: str, tokens: int, content_hit: bool = False):
+        """Store the token count of a file; content_hit marks counts reused via its digest."""
+        self.put_counts(path, size, mtime_ns, digest, {self.tokenizer_name: tokens}, content_hit)
+
+    def put_counts(self, path: str, size: int, mtime_ns: int, digest: str, counts: Dict[str, int], content_hit: bool = False):
+        """Store a file's {tokenizer: tokens} counts; content_hit marks counts reused via its digest."""
+        if content_hit:
+            self.content_hits += 1
+        else:
+            self.misses += 1
+        path = os.path.abspath(path)
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO file_tokens VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(name, path, size, mtime_ns, digest, tokens, now) for name, tokens in counts.items()]
+        )
+
+    def get_blob_counts(self, shas: Sequence[str], tokenizers: Sequence[str]) -> Dict[str, Optional[Dict[str, int]]]:
+        """
+        Return {sha: {tokenizer: tokens}} for the blobs cached for every tokenizer.
+
+        Binary blobs map to None. Blobs missing from the result are not cached.
+        """
+        found: Dict[str, Dict[str, Optional[int]]] = {}
+        placeholders = ', '.join('?' * len(tokenizers))
+        for start in range(0, len(shas), _QUERY_CHUNK):
+            chunk = shas[start:start + _QUERY_CHUNK]
+            rows = self._conn.execute(
+                f"SELECT sha, tokenizer, tokens FROM blob_tokens WHERE sha IN ({', '.join('?' * len(chunk))}) "
+                f"AND tokenizer IN ({placeholders})",
+                (*chunk, *tokenizers)
+            )
+            for sha, name, tokens in rows:
+                found.setdefault(sha, {})[name] = tokens
+        now = time.time()
+        counts: Dict[str, Optional[Dict[str, int]]] = {}
+        for sha, blob_counts in found.items():
+            if len(blob_counts) < len(tokenizers):
+                continue
+            counts[sha] = None if None in blob_counts.values() else blob_counts
+            self._touched_blobs.extend((now, name, sha) for name in tokenizers)
+        self.content_hits += len(counts)
+        return counts
+
+    def put_blob_counts(self, sha: str, tokenizers: Sequence[str], counts: Optional[Dict[str, int]]):
+        """Store a blob's {tokenizer: tokens} counts; counts None marks a binary blob."""
+        self.misses += 1
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO blob_tokens VALUES (?, ?, ?, ?)",
+            [(name, sha, counts[name] if counts is not None else None, now) for name in tokenizers]
+        )
+
+    def get_commit_counts(self, commit: str, scan_key: str, tokenizers: Sequence[str]) -> Optional[CommitCounts]:
+        """Return the stored results of a commit scanned with scan_key, if stored for every tokenizer."""
+        placeholders = ', '.join('?' * len(tokenizers))
+        params = (commit, scan_key, *tokenizers)
+        (scanned,) = self._conn.execute(
+            f"SELECT COUNT(*) FROM commit_scans WHERE commit_sha = ? AND scan_key = ? AND tokenizer IN ({placeholders})",
+            params
+        ).fetchone()
+        if scanned < len(tokenizers):
+            return None
+        self._conn.execute(
+            f"UPDATE commit_scans SET last_used = ? WHERE commit_sha = ? AND scan_key = ? AND tokenizer IN ({placeholders})",
+            (time.time(), *params)
+        )
+        self._conn.commit()
+        tokens: Dict[str, Dict[str, int]] = {name: {} for name in tokenizers}
+        files: Dict[str, int] = {}
+        for name, extension, extension_tokens, extension_files in self._conn.execute(
+            f"SELECT tokenizer, extension, tokens, files FROM commit_tokens "
+            f"WHERE commit_sha = ? AND scan_key = ? AND tokenizer IN ({placeholders})",
+            params
+        ):
+            tokens[name][extension] = extension_tokens
+            files[extension] = extension_files
+        return tokens, files
+
+    def put_commit_counts(self, commit: str, scan_key: str, counts: CommitCounts):
+        """Store the per-extension results of a commit scanned with scan_key."""
+        tokens, files = counts
+        now = time.time()
+        for name, extension_tokens in tokens.items():
+            self._conn.execute(
+                "DELETE FROM commit_tokens WHERE commit_sha = ? AND scan_key = ? AND tokenizer = ?",
+                (commit, scan_key, name)
+            )
+            self._conn.executemany(
+                "INSERT INTO commit_tokens VALUES (?, ?, ?, ?, ?, ?)",
+                [(commit, scan_key, name, extension, extension_tokens.get(extension, 0), count)
+                 for extension, count in files.items()]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO commit_scans VALUES (?, ?, ?, ?)",
+                (commit, scan_key, name, now)
+            )
+        self._conn.commit()
+
+    def get_ratio_sums(self, tokenizer: Optional[str] = None) -> Dict[str, RatioSums]:
+        """Return {extension: sums} of the files tokenized to calibrate estimates with tokenizer."""
+        rows = self._conn.execute(
+            "SELECT extension, files, bytes, tokens, bytes_sq, tokens_sq, bytes_tokens "
+            "FROM extension_ratios WHERE tokenizer = ?",
+            (tokenizer or self.tokenizer_name,)
+        )
+        return {extension: tuple(sums) for extension, *sums in rows}
+
+    def add_ratio_sums(self, sums: Dict[str, RatioSums], tokenizer: Optional[str] = None):
+        """Add {extension: sums} of newly tokenized files to the stored calibration of tokenizer."""
+        tokenizer = tokenizer or self.tokenizer_name
+        stored = self.get_ratio_sums(tokenizer)
+        now = time.time()
+        rows = []
+        for extension, added in sums.items():
+            previous = stored.get(extension, (0, 0, 0, 0.0, 0.0, 0.0))
+            rows.append((tokenizer, extension, *(old + new for old, new in zip(previous, added)), now))
+        self._conn.executemany("INSERT OR REPLACE INTO extension_ratios VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for the current scan."""
+        return {'hits': self.hits, 'content_hits': self.content_hits, 'misses': self.misses}
+
+    def commit(self):
+        """Commit the counts stored so far, releasing the write lock until the next put."""
+        self._conn.commit()
+
+    def flush(self):
+        """Commit pending writes and refresh the recency of entries that were hit."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE file_tokens SET last_used = ? WHERE tokenizer = ? AND path = ?",
+                self._touched
+            )
+            self._touched = []
+        if self._touched_blobs:
+            self._conn.executemany(
+                "UPDATE blob_tokens SET last_used = ? WHERE tokenizer = ? AND sha = ?",
+                self._touched_blobs
+            )
+            self._touched_blobs = []
+        self._conn.commit()
+
+    def used_bytes(self) -> int:
+        """Return the size of the database pages in use; freed pages are reused rather than returned."""
+        (page_size,) = self._conn.execute("PRAGMA page_size").fetchone()
+        (pages,) = self._conn.execute("PRAGMA page_count").fetchone()
+        (free_pages,) = self._conn.execute("PRAGMA freelist_count").fetchone()
+        return (pages - free_pages) * page_size
+
+    def _evict_oldest(self, table: str, rows: int):
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY last_used ASC LIMIT ?)",
+            (rows,)
+        )
+
+    def evict(self):
+        """Delete the least recently used entries beyond max_entries per table, and beyond max_bytes."""
+        tables = ('file_tokens', 'blob_tokens', 'commit_scans')
+        for table in tables:
+            (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                self._evict_oldest(table, excess)
+
+        if self.max_bytes is not None:
+            used = self.used_bytes()
+            while used > self.max_bytes:
+                # Drop the same share of every table's oldest entries as the excess
+                # share of the size, plus one so each round makes progress
+                share = (used - self.max_bytes) / used
+                counts = {table: self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+                if not any(counts.values()):
+                    break
+                for table, count in counts.items():
+                    if count:
+                        self._evict_oldest(table, int(count * share) + 1)
+                self._delete_orphaned_commit_tokens()
+                used = self.used_bytes()
+
+        self._delete_orphaned_commit_tokens()
+        self._conn.commit()
+
+    def _delete_orphaned_commit_tokens(self):
+        # Results of commits whose scans were evicted
+        self._conn.execute(
+            "DELETE FROM commit_tokens WHERE NOT EXISTS (SELECT 1 FROM commit_scans s WHERE "
+            "s.commit_sha = commit_tokens.commit_sha AND s.scan_key = commit_tokens.scan_key "
+            "AND s.tokenizer = commit_tokens.tokenizer)"
+        )
+
+    def close(self):
+        """Flush, evict and close the database."""
+        self.flush()
+        self.evict()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Read-only connections opened by lookup_digest, one per database per thread, since
+# a connection may only be used by the thread that opened it
+_reader_connections = threading.local()
+
+def lookup_digest(db_path: str, tokenizer_name: str, digest: str) -> Optional[int]:
+    """
+    Return the token count of any cached file with the given content digest.
+
+    Uses a per-thread read-only connection so it can run inside tokenizer
+    worker processes and scan threads while the owning TokenCache keeps writing.
+    """
+    counts = lookup_digest_counts(db_path, (tokenizer_name,), digest)
+    return counts[tokenizer_name] if counts is not None else None
+
+def lookup_digest_counts(db_path: str, tokenizers: Sequence[str], digest: str) -> Optional[Dict[str, int]]:
+    """lookup_digest for several tokenizers; returns None unless all of them are cached."""
+    connections = getattr(_reader_connections, 'by_path', None)
+    if connections is None:
+        connections = _reader_connections.by_path = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+        connections[db_path] = conn
+    placeholders = ', '.join('?' * len(tokenizers))
+    counts = dict(conn.execute(
+        f"SELECT tokenizer, tokens FROM file_tokens WHERE digest = ? AND tokenizer IN ({placeholders})",
+        (digest, *tokenizers)
+    ).fetchall())
+    return counts if len(counts) == len(tokenizers) else None
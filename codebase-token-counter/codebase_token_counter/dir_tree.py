@@ -0,0 +1,112 @@
+"""Per-directory token totals of a scan, stored compactly for drilling down."""
+
+from array import array
+from typing import Dict, List, Optional
+
+class DirectoryTree:
+    """
+    Token and file totals of every directory of a scan, each including everything below it.
+
+    Directories are numbered in the order they are first seen, 0 being the
+    scanned root, and kept in parallel arrays (names, parents, totals) rather
+    than nested dicts, so a scan of millions of files costs a few dozen bytes
+    per directory and nothing per file. add() records files in their
+    directory as the scan produces them; finish() then rolls the totals up to
+    every ancestor and indexes each directory's children, largest first.
+    Paths are '/'-separated and relative to the root, which is ''.
+    """
+
+    def __init__(self):
+        self.names: List[str] = ['']
+        self.parents = array('q', [-1])
+        self.tokens = array('q', [0])
+        self.files = array('q', [0])
+        # Node of each directory path, while the tree is being built
+        self._nodes: Optional[Dict[str, int]] = {'': 0}
+        self._child_offsets = None
+        self._children = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def finished(self) -> bool:
+        return self._nodes is None
+
+    def _node(self, directory: str) -> int:
+        node = self._nodes.get(directory)
+        if node is None:
+            parent_path, _, name = directory.rpartition('/')
+            # Parents are numbered before their children, which finish() relies on
+            parent = self._node(parent_path)
+            node = len(self.names)
+            self.names.append(name)
+            self.parents.append(parent)
+            self.tokens.append(0)
+            self.files.append(0)
+            self._nodes[directory] = node
+        return node
+
+    def add(self, directory: str, tokens: int, files: int = 1):
+        """Add files and their tokens to the directory at the relative path directory."""
+        if self._nodes is None:
+            raise ValueError("Cannot add to a finished DirectoryTree")
+        node = self._node(directory)
+        self.tokens[node] += tokens
+        self.files[node] += files
+
+    def finish(self):
+        """Roll the totals up to every ancestor and index the children; the tree is read-only afterwards."""
+        if self._nodes is None:
+            return
+        self._nodes = None
+        for node in range(len(self.names) - 1, 0, -1):
+            parent = self.parents[node]
+            self.tokens[parent] += self.tokens[node]
+            self.files[parent] += self.files[node]
+
+        # Children of each node, contiguous in _children from _child_offsets[node]
+        children = sorted(range(1, len(self.names)), key=lambda node: (self.parents[node], -self.tokens[node], self.names[node]))
+        offsets = array('q', [0]) * (len(self.names) + 1)
+        for node in children:
+            offsets[self.parents[node] + 1] += 1
+        for node in range(len(self.names)):
+            offsets[node + 1] += offsets[node]
+        self._children = array('q', children)
+        self._child_offsets = offsets
+
+    def children(self, node: int) -> List[int]:
+        """Return the subdirectories of node, most tokens first."""
+        if self._nodes is not None:
+            raise ValueError("DirectoryTree.finish() must be called first")
+        return list(self._children[self._child_offsets[node]:self._child_offsets[node + 1]])
+
+    def find(self, directory: str) -> Optional[int]:
+        """Return the node of the directory at a relative path, or None if the scan had no files below it."""
+        node = 0
+        for name in directory.strip('/').split('/') if directory.strip('/') else ():
+            node = next((child for child in self.children(node) if self.names[child] == name), None)
+            if node is None:
+                return None
+        return node
+
+    def path(self, node: int) -> str:
+        """Return the relative path of node."""
+        names = []
+        while node > 0:
+            names.append(self.names[node])
+            node = self.parents[node]
+        return '/'.join(reversed(names))
+
+    def describe(self, node: int, children: bool = True) -> Dict[str, object]:
+        """Return node's path and totals, and with children those of its subdirectories."""
+        data = {
+            'path': self.path(node),
+            'name': self.names[node],
+            'tokens': self.tokens[node],
+            'files': self.files[node],
+            'directories': self._child_offsets[node + 1] - self._child_offsets[node],
+        }
+        if children:
+            data['children'] = [self.describe(child, False) for child in self.children(node)]
+        return data
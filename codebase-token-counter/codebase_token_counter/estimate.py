@@ -0,0 +1,213 @@
+"""Token estimates from file sizes and per-extension bytes-per-token ratios."""
+
+import math
+import random
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cache import TokenCache
+from .token_counter import ScanOptions, ScanProgress, iter_candidate_files, iter_file_token_counts, scan_options
+
+# How estimates are made: 'stat' only reads file sizes and applies calibrated
+# ratios, 'sample' also tokenizes a random sample of each extension's files
+ESTIMATE_MODES = ('stat', 'sample')
+# Files tokenized per extension in 'sample' mode
+DEFAULT_SAMPLE_FILES = 32
+# Ratio of extensions without calibration, and the relative error assumed for
+# estimates from fewer than two files, where no spread can be measured
+DEFAULT_BYTES_PER_TOKEN = 4.0
+UNCERTAIN_RELATIVE_ERROR = 0.5
+# z-score of the reported intervals (95%), widened for small samples (see _critical_value)
+CONFIDENCE_Z = 1.96
+
+class RatioStats(NamedTuple):
+    """
+    Sums over tokenized files of one extension, from which its tokens per byte are estimated.
+
+    Sums rather than a ratio are kept so samples from several runs merge
+    exactly and the spread of the ratio can be measured; the fields match
+    the cache's RatioSums.
+    """
+    files: int = 0
+    bytes: int = 0
+    tokens: int = 0
+    bytes_sq: float = 0.0
+    tokens_sq: float = 0.0
+    bytes_tokens: float = 0.0
+
+    def add(self, size: int, tokens: int) -> 'RatioStats':
+        return RatioStats(
+            self.files + 1, self.bytes + size, self.tokens + tokens,
+            self.bytes_sq + size * size, self.tokens_sq + tokens * tokens, self.bytes_tokens + size * tokens
+        )
+
+    def merge(self, other: Sequence[float]) -> 'RatioStats':
+        return RatioStats(*(mine + theirs for mine, theirs in zip(self, other)))
+
+    @property
+    def tokens_per_byte(self) -> Optional[float]:
+        return self.tokens / self.bytes if self.bytes else None
+
+    def standard_error(self) -> Optional[float]:
+        """
+        Return the standard error of tokens_per_byte as an estimate for the extension's files.
+
+        This is the usual ratio-estimator error, from the residuals of tokens
+        around ratio × bytes; None with fewer than two files.
+        """
+        if self.files < 2 or not self.bytes:
+            return None
+        ratio = self.tokens / self.bytes
+        residuals = max(0.0, self.tokens_sq - 2 * ratio * self.bytes_tokens + ratio * ratio * self.bytes_sq)
+        mean_bytes = self.bytes / self.files
+        return math.sqrt(residuals / (self.files - 1) / self.files) / mean_bytes
+
+class ExtensionEstimate(NamedTuple):
+    """Estimated tokens of one extension's files."""
+    extension: str
+    files: int
+    bytes: int
+    tokens: int
+    # Half-width of the 95% interval around tokens
+    error: int
+    bytes_per_token: Optional[float]
+    # Files of the extension tokenized in this run
+    sampled: int
+    # 'exact' if every file was tokenized, 'sample' if some were, 'calibrated'
+    # for stored ratios and 'default' for DEFAULT_BYTES_PER_TOKEN
+    source: str
+
+def _critical_value(files: int) -> float:
+    """Approximate Student's t quantile for an interval from a ratio measured on files files."""
+    # First Cornish-Fisher term of t with files - 1 degrees of freedom, close enough from 2 files on
+    return CONFIDENCE_Z + (CONFIDENCE_Z ** 3 + CONFIDENCE_Z) / (4 * (files - 1))
+
+def _extrapolate(extension: str, files: int, size: int, stats: Optional[RatioStats], source: str, sampled: int) -> ExtensionEstimate:
+    if stats is None or stats.tokens_per_byte is None:
+        ratio = 1 / DEFAULT_BYTES_PER_TOKEN if stats is None else 0.0
+        standard_error = None
+    else:
+        ratio = stats.tokens_per_byte
+        standard_error = stats.standard_error()
+    tokens = size * ratio
+    if standard_error is None:
+        error = tokens * UNCERTAIN_RELATIVE_ERROR
+    else:
+        # Only the files that were not sampled are uncertain
+        correction = math.sqrt(max(0.0, 1 - sampled / files)) if source == 'sample' else 1.0
+        error = _critical_value(stats.files) * size * standard_error * correction
+    return ExtensionEstimate(
+        extension, files, size, round(tokens), round(error), 1 / ratio if ratio else None, sampled, source
+    )
+
+def estimate_repository(
+    repo_path: str,
+    options: Optional[ScanOptions] = None,
+    sample_files: int = 0,
+    calibration: Optional[Dict[str, Sequence[float]]] = None,
+    cache: Optional[TokenCache] = None,
+    progress: Optional[ScanProgress] = None,
+    seed: Optional[int] = None,
+    **settings
+) -> Tuple[List[ExtensionEstimate], Dict[str, RatioStats]]:
+    """
+    Estimate the tokens of a directory from its file sizes.
+
+    The walk only stats files, summing their sizes per extension. With
+    sample_files, it also keeps a uniform random sample of that many files
+    per extension (reservoir sampling, so memory does not grow with the
+    tree), which are then tokenized and extrapolated to the extension's
+    bytes; an extension with no more files than that is counted exactly.
+    Extensions without a sample use calibration, {extension: RatioStats} as
+    stored by TokenCache.add_ratio_sums, and DEFAULT_BYTES_PER_TOKEN if it
+    has none. Calibrated intervals assume the directory resembles the files
+    they were calibrated on.
+
+    Args:
+        sample_files: Files to tokenize per extension; 0 only stats files
+        calibration: Stored sums per extension, used for extensions not sampled
+        seed: Seed of the sample, for reproducible estimates
+        Other arguments, and settings overriding options, are as for process_repository.
+
+    Returns:
+        Tuple of (estimates by most tokens, {extension: RatioStats} of the files sampled)
+    """
+    options = scan_options(options, **settings)
+    if sample_files < 0:
+        raise ValueError("sample_files must not be negative")
+    if progress is None:
+        progress = ScanProgress()
+    calibration = calibration or {}
+    rng = random.Random(seed)
+
+    # --- Phase 1: stat every file, keeping a sample per extension ---
+    progress.stage = 'discovering'
+    files: Dict[str, int] = {}
+    sizes: Dict[str, int] = {}
+    samples: Dict[str, List[Tuple[str, int]]] = {}
+    for file_path, extension, file_stat, error in iter_candidate_files(
+        repo_path, options.exclude_dirs, options.exclude_patterns, options.skip_above, progress,
+        options.walk_threads, options.ignore_files
+    ):
+        progress.check_cancelled()
+        if error is not None:
+            continue
+        size = file_stat.st_size if file_stat is not None else 0
+        seen = files.get(extension, 0) + 1
+        files[extension] = seen
+        sizes[extension] = sizes.get(extension, 0) + size
+        if sample_files:
+            sample = samples.setdefault(extension, [])
+            if len(sample) < sample_files:
+                sample.append((file_path, size))
+            else:
+                replaced = rng.randrange(seen)
+                if replaced < sample_files:
+                    sample[replaced] = (file_path, size)
+
+    # --- Phase 2: tokenize the samples ---
+    sampled: Dict[str, RatioStats] = {}
+    if samples:
+        sampled_paths = [file_path for sample in samples.values() for file_path, _ in sample]
+        counted = {}
+        failed = set()
+        # Only the primary tokenizer is calibrated
+        for record in iter_file_token_counts(
+            repo_path, options._replace(extra_tokenizers=()), cache=cache, progress=progress, paths=sampled_paths
+        ):
+            if record.error is not None:
+                failed.add(record.path)
+            else:
+                counted[record.path] = record.tokens
+        for extension, sample in samples.items():
+            stats = RatioStats()
+            for file_path, size in sample:
+                # Binary files are not yielded, and have no tokens
+                if file_path not in failed:
+                    stats = stats.add(size, counted.get(file_path, 0))
+            if stats.files:
+                sampled[extension] = stats
+
+    estimates = []
+    for extension, extension_files in files.items():
+        size = sizes[extension]
+        stats = sampled.get(extension)
+        if stats is not None and stats.files >= extension_files:
+            estimates.append(ExtensionEstimate(
+                extension, extension_files, size, stats.tokens, 0,
+                size / stats.tokens if stats.tokens else None, stats.files, 'exact'
+            ))
+        elif stats is not None:
+            estimates.append(_extrapolate(extension, extension_files, size, stats, 'sample', stats.files))
+        elif extension in calibration:
+            estimates.append(_extrapolate(extension, extension_files, size, RatioStats(*calibration[extension]), 'calibrated', 0))
+        else:
+            estimates.append(_extrapolate(extension, extension_files, size, None, 'default', 0))
+    estimates.sort(key=lambda estimate: (-estimate.tokens, estimate.extension))
+    progress.stage = 'done'
+    return estimates, sampled
+
+def total_estimate(estimates: Sequence[ExtensionEstimate]) -> Tuple[int, int]:
+    """Return the total tokens of estimates and the half-width of its 95% interval, taking their errors as independent."""
+    tokens = sum(estimate.tokens for estimate in estimates)
+    error = math.sqrt(sum(estimate.error ** 2 for estimate in estimates))
+    return tokens, round(error)
@@ -0,0 +1,140 @@
+"""Directory and file exclusion rules, compiled once per scan."""
+
+import fnmatch
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Directories that are never scanned
+DEFAULT_EXCLUDE_DIRS = {'.git', 'venv', '.venv', '__pycache__', '.pytest_cache', '.mypy_cache'}
+
+# Named groups of (directory names, patterns) offered as exclusion options
+EXCLUDE_PRESETS: Dict[str, Tuple[Set[str], List[str]]] = {
+    # Common test directories and test file patterns
+    'tests': (
+        {'tests', '__tests__', 'test', 'spec', 'specs'},
+        ['*_test.py', 'test_*.py', '*.spec.js', '*.test.js', '*.spec.ts', '*.test.ts'],
+    ),
+    # Common documentation directories and file extensions
+    'docs': (
+        {'docs', 'documentation', 'doc'},
+        ['*.md', '*.rst', '*.wiki', '*.adoc'],
+    ),
+    # Dependency and build artifact directories. Path patterns (with '/') avoid
+    # excluding unrelated files/dirs; bower_components is excluded by name.
+    'dependencies': (
+        {'bower_components'},
+        [
+            'node_modules/',
+            'vendor/',
+            'packages/',
+            'dist/',
+            'build/',
+            'target/',
+            'out/',
+            'bin/',
+            'obj/',
+            '.next/',
+            '.nuxt/',
+            '.svelte-kit/',
+            '.cache/',
+            '*.egg-info/',
+        ],
+    ),
+}
+
+def preset_exclusions(presets: Iterable[str]) -> Tuple[Set[str], List[str]]:
+    """Return the combined (directory names, patterns) of the named EXCLUDE_PRESETS."""
+    exclude_dirs = set()
+    exclude_patterns = []
+    for preset in presets:
+        preset_dirs, preset_patterns = EXCLUDE_PRESETS[preset]
+        exclude_dirs.update(preset_dirs)
+        exclude_patterns.extend(p for p in preset_patterns if p not in exclude_patterns)
+    return exclude_dirs, exclude_patterns
+
+_WILDCARDS = ('*', '?', '[')
+
+def _is_literal(pattern: str) -> bool:
+    return not any(c in pattern for c in _WILDCARDS)
+
+class PatternSet:
+    """
+    fnmatch patterns compiled for matching whole strings.
+
+    Literal patterns become a set lookup, '*suffix' patterns a single
+    str.endswith() call, and all remaining patterns one combined regex.
+    matches() answers like fnmatch.fnmatch() with any of the patterns; it
+    backs ExclusionMatcher and the priorities of `token-counter pack`.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        literals = set()
+        suffixes = []
+        wildcard_patterns = []
+        for pattern in patterns:
+            pattern = os.path.normcase(pattern)
+            if _is_literal(pattern):
+                literals.add(pattern)
+            elif pattern.startswith('*') and _is_literal(pattern[1:]):
+                suffixes.append(pattern[1:])
+            else:
+                wildcard_patterns.append(pattern)
+        self.literals = frozenset(literals)
+        self.suffixes = tuple(suffixes)
+        # fnmatch.translate() anchors each pattern, so alternatives never match partially
+        self.regex = re.compile('|'.join(fnmatch.translate(p) for p in wildcard_patterns)) if wildcard_patterns else None
+
+    def matches(self, value: str) -> bool:
+        return (
+            value in self.literals
+            or (bool(self.suffixes) and value.endswith(self.suffixes))
+            or (self.regex is not None and self.regex.match(value) is not None)
+        )
+
+class ExclusionMatcher:
+    """
+    Compiled form of process_repository's exclude_dirs and exclude_patterns.
+
+    Gives the same answers as matching every pattern with fnmatch:
+    - a directory is excluded if its name is in exclude_dirs (or
+      DEFAULT_EXCLUDE_DIRS), or its relative path matches a path pattern,
+      with or without the pattern's trailing '/'
+    - a file is excluded if its name matches a pattern without '/', or its
+      relative path matches a pattern with '/'
+    Relative paths use '/' as separator.
+    """
+
+    def __init__(self, exclude_dirs: Optional[Set[str]] = None, exclude_patterns: Optional[List[str]] = None):
+        # Combine default and provided exclude directories
+        self.exclude_dirs = DEFAULT_EXCLUDE_DIRS | set(exclude_dirs or ())
+        exclude_patterns = exclude_patterns or []
+
+        # Separate patterns for path matching (containing '/') and filename matching
+        path_patterns = [p.replace(os.sep, '/') for p in exclude_patterns if '/' in p]
+        name_patterns = [p for p in exclude_patterns if '/' not in p]
+        # Excluded directories also apply as path patterns (e.g., '.git/')
+        path_patterns.extend(f"{d.strip('/')}/" for d in self.exclude_dirs)
+
+        self._names = PatternSet(name_patterns)
+        self._paths = PatternSet(path_patterns)
+        self._dir_paths = PatternSet(p.strip('/') for p in path_patterns)
+        # fnmatch normalizes case (and separators) on Windows; a no-op elsewhere
+        self._normcase = os.path.normcase if os.path.normcase('A') != 'A' else None
+
+    def excludes_dir(self, name: str, relative_path: Optional[str]) -> bool:
+        """Return True if the directory should be pruned; relative_path None skips path patterns."""
+        if name in self.exclude_dirs:
+            return True
+        if relative_path is None:
+            return False
+        if self._normcase is not None:
+            relative_path = self._normcase(relative_path)
+        return self._dir_paths.matches(relative_path) or self._paths.matches(relative_path + '/')
+
+    def excludes_file(self, name: str, relative_path: str) -> bool:
+        """Return True if the file should be skipped."""
+        if self._normcase is not None:
+            name = self._normcase(name)
+            relative_path = self._normcase(relative_path)
+        return self._names.matches(name) or self._paths.matches(relative_path)
@@ -0,0 +1,92 @@
+"""Largest files and the distribution of tokens per file, kept while a scan streams by."""
+
+import heapq
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# Files listed by default, and buckets of a TokenHistogram (the last starts at 2**30 tokens)
+DEFAULT_TOP_FILES = 10
+HISTOGRAM_BUCKETS = 32
+
+class TopFiles:
+    """
+    The n files with the most tokens.
+
+    Files are kept in a min-heap of at most n entries, so adding one is
+    O(log n) and memory does not grow with the number of files. Ties are
+    broken by path, so the result does not depend on the order files are
+    counted in.
+    """
+
+    def __init__(self, n: int = DEFAULT_TOP_FILES):
+        self.n = n
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, path: str, tokens: int):
+        item = (tokens, path)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, item)
+        elif self._heap and item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+
+    def largest(self) -> List[Tuple[str, int]]:
+        """Return (path, tokens) of the files kept, most tokens first."""
+        return [(path, tokens) for tokens, path in sorted(self._heap, reverse=True)]
+
+class TokenHistogram:
+    """
+    Number of files and their tokens per token count, in fixed power-of-two buckets.
+
+    Bucket 0 holds files without tokens and bucket k files with 2**(k-1) to
+    2**k - 1 tokens; the last bucket also holds everything larger. Adding or
+    removing a file is O(1) and memory is fixed however many files there are.
+    """
+
+    def __init__(self, buckets: int = HISTOGRAM_BUCKETS):
+        self.files = array('q', [0]) * buckets
+        self.tokens = array('q', [0]) * buckets
+
+    def bucket(self, tokens: int) -> int:
+        return min(tokens.bit_length(), len(self.files) - 1)
+
+    def bounds(self, bucket: int) -> Tuple[int, Optional[int]]:
+        """Return the lowest and highest token count of a bucket; the highest of the last is None."""
+        low = 0 if bucket == 0 else 1 << (bucket - 1)
+        high = None if bucket == len(self.files) - 1 else (1 << bucket) - 1
+        return low, high
+
+    def add(self, tokens: int, files: int = 1):
+        bucket = self.bucket(tokens)
+        self.files[bucket] += files
+        self.tokens[bucket] += tokens * files
+
+    def remove(self, tokens: int):
+        self.add(tokens, -1)
+
+    def copy(self) -> 'TokenHistogram':
+        histogram = TokenHistogram(len(self.files))
+        histogram.files = array('q', self.files)
+        histogram.tokens = array('q', self.tokens)
+        return histogram
+
+    def quantile(self, q: float) -> int:
+        """Return an upper bound on the token count below which a fraction q of the files fall."""
+        total = sum(self.files)
+        seen = 0
+        for bucket, files in enumerate(self.files):
+            seen += files
+            if total and seen >= q * total:
+                low, high = self.bounds(bucket)
+                return high if high is not None else low
+        return 0
+
+    def describe(self) -> List[Dict[str, object]]:
+        """Return min, max, files and tokens of every bucket from the first to the last one with files."""
+        used = [bucket for bucket, files in enumerate(self.files) if files]
+        if not used:
+            return []
+        rows = []
+        for bucket in range(used[0], used[-1] + 1):
+            low, high = self.bounds(bucket)
+            rows.append({'min': low, 'max': high, 'files': self.files[bucket], 'tokens': self.tokens[bucket]})
+        return rows
@@ -0,0 +1,275 @@
+"""Reading files straight from a git object database, without a worktree."""
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .cache import DEFAULT_CACHE_DIR
+
+# Default location of mirrors kept by update_mirror
+DEFAULT_MIRROR_DIR = os.path.join(DEFAULT_CACHE_DIR, 'mirrors')
+
+# Full commit IDs (SHA-1 or SHA-256), which are fetched directly rather than cloned as a branch
+_COMMIT_ID = re.compile(r'[0-9a-f]{40}|[0-9a-f]{64}')
+
+# Tree entry modes of regular files; symlinks (120000) and submodules (160000) are skipped
+_FILE_MODES = (b'100644', b'100755')
+
+class TreeEntry(NamedTuple):
+    """A regular file in a git tree."""
+    # '/'-separated path relative to the repository root
+    path: str
+    # Blob SHA; identical contents share it
+    sha: str
+    # Blob size in bytes
+    size: int
+
+class TreeChange(NamedTuple):
+    """A file that differs between two git trees."""
+    # '/'-separated path relative to the repository root
+    path: str
+    # Blob SHAs before and after; None where the path is not a regular file
+    old_sha: Optional[str]
+    new_sha: Optional[str]
+
+def _git(repo_path: str, *args: str) -> List[str]:
+    return ['git', '-C', repo_path, *args]
+
+def resolve_commit(repo_path: str, ref: str = 'HEAD') -> str:
+    """Return the commit SHA that ref names in the repository, raising ValueError if there is none."""
+    result = subprocess.run(
+        _git(repo_path, 'rev-parse', '--verify', '--quiet', f'{ref}^{{commit}}'),
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    if result.returncode != 0:
+        raise ValueError(f"Not a commit in {repo_path}: {ref}")
+    return result.stdout.decode().strip()
+
+def iter_tree(repo_path: str, ref: str = 'HEAD') -> Iterator[TreeEntry]:
+    """
+    Yield every regular file in the tree of ref, as listed by git ls-tree.
+
+    Only tracked files are listed, so ignored and untracked files are never
+    seen. Paths that are not valid UTF-8 are decoded with surrogateescape.
+    """
+    process = subprocess.Popen(
+        _git(repo_path, 'ls-tree', '-r', '-l', '-z', '--full-tree', ref),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    pending = b''
+    completed = False
+    try:
+        for block in iter(lambda: process.stdout.read(1024 * 1024), b''):
+            *records, pending = (pending + block).split(b'\0')
+            for record in records:
+                # "<mode> <type> <sha> <size>\t<path>", with the size padded by spaces
+                info, path = record.split(b'\t', 1)
+                mode, _, sha, size = info.split()
+                if mode in _FILE_MODES:
+                    yield TreeEntry(path.decode('utf-8', 'surrogateescape'), sha.decode(), int(size))
+        completed = True
+    finally:
+        if not completed:
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise ValueError(f"git ls-tree failed for {ref}: {stderr.decode(errors='replace').strip()}")
+
+def iter_tree_changes(repo_path: str, base: str, target: str) -> Iterator[TreeChange]:
+    """
+    Yield the changed files between two commits, as listed by git diff-tree.
+
+    Renames and copies are reported as a deletion and an addition, so every
+    change concerns a single path.
+    """
+    result = subprocess.run(
+        _git(repo_path, 'diff-tree', '-r', '-z', '--no-renames', '--no-commit-id', base, target),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise ValueError(f"git diff-tree failed for {base}..{target}: {result.stderr.decode(errors='replace').strip()}")
+    fields = result.stdout.split(b'\0')
+    # ":<old mode> <new mode> <old sha> <new sha> <status>", then the path
+    for info, path in zip(fields[0::2], fields[1::2]):
+        old_mode, new_mode, old_sha, new_sha, _ = info[1:].split()
+        yield TreeChange(
+            path.decode('utf-8', 'surrogateescape'),
+            old_sha.decode() if old_mode in _FILE_MODES else None,
+            new_sha.decode() if new_mode in _FILE_MODES else None
+        )
+
+def read_blob_sizes(repo_path: str, shas: List[str]) -> Dict[str, int]:
+    """Return {sha: size} for the blobs present in the object database, via git cat-file --batch-check."""
+    result = subprocess.run(
+        _git(repo_path, 'cat-file', '--batch-check'),
+        input=''.join(f'{sha}\n' for sha in shas).encode(),
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    sizes = {}
+    for line in result.stdout.splitlines():
+        # "<sha> <type> <size>", or "<sha> missing"
+        fields = line.split()
+        if len(fields) == 3:
+            sizes[fields[0].decode()] = int(fields[2])
+    return sizes
+
+def read_blobs(repo_path: str, shas: List[str]) -> Iterator[Tuple[str, Optional[bytes]]]:
+    """
+    Yield (sha, content) for each blob SHA in order, streamed from one git cat-file --batch process.
+
+    A feeder thread writes the requested SHAs while contents are read, so git
+    never waits on a round trip per object. content is None for a blob that is
+    missing from the object database (e.g. in a partial clone).
+    """
+    process = subprocess.Popen(
+        _git(repo_path, 'cat-file', '--batch'),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+
+    def feed():
+        try:
+            for sha in shas:
+                process.stdin.write(sha.encode() + b'\n')
+            process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            # The reader stopped early and closed the process
+            pass
+
+    feeder = threading.Thread(target=feed, name='cat-file-feeder', daemon=True)
+    feeder.start()
+    try:
+        for sha in shas:
+            header = process.stdout.readline().split()
+            if len(header) != 3:
+                # "<sha> missing"
+                yield sha, None
+                continue
+            content = process.stdout.read(int(header[2]))
+            process.stdout.read(1)  # trailing newline
+            yield sha, content
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+        feeder.join()
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+def clone_for_scan(
+    url: str,
+    destination: str,
+    ref: Optional[str] = None,
+    depth: Optional[int] = 1,
+    since: Optional[str] = None
+):
+    """
+    Clone just what a git scan reads: a bare, depth-1 clone of ref's branch or tag.
+
+    Nothing is checked out, and by default only the objects of a single
+    commit are fetched. since (a date) fetches the history since then
+    instead, and depth None the full history. ref None (or 'HEAD') clones
+    the default branch. A full commit ID is fetched on its own, which the
+    server must allow (GitHub, GitLab and git's protocol v2 do); HEAD then
+    points at it.
+    """
+    from git import Repo
+    if ref and _COMMIT_ID.fullmatch(ref):
+        repo = Repo.init(destination, bare=True)
+        repo.create_remote('origin', url)
+        history = [f'--shallow-since={since}'] if since else [f'--depth={depth}'] if depth is not None else []
+        repo.git.fetch('--quiet', *history, 'origin', ref)
+        repo.git.update_ref('--no-deref', 'HEAD', ref)
+        return
+    options = {'bare': True}
+    if since:
+        options['shallow_since'] = since
+    elif depth is not None:
+        options['depth'] = depth
+    if ref and ref != 'HEAD':
+        options['branch'] = ref
+    Repo.clone_from(url, destination, **options)
+
+def clone_worktree(
+    url: str,
+    destination: str,
+    ref: Optional[str] = None,
+    sparse_patterns: Optional[Sequence[str]] = None,
+    depth: Optional[int] = 1
+):
+    """
+    Clone a checkout of ref's branch or tag, single-branch and depth 1 by default.
+
+    sparse_patterns (non-cone sparse-checkout patterns, in .gitignore syntax)
+    limit the checkout to the matching files, and only their contents are
+    fetched where the server supports partial clone. A local directory url,
+    such as a mirror from update_mirror, is cloned with --shared: its objects
+    are used in place instead of being copied.
+    """
+    from git import Repo
+    options = {'no_checkout': True}
+    if os.path.isdir(url):
+        options['shared'] = True
+    else:
+        options['single_branch'] = True
+        if depth is not None:
+            options['depth'] = depth
+        if sparse_patterns is not None:
+            options['filter'] = 'blob:none'
+    if ref and ref != 'HEAD':
+        options['branch'] = ref
+    repo = Repo.clone_from(url, destination, **options)
+    if sparse_patterns is not None:
+        repo.git.sparse_checkout('set', '--no-cone', *sparse_patterns)
+    repo.git.checkout()
+
+_mirror_locks: Dict[str, threading.Lock] = {}
+_mirror_locks_guard = threading.Lock()
+
+def mirror_path(url: str, mirror_dir: Optional[str] = None) -> str:
+    """Return the directory of url's mirror: a hash of the URL, followed by its last path component for readability."""
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', url.rstrip('/').rsplit('/', 1)[-1])[:64]
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(mirror_dir or DEFAULT_MIRROR_DIR, f'{digest}-{name}')
+
+def update_mirror(url: str, mirror_dir: Optional[str] = None) -> str:
+    """
+    Bring the local mirror of url up to date and return its path.
+
+    The first call makes a bare mirror clone under mirror_dir (default
+    DEFAULT_MIRROR_DIR); later calls only fetch what changed since. A new
+    mirror is moved into place once complete, so an interrupted clone never
+    leaves a broken mirror behind. Scan a mirror directly with a git ref, or
+    clone a checkout from it with clone_worktree.
+    """
+    from git import Repo
+    path = mirror_path(url, mirror_dir)
+    with _mirror_locks_guard:
+        lock = _mirror_locks.setdefault(path, threading.Lock())
+    with lock:
+        if os.path.isdir(path):
+            Repo(path).git.fetch('--prune', '--quiet', 'origin')
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = tempfile.mkdtemp(prefix='.partial-', dir=os.path.dirname(path))
+        try:
+            Repo.clone_from(url, partial, mirror=True)
+            try:
+                os.rename(partial, path)
+            except OSError:
+                # Another process created the mirror first
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+    return path
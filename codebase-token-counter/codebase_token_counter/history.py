@@ -0,0 +1,184 @@
+"""Token counts over the commit history of a repository: `token-counter history`."""
+
+import argparse
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from .cache import TokenCache
+from .git_scan import clone_for_scan, update_mirror
+from .token_counter import (
+    DEFAULT_BATCH_SIZE, TOKENIZER_NAME, ScanOptions, ScanProgress, add_exclusion_arguments, exclusions_from_args,
+    process_repository, scan_options
+)
+
+HISTORY_FORMATS = ('csv', 'json')
+
+class HistoryPoint(NamedTuple):
+    """Token counts of one commit in a history."""
+    commit: str
+    # Committer date, ISO 8601
+    date: str
+    total_tokens: int
+    # Tokens and files per extension
+    extension_stats: Dict[str, int]
+    file_counts: Dict[str, int]
+
+def list_commits(
+    repo_path: str,
+    ref: str = 'HEAD',
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    step: int = 1
+) -> List[Tuple[str, str]]:
+    """
+    Return (commit, date) for every step-th first-parent commit of ref, oldest first.
+
+    since and until take any date git understands (e.g. '2024-01-01' or
+    '6 months ago'). The newest commit in the range is always included.
+    """
+    args = ['git', '-C', repo_path, 'log', '--first-parent', '--reverse', '--format=%H %cI']
+    if since:
+        args.append(f'--since={since}')
+    if until:
+        args.append(f'--until={until}')
+    result = subprocess.run([*args, ref, '--'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise ValueError(f"git log failed for {ref}: {result.stderr.decode(errors='replace').strip()}")
+    commits = [tuple(line.split(' ', 1)) for line in result.stdout.decode().splitlines()]
+    selected = commits[::max(1, step)]
+    if commits and selected[-1] != commits[-1]:
+        selected.append(commits[-1])
+    return selected
+
+def iter_token_history(
+    repo_path: str,
+    commits: List[Tuple[str, str]],
+    cache: TokenCache,
+    options: Optional[ScanOptions] = None,
+    progress: Optional[ScanProgress] = None,
+    **settings
+) -> Iterator[HistoryPoint]:
+    """
+    Yield a HistoryPoint per (commit, date), counting each commit from its predecessor's diff.
+
+    The first commit is scanned in full; every later one only tokenizes the
+    files changed since the previous commit (see process_repository's
+    git_base). Blob counts are shared through the cache, so contents seen at
+    any earlier commit, or in an earlier run, are never tokenized again.
+    The other arguments, and settings overriding options, are as for
+    process_repository.
+    """
+    options = scan_options(options, **settings)
+    base = None
+    for commit, date in commits:
+        total_tokens, extension_stats, file_counts = process_repository(
+            repo_path, total_only=True, options=options, cache=cache, progress=progress, git_ref=commit, git_base=base
+        )
+        yield HistoryPoint(commit, date, total_tokens, extension_stats, file_counts)
+        base = commit
+
+def write_history_json(points: Iterator[HistoryPoint], output: TextIO):
+    """Write points as a JSON array of objects, one point per line as it arrives."""
+    output.write('[')
+    for i, point in enumerate(points):
+        output.write(',\n' if i else '\n')
+        output.write(json.dumps(point._asdict(), sort_keys=True))
+        output.flush()
+    output.write('\n]\n')
+
+def write_history_csv(points: Iterator[HistoryPoint], output: TextIO):
+    """Write points as CSV rows of commit, date, total_tokens and one tokens column per extension."""
+    points = list(points)
+    extensions = sorted({extension for point in points for extension in point.extension_stats})
+    writer = csv.writer(output)
+    writer.writerow(['commit', 'date', 'total_tokens', *extensions])
+    for point in points:
+        writer.writerow([
+            point.commit, point.date, point.total_tokens,
+            *(point.extension_stats.get(extension, 0) for extension in extensions)
+        ])
+
+def history_main(argv: List[str]):
+    """Entry point of `token-counter history`."""
+    parser = argparse.ArgumentParser(
+        prog='token-counter history',
+        description='Report token counts over a range of commits, as CSV or JSON.'
+    )
+    parser.add_argument('repository', help='Local repository path or remote URL')
+    parser.add_argument('--ref', default='HEAD', help='Branch, tag or commit whose history is reported (default: HEAD)')
+    parser.add_argument('--since', help="Only commits after this date, e.g. 2024-01-01 or '6 months ago'")
+    parser.add_argument('--until', help='Only commits before this date')
+    parser.add_argument('--step', type=int, default=1, help='Report every N-th commit (default: 1)')
+    parser.add_argument('--format', choices=HISTORY_FORMATS, default='csv', help='Output format (default: csv)')
+    parser.add_argument('--output', help='Write to this file instead of stdout')
+    parser.add_argument('--cache', nargs='?', const='', default=None,
+                        help='Keep blob and commit counts in this cache directory (default cache without a value) '
+                             'for later runs; otherwise a temporary cache is used')
+    parser.add_argument('--workers', type=int, default=1, help='Tokenizer processes (0: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Files per tokenizer batch')
+    parser.add_argument('--tokenizer', default=TOKENIZER_NAME, help='Tokenizer to count with')
+    parser.add_argument('--mirror-cache', nargs='?', const='', default=None,
+                        help='Keep a mirror of a remote repository in this directory (default without a value) '
+                             'and only fetch its changes on later runs')
+    add_exclusion_arguments(parser, ignore_files=False)
+    args = parser.parse_args(argv)
+    exclude_dirs, exclude_patterns = exclusions_from_args(args)
+
+    from rich.console import Console
+    # stdout carries the report
+    console = Console(stderr=True)
+    temp_dirs = []
+    try:
+        repo_path = args.repository
+        if not os.path.isdir(repo_path) and args.mirror_cache is not None:
+            console.print(f"[yellow]Updating mirror of repository: {repo_path}[/yellow]")
+            repo_path = update_mirror(repo_path, args.mirror_cache or None)
+        elif not os.path.isdir(repo_path):
+            # Only the history that is reported is fetched, without a checkout
+            clone_dir = tempfile.mkdtemp()
+            temp_dirs.append(clone_dir)
+            console.print(f"[yellow]Cloning repository: {repo_path}[/yellow]")
+            clone_for_scan(repo_path, clone_dir, None if args.ref == 'HEAD' else args.ref, depth=None, since=args.since)
+            repo_path = clone_dir
+            args.ref = 'HEAD'
+
+        if args.cache is None:
+            cache_dir = tempfile.mkdtemp()
+            temp_dirs.append(cache_dir)
+        else:
+            cache_dir = args.cache or None
+        commits = list_commits(repo_path, args.ref, args.since, args.until, args.step)
+        console.print(f"[green]Counting tokens at {len(commits):,} commits[/green]")
+
+        output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+        try:
+            with TokenCache(cache_dir) as cache:
+                options = ScanOptions(
+                    exclude_dirs=exclude_dirs,
+                    exclude_patterns=exclude_patterns,
+                    tokenizer=args.tokenizer,
+                    workers=args.workers,
+                    batch_size=args.batch_size
+                )
+                points = iter_token_history(repo_path, commits, cache, options)
+                if args.format == 'json':
+                    write_history_json(points, output)
+                else:
+                    write_history_csv(points, output)
+                cache_stats = cache.stats()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        console.print(f"[green]{cache_stats['misses']:,} blobs tokenized, {cache_stats['content_hits']:,} reused[/green]")
+    except Exception as e:
+        console.print(f"[red]Error computing history: {str(e)}[/red]")
+        sys.exit(1)
+    finally:
+        for temp_dir in temp_dirs:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -0,0 +1,199 @@
+""".gitignore and .dockerignore rules, compiled once per file and applied while walking."""
+
+import functools
+import os
+import re
+from typing import List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+# Ignore files process_repository can honor: .gitignore files in every
+# directory, and the .dockerignore of the scanned directory itself
+IGNORE_FILES = ('.gitignore', '.dockerignore')
+
+class _Rule(NamedTuple):
+    regex: str
+    negated: bool
+    dir_only: bool
+
+class CompiledIgnoreFile(NamedTuple):
+    """
+    The rules of one ignore file, as regexes over '/'-separated paths relative to its directory.
+
+    Each regex has one group per rule, last rule first, so the first group
+    that matches is the rule that decides (the last matching one, as in git).
+    The negated tuples tell, per group, whether that rule re-includes.
+    """
+    files: Optional[Pattern]
+    files_negated: Tuple[bool, ...]
+    # Directories are matched by every rule, files only by rules without a trailing '/'
+    dirs: Optional[Pattern]
+    dirs_negated: Tuple[bool, ...]
+
+def _glob_to_regex(pattern: str) -> str:
+    """Translate a .gitignore glob: '*' and '?' stay within a path component, '**' spans components."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            parts.append('/.*')
+            i += 3
+        elif c == '*':
+            while i < len(pattern) and pattern[i] == '*':
+                i += 1
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[':
+            # A ']' right after '[' or '[!' is part of the class
+            start = i + 1
+            if pattern[start:start + 1] in ('!', '^'):
+                start += 1
+            if pattern[start:start + 1] == ']':
+                start += 1
+            end = pattern.find(']', start)
+            if end == -1:
+                parts.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:end]
+            if body[:1] in ('!', '^'):
+                body = '^' + body[1:]
+            parts.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+        elif c == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return ''.join(parts)
+
+def parse_ignore_lines(lines: Sequence[str], anchored: bool = False) -> List[_Rule]:
+    """
+    Parse ignore file lines into rules, following .gitignore syntax.
+
+    anchored makes every pattern relative to the file's directory, as in
+    .dockerignore, where 'build' only matches the top-level build.
+    """
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        # Trailing spaces are ignored unless escaped
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        line = stripped
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith('/') and not anchored
+        line = line.rstrip('/')
+        if not line:
+            continue
+        # A slash anywhere but at the end anchors the pattern to the ignore file's directory
+        if anchored or '/' in line:
+            regex = _glob_to_regex(line.lstrip('/'))
+        else:
+            regex = '(?:.*/)?' + _glob_to_regex(line)
+        try:
+            re.compile(regex)
+        except re.error:
+            # Git ignores patterns it cannot parse too
+            continue
+        rules.append(_Rule(regex, negated, dir_only))
+    return rules
+
+def _compile(rules: List[_Rule]) -> Tuple[Optional[Pattern], Tuple[bool, ...]]:
+    if not rules:
+        return None, ()
+    rules = rules[::-1]
+    return re.compile('(?:' + '|'.join(f'({rule.regex})' for rule in rules) + r')\Z'), tuple(rule.negated for rule in rules)
+
+def compile_ignore_lines(lines: Sequence[str], anchored: bool = False) -> CompiledIgnoreFile:
+    """Compile the lines of an ignore file (see parse_ignore_lines)."""
+    rules = parse_ignore_lines(lines, anchored)
+    files, files_negated = _compile([rule for rule in rules if not rule.dir_only])
+    dirs, dirs_negated = _compile(rules)
+    return CompiledIgnoreFile(files, files_negated, dirs, dirs_negated)
+
+@functools.lru_cache(maxsize=4096)
+def _load_ignore_file(path: str, mtime_ns: int, size: int, anchored: bool) -> CompiledIgnoreFile:
+    # Keyed by mtime and size, so a changed file is compiled again
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return compile_ignore_lines(f.readlines(), anchored)
+
+def load_ignore_file(path: str, anchored: bool = False) -> Optional[CompiledIgnoreFile]:
+    """Return the compiled rules of an ignore file, or None if it cannot be read; compiled once per version of the file."""
+    try:
+        stat = os.stat(path)
+        return _load_ignore_file(path, stat.st_mtime_ns, stat.st_size, anchored)
+    except OSError:
+        return None
+
+def _excludes(compiled: CompiledIgnoreFile, relative_path: str, start: int, is_dir: bool) -> Optional[bool]:
+    """Return whether compiled's deciding rule excludes relative_path[start:], or None if no rule matches."""
+    regex, negated = (compiled.dirs, compiled.dirs_negated) if is_dir else (compiled.files, compiled.files_negated)
+    match = regex.match(relative_path, start) if regex is not None else None
+    return None if match is None else not negated[match.lastindex - 1]
+
+class IgnoreRules:
+    """
+    The ignore files in effect in one directory of a walk.
+
+    levels holds (relative directory, rules) for every directory on the path
+    from the root that has a .gitignore; deeper files take precedence, and
+    within a file the last matching rule decides. The root's .dockerignore
+    applies on its own: a path is excluded if either excludes it. Excluded
+    directories are never entered, so files below them cannot be re-included,
+    as in git.
+    """
+    __slots__ = ('nested', 'levels', 'docker')
+
+    def __init__(
+        self,
+        nested: Tuple[str, ...] = (),
+        levels: Tuple[Tuple[str, CompiledIgnoreFile], ...] = (),
+        docker: Optional[CompiledIgnoreFile] = None
+    ):
+        self.nested = nested
+        self.levels = levels
+        self.docker = docker
+
+    @classmethod
+    def for_root(cls, root: str, ignore_files: Sequence[str]) -> Optional['IgnoreRules']:
+        """Return the rules at the walk's root for the named IGNORE_FILES, or None if there are none to honor."""
+        unknown = set(ignore_files) - set(IGNORE_FILES)
+        if unknown:
+            raise ValueError(f"Unknown ignore files: {', '.join(sorted(unknown))}")
+        if not ignore_files:
+            return None
+        docker = None
+        if '.dockerignore' in ignore_files:
+            docker = load_ignore_file(os.path.join(root, '.dockerignore'), anchored=True)
+        return cls(('.gitignore',) if '.gitignore' in ignore_files else (), (), docker)
+
+    def entered(self, path: str, relative_root: str, file_names: Sequence[str]) -> 'IgnoreRules':
+        """Return the rules for the directory at path, adding its own .gitignore if file_names has one."""
+        levels = self.levels
+        for name in self.nested:
+            if name in file_names:
+                compiled = load_ignore_file(os.path.join(path, name))
+                if compiled is not None:
+                    levels = levels + ((relative_root, compiled),)
+        return self if levels is self.levels else IgnoreRules(self.nested, levels, self.docker)
+
+    def excludes(self, relative_path: str, is_dir: bool) -> bool:
+        """Return True if an ignore file excludes the '/'-separated relative path."""
+        if self.docker is not None and _excludes(self.docker, relative_path, 0, is_dir):
+            return True
+        for base, compiled in reversed(self.levels):
+            excluded = _excludes(compiled, relative_path, len(base), is_dir)
+            if excluded is not None:
+                return excluded
+        return False
@@ -0,0 +1,557 @@
+"""Token counts of directories kept in memory and updated as their files change."""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Executor
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from .cache import TokenCache
+from .dir_tree import DirectoryTree
+from .file_stats import DEFAULT_TOP_FILES, TokenHistogram, TopFiles
+from .exclusions import ExclusionMatcher
+from .pack import PackFile
+from .token_counter import (
+    FileTokenCount, ScanCancelled, ScanOptions, ScanProgress, file_classifier, iter_candidate_files,
+    iter_file_token_counts, scan_options, walk_files
+)
+
+# How an index notices changes: 'events' from inotify (through watchdog), 'poll'
+# by walking the tree every poll interval, or 'auto' for events where available
+WATCH_MODES = ('auto', 'events', 'poll')
+DEFAULT_POLL_INTERVAL = 5.0
+# Seconds to wait after an event for more to arrive, so bursts are counted together
+SETTLE_DELAY = 0.2
+# Changed files are tokenized in the index's thread below this many, in worker processes above
+POOL_THRESHOLD = 256
+# Estimated memory of an indexed file besides its path, and per tokenizer it is counted with
+ENTRY_BYTES = 200
+TOKENIZER_ENTRY_BYTES = 100
+# Records counted between memory checks while an index is built
+MEMORY_CHECK_INTERVAL = 4096
+DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+class IndexedFile(NamedTuple):
+    """A file in a LiveIndex."""
+    extension: str
+    size: Optional[int]
+    mtime_ns: Optional[int]
+    # Token count of every tokenizer; empty if the file could not be read, None for binary files
+    counts: Optional[Dict[str, int]]
+
+class _IndexState:
+    """Indexed files by '/'-separated relative path, with their totals per extension."""
+
+    def __init__(self, tokenizers: Sequence[str]):
+        self.files: Dict[str, IndexedFile] = {}
+        self.tokens: Dict[str, Dict[str, int]] = {name: {} for name in tokenizers}
+        self.file_counts: Dict[str, int] = {}
+        self.histogram = TokenHistogram()
+        self.path_bytes = 0
+        self.tokenizer = tokenizers[0]
+
+    def add(self, relative_path: str, entry: IndexedFile):
+        self.remove(relative_path)
+        self.files[relative_path] = entry
+        self.path_bytes += len(relative_path)
+        if entry.counts is None:
+            return
+        # Files that could not be read still count as files of their extension, as in process_repository
+        self.file_counts[entry.extension] = self.file_counts.get(entry.extension, 0) + 1
+        for name, extension_tokens in self.tokens.items():
+            extension_tokens[entry.extension] = extension_tokens.get(entry.extension, 0) + entry.counts.get(name, 0)
+        if entry.counts:
+            self.histogram.add(entry.counts[self.tokenizer])
+
+    def remove(self, relative_path: str):
+        entry = self.files.pop(relative_path, None)
+        if entry is None:
+            return
+        self.path_bytes -= len(relative_path)
+        if entry.counts is None:
+            return
+        self.file_counts[entry.extension] -= 1
+        for name, extension_tokens in self.tokens.items():
+            extension_tokens[entry.extension] -= entry.counts.get(name, 0)
+        if entry.counts:
+            self.histogram.remove(entry.counts[self.tokenizer])
+        if not self.file_counts[entry.extension]:
+            del self.file_counts[entry.extension]
+            for extension_tokens in self.tokens.values():
+                extension_tokens.pop(entry.extension, None)
+
+    def remove_directory(self, relative_path: str):
+        prefix = relative_path + '/'
+        for path in [path for path in self.files if path.startswith(prefix)]:
+            self.remove(path)
+
+def _index_key(
+    root: str,
+    exclude_dirs: Optional[Set[str]],
+    exclude_patterns: Optional[List[str]],
+    ignore_files: Sequence[str]
+) -> Tuple:
+    return os.path.abspath(root), tuple(sorted(exclude_dirs or ())), tuple(exclude_patterns or ()), tuple(sorted(ignore_files))
+
+class LiveIndex:
+    """
+    Per-file token counts of one directory, kept current while its files change.
+
+    A background thread counts the directory once, then only recounts the
+    files that change, updating the per-extension totals with every file, so
+    results() is answered from memory however large the directory is.
+    Changes are noticed from inotify events when watchdog is installed and
+    the filesystem delivers them. Otherwise, or with watch='poll', the tree is
+    walked every poll_interval seconds and files whose size or mtime changed
+    are recounted; bind mounts of Docker Desktop and network drives deliver
+    no events and need 'poll'. A change to an honored ignore file rebuilds
+    the index, serving the previous results until the new ones are complete.
+
+    The directory is scanned with options, and settings overriding them, as
+    by process_repository, with cache_dir naming the TokenCache directory to
+    use, if any. A shared executor (see
+    create_tokenizer_pool) counts the builds and large updates instead of a
+    pool started for each; workers should then be its size. It is left
+    running when the index stops.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        options: Optional[ScanOptions] = None,
+        cache_dir: Optional[str] = None,
+        executor: Optional[Executor] = None,
+        watch: str = 'auto',
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        on_change: Optional[Callable[['LiveIndex'], None]] = None,
+        **settings
+    ):
+        if watch not in WATCH_MODES:
+            raise ValueError(f"Unknown watch mode: {watch}")
+        options = scan_options(options, **settings)
+        self.id = uuid.uuid4().hex
+        self.root = os.path.abspath(root)
+        self.options = options._replace(
+            exclude_dirs=set(options.exclude_dirs or ()),
+            exclude_patterns=list(options.exclude_patterns or ()),
+            ignore_files=tuple(options.ignore_files)
+        )
+        self.cache_dir = cache_dir
+        self.executor = executor
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+
+        self.status = 'starting' # starting -> building -> ready; stopped, evicted or failed
+        self.mode = None # 'events' or 'poll' once started
+        self.error = None
+        self.progress = ScanProgress()
+        self.created = time.time()
+        self.updated = None
+        self.last_used = time.monotonic()
+        self.ready = threading.Event()
+        self._state = _IndexState(self.options.tokenizers)
+        self._building: Optional[_IndexState] = None
+        self._lock = threading.Lock()
+        # Relative paths of changed files and directories, waiting to be recounted
+        self._changed: Set[str] = set()
+        self._changed_dirs: Set[str] = set()
+        self._rebuild = False
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def key(self) -> Tuple:
+        return _index_key(self.root, self.options.exclude_dirs, self.options.exclude_patterns, self.options.ignore_files)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('starting', 'building', 'ready')
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated memory of the indexed files, including a rebuild in progress."""
+        per_file = ENTRY_BYTES + TOKENIZER_ENTRY_BYTES * len(self.options.tokenizers)
+        total = 0
+        for state in (self._state, self._building):
+            if state is not None:
+                total += len(state.files) * per_file + state.path_bytes
+        return total
+
+    def start(self):
+        """Start watching and build the index in a background thread."""
+        self._thread = threading.Thread(target=self._run, name='live-index', daemon=True)
+        self._thread.start()
+
+    def stop(self, status: str = 'stopped'):
+        """Stop watching and drop the indexed files; the background thread exits at its next checkpoint."""
+        self._stopped.set()
+        self.progress.cancel()
+        self._wake.set()
+        with self._lock:
+            self._state = _IndexState(self.options.tokenizers)
+            self._building = None
+        if self.status != 'failed':
+            self.status = status
+        self.ready.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the index is built; return True if it is ready."""
+        self.ready.wait(timeout)
+        return self.status == 'ready'
+
+    def touch(self):
+        """Mark the index as used, for least recently used eviction."""
+        self.last_used = time.monotonic()
+
+    def notify(self, path: str, is_directory: bool = False):
+        """Record that the file or directory at path was created, changed, moved or deleted."""
+        relative_path = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if relative_path == '.' or relative_path.startswith('../'):
+            return
+        name = relative_path.rpartition('/')[2]
+        with self._lock:
+            # Ignore files change which files are selected, so the whole index is rebuilt
+            if (name == '.gitignore' or relative_path == '.dockerignore') and name in self.options.ignore_files:
+                self._rebuild = True
+            elif is_directory:
+                self._changed_dirs.add(relative_path)
+            else:
+                self._changed.add(relative_path)
+        self._wake.set()
+
+    def results(self, tokenizer_totals: Optional[Dict[str, int]] = None) -> Tuple[int, Dict[str, int], Dict[str, int]]:
+        """
+        Return (total_tokens, extension_stats, file_counts) for the directory, as process_repository does.
+
+        tokenizer_totals, if given, is filled with the total of every tokenizer
+        the index counts with.
+        """
+        self.touch()
+        with self._lock:
+            state = self._state
+            extension_stats = dict(state.tokens[self.options.tokenizer])
+            file_counts = dict(state.file_counts)
+            if tokenizer_totals is not None:
+                tokenizer_totals.update({name: sum(tokens.values()) for name, tokens in state.tokens.items()})
+        return sum(extension_stats.values()), extension_stats, file_counts
+
+    def directory_tree(self) -> DirectoryTree:
+        """Return the per-directory totals of the indexed files, as they are now."""
+        with self._lock:
+            files = list(self._state.files.items())
+        tree = DirectoryTree()
+        for relative_path, entry in files:
+            if entry.counts is not None:
+                tree.add(relative_path.rpartition('/')[0], entry.counts.get(self.options.tokenizer, 0))
+        tree.finish()
+        return tree
+
+    def top_files(self, n: int = DEFAULT_TOP_FILES) -> TopFiles:
+        """Return the n indexed files with the most tokens, with absolute paths."""
+        top_files = TopFiles(n)
+        with self._lock:
+            files = list(self._state.files.items())
+        for relative_path, entry in files:
+            if entry.counts:
+                top_files.add(os.path.join(self.root, *relative_path.split('/')), entry.counts[self.options.tokenizer])
+        return top_files
+
+    def pack_files(self, tokenizer: Optional[str] = None) -> List[PackFile]:
+        """Return the counted files for pack.pack_files, with tokens of tokenizer if they were counted with it."""
+        tokenizer = tokenizer or self.options.tokenizer
+        with self._lock:
+            files = list(self._state.files.items())
+        return [
+            PackFile(os.path.join(self.root, *relative_path.split('/')), relative_path, entry.counts[tokenizer], 0, entry.mtime_ns)
+            for relative_path, entry in files if entry.counts and tokenizer in entry.counts
+        ]
+
+    def token_histogram(self) -> TokenHistogram:
+        """Return the distribution of tokens per indexed file, kept up to date with every change."""
+        with self._lock:
+            return self._state.histogram.copy()
+
+    def to_dict(self) -> Dict[str, object]:
+        with self._lock:
+            files = len(self._state.files)
+            pending = len(self._changed) + len(self._changed_dirs)
+        data = {
+            'id': self.id,
+            'path': self.root,
+            'status': self.status,
+            'mode': self.mode,
+            'files': files,
+            'pending': pending,
+            'memory_bytes': self.memory_bytes,
+            'progress': self.progress.snapshot(),
+            'created': self.created,
+            'updated': self.updated,
+            'idle': round(time.monotonic() - self.last_used, 1)
+        }
+        if self.error is not None:
+            data['error'] = self.error
+        return data
+
+    def _start_observer(self):
+        """Watch the directory with watchdog, or return None if it is not installed or cannot watch it."""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return None
+        index = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # A directory is 'modified' whenever a file in it is created; the file has its own event
+                if event.event_type in ('opened', 'closed_no_write') or (event.is_directory and event.event_type == 'modified'):
+                    return
+                index.notify(os.fsdecode(event.src_path), event.is_directory)
+                if getattr(event, 'dest_path', ''):
+                    index.notify(os.fsdecode(event.dest_path), event.is_directory)
+
+        observer = Observer()
+        try:
+            observer.schedule(Handler(), self.root, recursive=True)
+            observer.start()
+        except OSError:
+            # Out of inotify watches, or a filesystem that cannot be watched
+            return None
+        return observer
+
+    def _run(self):
+        observer = None
+        cache = TokenCache(self.cache_dir) if self.cache_dir is not None else None
+        try:
+            if self.watch != 'poll':
+                observer = self._start_observer()
+                if observer is None and self.watch == 'events':
+                    raise RuntimeError(f"Cannot watch {self.root} for changes; install watchdog or use polling")
+            self.mode = 'events' if observer is not None else 'poll'
+            self.status = 'building'
+            self._build(cache)
+            self.status = 'ready'
+            self.ready.set()
+            while not self._stopped.is_set():
+                if self.mode == 'poll':
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    if self._stopped.is_set():
+                        break
+                    self._poll(cache)
+                else:
+                    self._wake.wait()
+                    if self._stopped.wait(SETTLE_DELAY):
+                        break
+                    self._wake.clear()
+                self._apply_changes(cache)
+        except ScanCancelled:
+            pass
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if cache is not None:
+                cache.close()
+            self.ready.set()
+
+    def _changed_state(self):
+        self.updated = time.time()
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def _add_records(self, state: _IndexState, records: Iterable[FileTokenCount], seen: Set[str], check_memory: bool = False):
+        for record in records:
+            if record.extension is None:
+                continue
+            relative_path = os.path.relpath(record.path, self.root).replace(os.sep, '/')
+            counts = {} if record.error is not None else record.counts
+            seen.add(relative_path)
+            with self._lock:
+                state.add(relative_path, IndexedFile(record.extension, record.size, record.mtime_ns, counts))
+            if check_memory and len(seen) % MEMORY_CHECK_INTERVAL == 0 and self.on_change is not None:
+                self.on_change(self)
+
+    def _scan(self, cache: Optional[TokenCache], paths: Optional[List[str]] = None, workers: Optional[int] = None):
+        options = self.options if workers is None else self.options._replace(workers=workers)
+        return iter_file_token_counts(
+            self.root, options, cache=cache, progress=self.progress, executor=self.executor, paths=paths
+        )
+
+    def _build(self, cache: Optional[TokenCache]):
+        """Count every file into a new state, then replace the current one with it."""
+        state = _IndexState(self.options.tokenizers)
+        self._building = state
+        self._add_records(state, self._scan(cache), set(), check_memory=True)
+        with self._lock:
+            if self._stopped.is_set():
+                return
+            self._state = state
+            self._building = None
+        self._changed_state()
+
+    def _poll(self, cache: Optional[TokenCache]):
+        """Walk the tree and queue the files that appeared, changed or disappeared since they were counted."""
+        files = self._state.files
+        seen = set()
+        changed = set()
+        candidates = iter_candidate_files(
+            self.root, self.options.exclude_dirs, self.options.exclude_patterns, self.options.skip_above,
+            ScanProgress(), self.options.walk_threads, self.options.ignore_files
+        )
+        for file_path, _, file_stat, error in candidates:
+            if self._stopped.is_set():
+                return
+            relative_path = os.path.relpath(file_path, self.root).replace(os.sep, '/')
+            seen.add(relative_path)
+            entry = files.get(relative_path)
+            if entry is None or file_stat is None or (entry.size, entry.mtime_ns) != (file_stat.st_size, file_stat.st_mtime_ns):
+                changed.add(relative_path)
+        changed.update(path for path in files if path not in seen)
+        with self._lock:
+            self._changed.update(changed)
+
+    def _apply_changes(self, cache: Optional[TokenCache]):
+        """Recount the files and directories queued since the last update."""
+        with self._lock:
+            changed, changed_dirs, rebuild = self._changed, self._changed_dirs, self._rebuild
+            self._changed, self._changed_dirs, self._rebuild = set(), set(), False
+        if rebuild:
+            self._build(cache)
+            return
+        if not changed and not changed_dirs:
+            return
+
+        state = self._state
+        # Only name exclusions prune the walk, as patterns are relative to the root
+        matcher = ExclusionMatcher(self.options.exclude_dirs)
+        for directory in changed_dirs:
+            with self._lock:
+                state.remove_directory(directory)
+            directory_path = os.path.join(self.root, *directory.split('/'))
+            if os.path.isdir(directory_path):
+                changed.update(f'{directory}/{relative_path}' for _, relative_path in walk_files(directory_path, matcher))
+
+        paths = sorted(changed)
+        seen = set()
+        workers = self.options.workers if len(paths) >= POOL_THRESHOLD else 1
+        self._add_records(state, self._scan(cache, [os.path.join(self.root, *path.split('/')) for path in paths], workers), seen)
+
+        # What was not counted is gone, no longer selected, or binary
+        classify = file_classifier(
+            self.options.exclude_dirs, self.options.exclude_patterns, self.root, self.options.ignore_files
+        )
+        skip_above = self.options.skip_above
+        with self._lock:
+            for relative_path in changed - seen:
+                extension = classify(relative_path)
+                try:
+                    file_stat = os.stat(os.path.join(self.root, *relative_path.split('/')))
+                except OSError:
+                    file_stat = None
+                if extension is None or file_stat is None or (skip_above is not None and file_stat.st_size > skip_above):
+                    state.remove(relative_path)
+                else:
+                    state.add(relative_path, IndexedFile(extension, file_stat.st_size, file_stat.st_mtime_ns, None))
+        self._changed_state()
+
+class LiveIndexManager:
+    """
+    The live indexes of a process, within a memory limit.
+
+    Indexes are looked up by directory and exclusions. When their estimated
+    memory exceeds memory_limit, the least recently used indexes are stopped
+    and dropped until the others fit, so projects that are no longer
+    analyzed make room for new ones; an index that does not fit on its own is
+    dropped as well. index_options, such as the ScanOptions of every index,
+    are passed to every LiveIndex; pass an executor among them so all indexes
+    share one pool of tokenizer processes.
+    """
+
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT, **index_options):
+        self.memory_limit = memory_limit
+        self.index_options = index_options
+        self._indexes: Dict[Tuple, LiveIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        root: str,
+        exclude_dirs: Optional[Set[str]] = None,
+        exclude_patterns: Optional[List[str]] = None,
+        ignore_files: Sequence[str] = ()
+    ) -> Optional[LiveIndex]:
+        """Return the active index of root with these exclusions, or None."""
+        index = self._indexes.get(_index_key(root, exclude_dirs, exclude_patterns, ignore_files))
+        if index is None or not index.active:
+            return None
+        index.touch()
+        return index
+
+    def start(
+        self,
+        root: str,
+        exclude_dirs: Optional[Set[str]] = None,
+        exclude_patterns: Optional[List[str]] = None,
+        ignore_files: Sequence[str] = ()
+    ) -> LiveIndex:
+        """Return the index of root with these exclusions, starting it if there is no active one."""
+        key = _index_key(root, exclude_dirs, exclude_patterns, ignore_files)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None and index.active:
+                index.touch()
+                return index
+            index = LiveIndex(
+                root, exclude_dirs=exclude_dirs, exclude_patterns=exclude_patterns, ignore_files=ignore_files,
+                on_change=self.enforce_limit, **self.index_options
+            )
+            self._indexes[key] = index
+            index.start()
+        return index
+
+    def find(self, index_id: str) -> Optional[LiveIndex]:
+        """Return the index with this id, or None."""
+        return next((index for index in self._indexes.values() if index.id == index_id), None)
+
+    def stop(self, index_id: str) -> Optional[LiveIndex]:
+        """Stop and forget the index with this id; return it, or None if there is none."""
+        with self._lock:
+            for key, index in self._indexes.items():
+                if index.id == index_id:
+                    del self._indexes[key]
+                    index.stop()
+                    return index
+        return None
+
+    def indexes(self) -> List[LiveIndex]:
+        """Return every index, most recently used first."""
+        return sorted(self._indexes.values(), key=lambda index: index.last_used, reverse=True)
+
+    def memory_bytes(self) -> int:
+        return sum(index.memory_bytes for index in list(self._indexes.values()))
+
+    def enforce_limit(self, _changed: Optional[LiveIndex] = None):
+        """Evict the least recently used indexes while the estimated memory exceeds memory_limit."""
+        with self._lock:
+            by_use = sorted(self._indexes.items(), key=lambda item: item[1].last_used)
+            total = sum(index.memory_bytes for _, index in by_use)
+            for key, index in by_use:
+                if total <= self.memory_limit:
+                    break
+                total -= index.memory_bytes
+                del self._indexes[key]
+                index.stop('evicted')
+
+    def close(self):
+        """Stop every index."""
+        with self._lock:
+            for index in self._indexes.values():
+                index.stop()
+            self._indexes.clear()
@@ -0,0 +1,321 @@
+"""Selecting the files of a codebase that fit a model's context window: `token-counter pack`."""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from concurrent.futures import Executor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, TextIO, Tuple
+
+from .backends import resolve_model_tokenizer
+from .cache import TokenCache
+from .exclusions import PatternSet
+from .git_scan import clone_worktree
+from .token_counter import (
+    CONTEXT_WINDOWS, DEFAULT_BATCH_SIZE, DEFAULT_CHUNK_SIZE, MAX_SPLIT_TOKEN_ERROR, MODEL_TOKENIZERS, TOKENIZER_NAME,
+    ScanOptions, ScanProgress, add_exclusion_arguments, count_tokens_batch, decoded_chunks, exclusions_from_args,
+    format_number, ignore_files_from_args, iter_file_token_counts, scan_options, sparse_checkout_patterns
+)
+
+# Order of files within a priority tier: most recently modified first, fewest
+# tokens first (which fits the most files), or by path
+PACK_ORDERS = ('recent', 'small', 'path')
+PACK_FORMATS = ('text', 'json')
+
+# Markup around each file in a bundle; its tokens count against the budget
+BUNDLE_HEADER = '<file path="{path}">\n'
+BUNDLE_FOOTER = '\n</file>\n'
+# Tokens reserved per file for the seams between its text and its header and
+# footer, where tokens can merge; each changes the count by at most
+# MAX_SPLIT_TOKEN_ERROR (see count_tokens_streaming). The seam between one
+# file's footer and the next header ('>\n<') is a pre-tokenization boundary.
+BUNDLE_SEAM_TOKENS = 2 * MAX_SPLIT_TOKEN_ERROR
+
+# Large file policies of a pack; 'sample' would pack files by estimated counts
+PACK_LARGE_FILE_POLICIES = ('exact', 'skip')
+
+class PackFile(NamedTuple):
+    """A counted file that can be packed."""
+    path: str
+    # '/'-separated path relative to the packed directory
+    relative_path: str
+    tokens: int
+    # Tokens of the file's bundle header and footer, and BUNDLE_SEAM_TOKENS
+    overhead: int = 0
+    mtime_ns: Optional[int] = None
+
+    @property
+    def cost(self) -> int:
+        return self.tokens + self.overhead
+
+class PackResult(NamedTuple):
+    """Files selected by pack_files, by relative path."""
+    selected: List[PackFile]
+    # Tokens of the selected files, including bundle overhead; at least those of their bundle
+    tokens: int
+    budget: int
+    # Files considered, and those left out for lack of room or by max_file_tokens
+    files: int
+    skipped: int
+
+def parse_window(value: str) -> Tuple[int, Optional[str]]:
+    """
+    Return (tokens, model) of a context window given as a size or a model name.
+
+    Sizes are a number of tokens with an optional k or M suffix (128k,
+    1M); a model is any prefix of a CONTEXT_WINDOWS name, case-insensitive,
+    that only one model starts with.
+    """
+    size = re.fullmatch(r'(\d+(?:\.\d+)?)([kKmM]?)', value.strip())
+    if size:
+        number, suffix = size.groups()
+        scale = {'': 1, 'k': 1000, 'm': 1000 ** 2}[suffix.lower()]
+        return int(float(number) * scale), None
+    matches = [model for model in CONTEXT_WINDOWS if model.lower().startswith(value.strip().lower())]
+    exact = [model for model in matches if model.lower() == value.strip().lower()]
+    if len(exact) == 1 or len(matches) == 1:
+        model = (exact or matches)[0]
+        return CONTEXT_WINDOWS[model], model
+    if not matches:
+        raise ValueError(f"Unknown model or window size: {value}")
+    raise ValueError(f"Ambiguous model {value!r}: {', '.join(matches)}")
+
+def _priority_matchers(priorities: Sequence[str]) -> List[Tuple[PatternSet, PatternSet]]:
+    """Compile each priority glob as (name patterns, path patterns), as for exclusion patterns."""
+    matchers = []
+    for pattern in priorities:
+        pattern = pattern.replace(os.sep, '/')
+        if '/' in pattern:
+            # A directory pattern ('src/') covers everything below it
+            matchers.append((PatternSet(()), PatternSet([pattern + '*' if pattern.endswith('/') else pattern])))
+        else:
+            matchers.append((PatternSet([pattern]), PatternSet(())))
+    return matchers
+
+def pack_files(
+    files: Iterable[PackFile],
+    budget: int,
+    priorities: Sequence[str] = (),
+    order: str = 'recent',
+    max_file_tokens: Optional[int] = None
+) -> PackResult:
+    """
+    Select files whose tokens, with their bundle overhead, add up to at most budget.
+
+    Files are ranked by the first of the priorities (glob patterns, matched
+    against the file name or, with a '/', the relative path) they match,
+    then by order, and taken greedily: each file that still fits is added
+    and any that does not is passed over for smaller ones further down. A
+    file in a higher tier is therefore never left out for one in a lower
+    tier, and without priorities, order 'small' packs as many files as
+    possible. Ranking is one sort, so this is O(n log n) in the number of
+    files.
+
+    With the overhead of with_bundle_overhead, which reserves
+    BUNDLE_SEAM_TOKENS per file, the bundle of the selected files has at
+    most the result's tokens for GPT-2 style byte-level BPE tokenizers, and
+    usually a few fewer. Other tokenizers are not guaranteed to stay within
+    that bound.
+
+    Args:
+        files: Counted files, as from count_pack_files
+        budget: Tokens available
+        priorities: Glob patterns, most important first; unmatched files come last
+        order: One of PACK_ORDERS, ranking files within a tier
+        max_file_tokens: Leave out any file with more tokens than this
+
+    Returns:
+        PackResult with the selected files by relative path
+    """
+    if order not in PACK_ORDERS:
+        raise ValueError(f"Unknown pack order: {order}")
+    matchers = _priority_matchers(priorities)
+
+    def tier(file: PackFile) -> int:
+        name = file.relative_path.rpartition('/')[2]
+        for index, (names, paths) in enumerate(matchers):
+            if names.matches(name) or paths.matches(file.relative_path):
+                return index
+        return len(matchers)
+
+    if order == 'recent':
+        key = lambda file: (tier(file), -(file.mtime_ns or 0), file.relative_path)
+    elif order == 'small':
+        key = lambda file: (tier(file), file.cost, file.relative_path)
+    else:
+        key = lambda file: (tier(file), file.relative_path)
+    ranked = sorted(files, key=key)
+
+    selected = []
+    used = 0
+    for file in ranked:
+        if max_file_tokens is not None and file.tokens > max_file_tokens:
+            continue
+        if used + file.cost <= budget:
+            selected.append(file)
+            used += file.cost
+    selected.sort(key=lambda file: file.relative_path)
+    return PackResult(selected, used, budget, len(ranked), len(ranked) - len(selected))
+
+def count_pack_files(
+    repo_path: str,
+    options: Optional[ScanOptions] = None,
+    cache: Optional[TokenCache] = None,
+    progress: Optional[ScanProgress] = None,
+    executor: Optional[Executor] = None,
+    **settings
+) -> List[PackFile]:
+    """
+    Count a directory's files in one scan and return them, with their bundle overhead, for pack_files.
+
+    Files are counted with the options' primary tokenizer only, and large
+    files exactly under the 'sample' policy, since a pack's budget only holds
+    for exact counts. Arguments, and settings overriding options, are as for
+    process_repository.
+    """
+    options = scan_options(options, **settings)._replace(extra_tokenizers=())
+    if options.large_file_policy not in PACK_LARGE_FILE_POLICIES:
+        options = options._replace(large_file_policy='exact')
+    root = repo_path if os.path.isdir(repo_path) else os.path.dirname(repo_path)
+    files = []
+    for record in iter_file_token_counts(repo_path, options, cache=cache, progress=progress, executor=executor):
+        if record.error is None:
+            relative_path = os.path.relpath(record.path, root).replace(os.sep, '/')
+            files.append(PackFile(record.path, relative_path, record.tokens, 0, record.mtime_ns))
+    return with_bundle_overhead(files, options.tokenizer)
+
+def with_bundle_overhead(files: Sequence[PackFile], tokenizer: str = TOKENIZER_NAME) -> List[PackFile]:
+    """
+    Return files with the tokens of their bundle header and footer, and BUNDLE_SEAM_TOKENS, as overhead.
+
+    Headers are counted in one batch. The header and footer are counted
+    apart, as the file's text comes between them in the bundle.
+    """
+    if not files:
+        return []
+    headers = count_tokens_batch([BUNDLE_HEADER.format(path=file.relative_path) for file in files], tokenizer)
+    footer = count_tokens_batch([BUNDLE_FOOTER], tokenizer)[0]
+    return [file._replace(overhead=header + footer + BUNDLE_SEAM_TOKENS) for file, header in zip(files, headers)]
+
+def iter_bundle(files: Iterable[PackFile], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Yield the text of a bundle of files, each between BUNDLE_HEADER and BUNDLE_FOOTER.
+
+    Files are read chunk_size bytes at a time, decoded as they were for
+    counting, so memory does not depend on their size.
+    """
+    for file in files:
+        yield BUNDLE_HEADER.format(path=file.relative_path)
+        with open(file.path, 'rb') as reader:
+            yield from decoded_chunks(reader, chunk_size)
+        yield BUNDLE_FOOTER
+
+def write_bundle(files: Iterable[PackFile], output: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Write the bundle of files to output as it is read."""
+    for text in iter_bundle(files, chunk_size):
+        output.write(text)
+
+def write_pack_json(result: PackResult, output: TextIO, window: int, model: Optional[str], tokenizer: str):
+    json.dump({
+        'window': window,
+        'model': model,
+        'tokenizer': tokenizer,
+        'budget': result.budget,
+        'tokens': result.tokens,
+        'files': [{'path': file.relative_path, 'tokens': file.tokens} for file in result.selected],
+        'skipped': result.skipped,
+    }, output, indent=2)
+    output.write('\n')
+
+def pack_main(argv: List[str]):
+    """Entry point of `token-counter pack`."""
+    parser = argparse.ArgumentParser(
+        prog='token-counter pack',
+        description='Select the files that fit a model context window, and list or bundle them.'
+    )
+    parser.add_argument('target', help='Local directory or remote repository URL')
+    parser.add_argument('--window', required=True,
+                        help="Context window: a size in tokens (128k, 1M) or a model, e.g. 'Claude 3 Opus'")
+    parser.add_argument('--reserve', type=int, default=0, metavar='TOKENS',
+                        help='Tokens to leave free for instructions and the answer (default: 0)')
+    parser.add_argument('--priority', action='append', default=[], metavar='GLOB',
+                        help="Pack files matching GLOB first (repeatable, most important first), e.g. 'src/' or '*.py'")
+    parser.add_argument('--order', choices=PACK_ORDERS, default='recent',
+                        help='Order within a priority: most recently modified, fewest tokens, or path (default: recent)')
+    parser.add_argument('--max-file-tokens', type=int, metavar='TOKENS', help='Leave out files with more tokens')
+    parser.add_argument('--format', choices=PACK_FORMATS, default='text',
+                        help='List the selected paths one per line, or as JSON with their tokens (default: text)')
+    parser.add_argument('--output', help='Write the list to this file instead of stdout')
+    parser.add_argument('--bundle', metavar='FILE', help='Also write the selected files, concatenated, to FILE')
+    parser.add_argument('--workers', type=int, default=1, help='Tokenizer processes (0: one per CPU)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Files per tokenizer batch')
+    parser.add_argument('--cache', nargs='?', const='', default=None,
+                        help='Cache counts in this directory (default cache without a value)')
+    parser.add_argument('--max-file-size', type=int, metavar='BYTES', help='Size above which --large-files applies')
+    parser.add_argument('--large-files', choices=PACK_LARGE_FILE_POLICIES, default='exact',
+                        help='Count larger files exactly (default) or skip them')
+    parser.add_argument('--tokenizer', default=TOKENIZER_NAME,
+                        help="Tokenizer to count with when the window's model has none available")
+    add_exclusion_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        window, model = parse_window(args.window)
+    except ValueError as e:
+        parser.error(str(e))
+    exclude_dirs, exclude_patterns = exclusions_from_args(args)
+    tokenizer = resolve_model_tokenizer(MODEL_TOKENIZERS.get(model), args.tokenizer) if model else args.tokenizer
+
+    from rich.console import Console
+    # stdout carries the list
+    console = Console(stderr=True)
+    temp_dir = None
+    cache = TokenCache(args.cache or None) if args.cache is not None else None
+    try:
+        repo_path = args.target
+        if not os.path.isdir(repo_path):
+            # The bundle needs the files, so a worktree is checked out
+            console.print(f"[yellow]Cloning repository: {repo_path}[/yellow]")
+            temp_dir = tempfile.mkdtemp()
+            clone_worktree(repo_path, temp_dir, sparse_patterns=sparse_checkout_patterns(exclude_dirs, exclude_patterns))
+            repo_path = temp_dir
+
+        options = ScanOptions(
+            exclude_dirs=exclude_dirs,
+            exclude_patterns=exclude_patterns,
+            ignore_files=ignore_files_from_args(args),
+            tokenizer=tokenizer,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            max_file_size=args.max_file_size,
+            large_file_policy=args.large_files
+        )
+        files = count_pack_files(repo_path, options, cache=cache)
+        result = pack_files(files, max(0, window - args.reserve), args.priority, args.order, args.max_file_tokens)
+        output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        try:
+            if args.format == 'json':
+                write_pack_json(result, output, window, model, tokenizer)
+            else:
+                for file in result.selected:
+                    output.write(file.relative_path + '\n')
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if args.bundle:
+            with open(args.bundle, 'w', encoding='utf-8') as bundle:
+                write_bundle(result.selected, bundle)
+    except Exception as e:
+        console.print(f"[red]Error packing files: {str(e)}[/red]")
+        sys.exit(1)
+    finally:
+        if cache is not None:
+            cache.close()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    console.print(
+        f"[green]Packed {len(result.selected):,} of {result.files:,} files, "
+        f"{format_number(result.tokens)} of {format_number(result.budget)} tokens ({tokenizer})[/green]"
+    )
@@ -0,0 +1,75 @@
+"""Per-file token reports for pipelines: `token-counter --format json|jsonl|csv`."""
+
+import csv
+import json
+import os
+from typing import Dict, TextIO
+
+from .token_counter import REPORT_FORMATS, FileTokenCount
+
+# Fields of every per-file row
+REPORT_FIELDS = ('path', 'extension', 'bytes', 'tokens', 'cached', 'error')
+
+def _csv_cell(value: object) -> object:
+    """Return value for a CSV cell: empty if missing, and booleans as JSON writes them."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+class FileReportWriter:
+    """
+    Writes per-file records to a text stream as they are counted.
+
+    Rows are written and flushed one at a time, so memory stays flat however
+    many files are scanned. 'jsonl' writes one object per file and 'csv' one
+    row per file; 'json' writes a single object whose file_tokens array is
+    streamed, followed by the totals once finish() is called.
+    Paths are '/'-separated and relative to root.
+    """
+
+    def __init__(self, output: TextIO, report_format: str, root: str):
+        if report_format not in REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {report_format}")
+        self.output = output
+        self.format = report_format
+        self.root = root if os.path.isdir(root) else os.path.dirname(root)
+        self.rows = 0
+        self._csv = None
+        if report_format == 'csv':
+            self._csv = csv.writer(output)
+            self._csv.writerow(REPORT_FIELDS)
+        elif report_format == 'json':
+            output.write('{"file_tokens": [')
+
+    def _row(self, record: FileTokenCount) -> Dict[str, object]:
+        return {
+            'path': os.path.relpath(record.path, self.root).replace(os.sep, '/'),
+            'extension': record.extension,
+            'bytes': record.size,
+            'tokens': None if record.error is not None else record.tokens,
+            'cached': record.cached,
+            'error': record.error,
+        }
+
+    def write(self, record: FileTokenCount):
+        """Write one file's row; usable as process_repository's on_record."""
+        row = self._row(record)
+        if self._csv is not None:
+            self._csv.writerow([_csv_cell(row[field]) for field in REPORT_FIELDS])
+        elif self.format == 'json':
+            self.output.write(',\n' if self.rows else '\n')
+            self.output.write(json.dumps(row, sort_keys=True))
+        else:
+            self.output.write(json.dumps(row, sort_keys=True) + '\n')
+        self.rows += 1
+        self.output.flush()
+
+    def finish(self, total_tokens: int, extension_stats: Dict[str, int], file_counts: Dict[str, int]):
+        """End the report; only 'json' includes the totals, as process_repository returns them."""
+        if self.format == 'json':
+            totals = json.dumps({'total_tokens': total_tokens, 'extensions': extension_stats, 'files': file_counts}, sort_keys=True)
+            # Append the totals' keys to the object opened in __init__
+            self.output.write(f"\n], {totals[1:]}\n")
+        self.output.flush()
@@ -10,30 +10,65 @@
 # ]
 # ///
 
+import argparse
 import os
 import sys
+import codecs
+import contextlib
 import shutil
 import tempfile
 import warnings
-import fnmatch
-from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Set
+import io
+import hashlib
+import mmap
+import sqlite3
+import stat
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Optional, Sequence, Set
 
 # Set environment variable to suppress transformers warnings
 os.environ['TRANSFORMERS_VERBOSITY'] = 'error'
 
-from git import Repo
-from tqdm import tqdm
-from transformers import AutoTokenizer
-from rich.console import Console
-from rich.table import Table
-from rich.progress import track
-from rich import print as rprint
-
-# Initialize the console and tokenizer
+from .backends import DEFAULT_TOKENIZER, get_backend, resolve_model_tokenizer
+from .cache import CommitCounts, TokenCache, lookup_digest_counts
+from .exclusions import EXCLUDE_PRESETS, ExclusionMatcher, preset_exclusions
+from .dir_tree import DirectoryTree
+from .file_stats import DEFAULT_TOP_FILES, TokenHistogram, TopFiles
+from .ignore_files import IgnoreRules
+from .git_scan import (
+    clone_for_scan, clone_worktree, iter_tree, iter_tree_changes, read_blob_sizes, read_blobs, resolve_commit, update_mirror
+)
+
+# git, rich and transformers are imported on first use so that importing the
+# package, and `token-counter -total`, start without paying for them.
 warnings.filterwarnings('ignore')
-console = Console()
-tokenizer = AutoTokenizer.from_pretrained("gpt2")
+
+# Tokenizer used for counting unless another one is requested (see backends)
+TOKENIZER_NAME = DEFAULT_TOKENIZER
+
+_console = None
+
+def get_console():
+    """Return the shared rich console, creating it on first use."""
+    global _console
+    if _console is None:
+        from rich.console import Console
+        _console = Console()
+    return _console
+
+def export_tokenizer(output_path: str):
+    """
+    Serialize the Hugging Face tokenizer to a tokenizer.json for offline, fast loading.
+
+    This is the one step that may download the tokenizer; counting only loads local files.
+    """
+    from transformers import AutoTokenizer
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    AutoTokenizer.from_pretrained(TOKENIZER_NAME).backend_tokenizer.save(output_path)
 
 # File extensions mapped to their technologies
 FILE_EXTENSIONS = {
@@ -209,18 +244,585 @@ FILE_EXTENSIONS = {
 # Set of all text extensions for quick lookup
 TEXT_EXTENSIONS = set(FILE_EXTENSIONS.keys())
 
-def is_binary(file_path: str) -> bool:
-    """Check if a file is binary."""
+# Number of files read and tokenized together in one batched tokenizer call
+DEFAULT_BATCH_SIZE = 32
+
+# Files at least this large are memory-mapped and tokenized in chunks instead of being read whole
+STREAM_THRESHOLD = 8 * 1024 * 1024
+# Bytes per chunk when streaming a large file
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Bytes at the start of a file that decide whether it is text or binary (the
+# amount a text-mode read decodes up front, as the check before single reads did)
+BINARY_SNIFF_SIZE = 8192
+# Upper bound on the count error from one forced chunk split (see count_tokens_streaming)
+MAX_SPLIT_TOKEN_ERROR = 4
+
+# What to do with files above max_file_size: stream them exactly, skip them,
+# or estimate them from SAMPLE_WINDOWS windows of SAMPLE_WINDOW_SIZE bytes
+LARGE_FILE_POLICIES = ('exact', 'skip', 'sample')
+SAMPLE_WINDOWS = 16
+SAMPLE_WINDOW_SIZE = 64 * 1024
+
+# Per-file report formats of the CLI (see report.FileReportWriter)
+REPORT_FORMATS = ('json', 'jsonl', 'csv')
+
+# Context windows of popular models, compared against the total in the CLI output
+CONTEXT_WINDOWS = {
+    # OpenAI Models
+    "GPT-3.5 (4K)": 4096,
+    "GPT-4 (8K)": 8192,
+    "GPT-4 (32K)": 32768,
+    "GPT-4 Turbo (128K)": 128000,
+
+    # Anthropic Models
+    "Claude 2 (100K)": 100000,
+    "Claude 3 Opus (200K)": 200000,
+    "Claude 3 Sonnet (200K)": 200000,
+    "Claude 3 Haiku (200K)": 200000,
+
+    # Google Models
+    "Gemini Pro (32K)": 32768,
+    "PaLM 2 (8K)": 8192,
+
+    # Meta Models
+    "Llama 2 (4K)": 4096,
+    "Code Llama (100K)": 100000,
+
+    # Other Models
+    "Mistral Large (32K)": 32768,
+    "Mixtral 8x7B (32K)": 32768,
+    "Yi-34B (200K)": 200000,
+    "Cohere Command (128K)": 128000,
+}
+
+# Tokenizer matching each model in CONTEXT_WINDOWS, when one is public. A model's
+# usage is computed with its tokenizer if that is available locally (see
+# backends.TOKENIZER_DIR), otherwise with the primary tokenizer as an approximation.
+MODEL_TOKENIZERS = {
+    "GPT-3.5 (4K)": "cl100k_base",
+    "GPT-4 (8K)": "cl100k_base",
+    "GPT-4 (32K)": "cl100k_base",
+    "GPT-4 Turbo (128K)": "cl100k_base",
+    "Llama 2 (4K)": "llama2",
+    "Code Llama (100K)": "codellama",
+    "Mistral Large (32K)": "mistral",
+    "Mixtral 8x7B (32K)": "mixtral",
+    "Yi-34B (200K)": "yi",
+    "Cohere Command (128K)": "command",
+}
+
+def _looks_binary(sample: bytes, complete: bool) -> bool:
+    """
+    Return True if the first bytes of a file contain a NUL byte or are not valid UTF-8.
+
+    complete is False when the file continues past the sample, in which case a
+    multi-byte character cut off at the end of the sample is allowed.
+    """
+    if b'\0' in sample:
+        return True
     try:
-        with open(file_path, 'tr') as check_file:
-            check_file.read(1024)
-            return False
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=complete)
     except UnicodeDecodeError:
         return True
+    return False
+
+def is_binary(file_path: str) -> bool:
+    """Check if a file is binary."""
+    with open(file_path, 'rb') as check_file:
+        sample = check_file.read(BINARY_SNIFF_SIZE + 1)
+    return _looks_binary(sample[:BINARY_SNIFF_SIZE], len(sample) <= BINARY_SNIFF_SIZE)
+
+def count_tokens(content: str, tokenizer: str = TOKENIZER_NAME) -> int:
+    """Count tokens in the given content using GPT-2 tokenizer, or another registered tokenizer."""
+    return get_backend(tokenizer).count(content)
+
+def count_tokens_batch(contents: List[str], tokenizer: str = TOKENIZER_NAME) -> List[int]:
+    """Count tokens for several strings with a single batched tokenizer call."""
+    return get_backend(tokenizer).count_batch(contents)
+
+def _count_all(contents: List[str], tokenizers: Sequence[str]) -> List[Dict[str, int]]:
+    """Count each content with every tokenizer, returning one {tokenizer: tokens} dict per content."""
+    counts: List[Dict[str, int]] = [{} for _ in contents]
+    for name in tokenizers:
+        for file_counts, tokens in zip(counts, count_tokens_batch(contents, name)):
+            file_counts[name] = tokens
+    return counts
+
+def _decode_text(raw: bytes) -> str:
+    """Decode file bytes exactly like open(..., 'r', encoding='utf-8', errors='replace').read()."""
+    return raw.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+def _find_split(text: str, start: int) -> Tuple[int, bool]:
+    """
+    Return (index, exact) for the last safe position at or after start to split text.
+
+    Safe positions are right after a single newline between two non-whitespace
+    characters, and right before a single space between two non-whitespace
+    characters. For GPT-2 style byte-level BPE both are pre-tokenization
+    boundaries; a newline after a blank line or trailing whitespace is not,
+    since the whitespace run before it is split differently when cut there. If
+    there is none, the text is split at its end and exact is False.
+    """
+    start = max(start, 1)
+    pos = text.rfind('\n', start - 1, len(text) - 1)
+    while pos > 0:
+        if not text[pos - 1].isspace() and not text[pos + 1].isspace():
+            return pos + 1, True
+        pos = text.rfind('\n', start - 1, pos)
+
+    pos = text.rfind(' ', start, len(text) - 1)
+    while pos != -1:
+        if not text[pos - 1].isspace() and not text[pos + 1].isspace():
+            return pos, True
+        pos = text.rfind(' ', start, pos)
+
+    return len(text), False
+
+def decoded_chunks(reader, chunk_size: int) -> Iterator[str]:
+    """
+    Decode a binary file or mmap chunk_size bytes at a time.
+
+    The text is the same as reading the file with open(..., 'r',
+    encoding='utf-8', errors='replace'), including newline translation across
+    chunk boundaries. Each chunk has at most chunk_size characters. Whatever
+    writes out counted files (e.g. a pack bundle) decodes them with this, so
+    the text written is the text that was counted.
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(errors='replace'), translate=True)
+    for raw in iter(lambda: reader.read(chunk_size), b''):
+        text = decoder.decode(raw)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def _count_text_chunks(chunks: Iterable[str], chunk_size: int, tokenizers: Sequence[str] = (TOKENIZER_NAME,)) -> Tuple[Dict[str, int], int]:
+    """
+    Tokenize text chunks of at most chunk_size characters with each of the given tokenizers.
+
+    Returns ({tokenizer: tokens}, forced_splits). At most two chunks of text
+    are held in memory at a time.
+    """
+    counts = dict.fromkeys(tokenizers, 0)
+    forced_splits = 0
+    carry = ''
+    for chunk in chunks:
+        text = carry + chunk
+        # Only look for a boundary in the last chunk_size characters, so the
+        # carried remainder never grows beyond one chunk
+        split, exact = _find_split(text, len(text) - chunk_size)
+        if not exact:
+            forced_splits += 1
+        for name in tokenizers:
+            counts[name] += count_tokens(text[:split], name)
+        carry = text[split:]
+    if carry:
+        for name in tokenizers:
+            counts[name] += count_tokens(carry, name)
+    # The split after the final chunk is not a real split
+    if forced_splits and not carry:
+        forced_splits -= 1
+    return counts, forced_splits
+
+def count_tokens_streaming(file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, tokenizer: str = TOKENIZER_NAME) -> int:
+    """
+    Count tokens in a file by tokenizing it in chunks of chunk_size bytes, with bounded memory.
+
+    Chunks are cut after a single newline, or before a single space, between two
+    non-whitespace characters. For GPT-2 style byte-level BPE
+    these are pre-tokenization boundaries, so the result equals count_tokens() on
+    the whole file exactly. Only when the last chunk_size characters of a chunk
+    contain no such position (minified or base64 content) is the chunk cut where it
+    ends; each of those forced splits changes the count by at most
+    MAX_SPLIT_TOKEN_ERROR tokens. Other tokenizers use the same split points,
+    which are not guaranteed to be exact boundaries for them.
+    """
+    with open(file_path, 'rb') as f:
+        return _count_text_chunks(decoded_chunks(f, chunk_size), chunk_size, (tokenizer,))[0][tokenizer]
+
+def estimate_tokens_sampled(
+    file_path: str,
+    windows: int = SAMPLE_WINDOWS,
+    window_size: int = SAMPLE_WINDOW_SIZE,
+    tokenizer: str = TOKENIZER_NAME
+) -> int:
+    """
+    Estimate the tokens in a large file from evenly spaced samples.
+
+    Reads `windows` windows of `window_size` bytes, trims each to whole lines,
+    tokenizes them, and extrapolates by the file size. Files no larger than the
+    total sample size are counted exactly.
+    """
+    with open(file_path, 'rb') as f:
+        return _estimate_sampled_counts(f, os.fstat(f.fileno()).st_size, (tokenizer,), windows, window_size)[tokenizer]
+
+def _estimate_sampled_counts(
+    f,
+    size: int,
+    tokenizers: Sequence[str],
+    windows: int = SAMPLE_WINDOWS,
+    window_size: int = SAMPLE_WINDOW_SIZE
+) -> Dict[str, int]:
+    """estimate_tokens_sampled for several tokenizers over the same samples of an open binary file or mmap."""
+    if size <= windows * window_size:
+        return _count_text_chunks(decoded_chunks(f, DEFAULT_CHUNK_SIZE), DEFAULT_CHUNK_SIZE, tokenizers)[0]
+
+    step = size // windows
+    samples = []
+    sampled_bytes = 0
+    for i in range(windows):
+        f.seek(i * step)
+        raw = f.read(window_size)
+        # Drop partial lines at both ends of the window
+        start = raw.find(b'\n') + 1 if i > 0 else 0
+        end = raw.rfind(b'\n') + 1 or len(raw)
+        if start < end:
+            samples.append(_decode_text(raw[start:end]))
+            sampled_bytes += end - start
+
+    if not sampled_bytes:
+        return dict.fromkeys(tokenizers, 0)
+    return {
+        name: round(sum(count_tokens_batch(samples, name)) * size / sampled_bytes)
+        for name in tokenizers
+    }
+
+def _file_digest(f) -> str:
+    """Return the SHA-256 hex digest of an open binary file or mmap, and rewind it."""
+    if isinstance(f, mmap.mmap):
+        # Hashes the mapped pages in place, without copying them
+        return hashlib.sha256(f).hexdigest()
+    digest = hashlib.sha256()
+    for block in iter(lambda: f.read(1024 * 1024), b''):
+        digest.update(block)
+    f.seek(0)
+    return digest.hexdigest()
+
+def _lookup_cached_digest(cache_path: str, tokenizers: Sequence[str], digest: str) -> Optional[Dict[str, int]]:
+    """Look up a content digest in the cache database, treating a locked or unreadable database as a miss."""
+    try:
+        return lookup_digest_counts(cache_path, tokenizers, digest)
+    except sqlite3.OperationalError:
+        return None
+
+class _CountSettings(NamedTuple):
+    """How _count_file_batch reads and tokenizes files; passed to worker processes."""
+    # Tokenizers every file is counted with; the first is the primary one
+    tokenizers: Tuple[str, ...] = (TOKENIZER_NAME,)
+    # Cache database path for content-digest lookups
+    cache_path: Optional[str] = None
+    # Files at least this large are streamed in chunks of chunk_size bytes
+    stream_threshold: int = STREAM_THRESHOLD
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    # Files larger than this are estimated from samples instead of counted
+    sample_above: Optional[int] = None
+
+class ScanOptions(NamedTuple):
+    """
+    The settings of a scan: which files it selects and how it counts them.
+
+    process_repository, iter_file_token_counts and the tools built on them
+    take one ScanOptions instead of every setting, and also accept each
+    setting by name, overriding the options (see scan_options). The fields
+    are documented with process_repository's arguments.
+    """
+    exclude_dirs: Optional[Set[str]] = None
+    exclude_patterns: Optional[List[str]] = None
+    ignore_files: Sequence[str] = ()
+    tokenizer: str = TOKENIZER_NAME
+    extra_tokenizers: Sequence[str] = ()
+    workers: Optional[int] = 1
+    batch_size: int = DEFAULT_BATCH_SIZE
+    walk_threads: int = 1
+    max_file_size: Optional[int] = None
+    large_file_policy: str = 'exact'
+    stream_threshold: int = STREAM_THRESHOLD
+
+    @property
+    def tokenizers(self) -> Tuple[str, ...]:
+        """The primary tokenizer, then the extra ones, without duplicates."""
+        return tuple(dict.fromkeys((self.tokenizer, *self.extra_tokenizers)))
+
+    @property
+    def skip_above(self) -> Optional[int]:
+        """Size above which files are left out, with the 'skip' policy."""
+        return self.max_file_size if self.large_file_policy == 'skip' else None
+
+    def count_settings(self, cache_path: Optional[str] = None) -> _CountSettings:
+        """Return the part of the options that worker processes count files with."""
+        return _CountSettings(
+            tokenizers=self.tokenizers,
+            cache_path=cache_path,
+            stream_threshold=self.stream_threshold,
+            sample_above=self.max_file_size if self.large_file_policy == 'sample' else None
+        )
+
+def scan_options(options: Optional[ScanOptions] = None, **settings) -> ScanOptions:
+    """
+    Return options (the defaults if None) with the named settings replaced.
+
+    Raises TypeError for a name that is not a ScanOptions field, and
+    ValueError for an unknown large_file_policy.
+    """
+    unknown = sorted(set(settings) - set(ScanOptions._fields))
+    if unknown:
+        raise TypeError(f"Unknown scan settings: {', '.join(unknown)}")
+    options = (ScanOptions() if options is None else options)._replace(**settings)
+    if options.large_file_policy not in LARGE_FILE_POLICIES:
+        raise ValueError(f"Unknown large file policy: {options.large_file_policy}")
+    return options
+
+# Per-file result of _count_file_batch:
+# ({tokenizer: tokens}, content digest, reused from cache, error).
+# The counts are None for a binary file, which is left out of the scan.
+FileResult = Tuple[Optional[Dict[str, int]], Optional[str], bool, Optional[str]]
+
+_BINARY_RESULT: FileResult = (None, None, False, None)
+
+def _map_file(f):
+    """Return a read-only mmap of an open file, or the file itself if it cannot be mapped."""
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return f
+
+def _count_large_file(f, size: int, settings: _CountSettings) -> FileResult:
+    """Count an open binary file that is too large to read whole, or that is sampled."""
+    source = _map_file(f)
+    try:
+        sample = source.read(BINARY_SNIFF_SIZE)
+        source.seek(0)
+        if _looks_binary(sample, size <= BINARY_SNIFF_SIZE):
+            return _BINARY_RESULT
+        if settings.sample_above is not None and size > settings.sample_above:
+            return _estimate_sampled_counts(source, size, settings.tokenizers), None, False, None
+
+        digest = None
+        if settings.cache_path is not None:
+            digest = _file_digest(source)
+            counts = _lookup_cached_digest(settings.cache_path, settings.tokenizers, digest)
+            if counts is not None:
+                return counts, digest, True, None
+        counts, _ = _count_text_chunks(decoded_chunks(source, settings.chunk_size), settings.chunk_size, settings.tokenizers)
+        return counts, digest, False, None
+    finally:
+        if source is not f:
+            source.close()
+
+def _count_file_batch(file_paths: List[str], settings: _CountSettings = _CountSettings()) -> List[FileResult]:
+    """
+    Read and tokenize a batch of files.
+
+    Runs either in-process or inside a worker process. Each file is opened
+    once: its first BINARY_SNIFF_SIZE bytes decide whether it is binary, and
+    the bytes already read are decoded and tokenized. Small files are read
+    whole and tokenized together in one batched call; files of at least
+    settings.stream_threshold bytes are memory-mapped and streamed, and files
+    above settings.sample_above are estimated from samples (their digest is
+    None so the estimate is never cached). Every file is counted with each of
+    settings.tokenizers. When settings.cache_path is given, each file's
+    content digest is looked up in the cache first, so only unseen contents
+    are tokenized. Returns one ({tokenizer: tokens}, digest, content_hit,
+    error) tuple per input path; error is None on success, and the counts
+    are None for binary files.
+    """
+    results: List[FileResult] = [({}, None, False, None)] * len(file_paths)
+    contents = []
+    pending = []
+    for i, file_path in enumerate(file_paths):
+        try:
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= settings.stream_threshold or (settings.sample_above is not None and size > settings.sample_above):
+                    results[i] = _count_large_file(f, size, settings)
+                    continue
+                raw = f.read()
+        except Exception as e:
+            results[i] = ({}, None, False, str(e))
+            continue
+
+        if _looks_binary(raw[:BINARY_SNIFF_SIZE], len(raw) <= BINARY_SNIFF_SIZE):
+            results[i] = _BINARY_RESULT
+            continue
+        digest = None
+        if settings.cache_path is not None:
+            digest = hashlib.sha256(raw).hexdigest()
+            counts = _lookup_cached_digest(settings.cache_path, settings.tokenizers, digest)
+            if counts is not None:
+                results[i] = (counts, digest, True, None)
+                continue
+        contents.append(_decode_text(raw))
+        pending.append((i, digest))
 
-def count_tokens(content: str) -> int:
-    """Count tokens in the given content using GPT-2 tokenizer."""
-    return len(tokenizer.encode(content))
+    for (i, digest), counts in zip(pending, _count_all(contents, settings.tokenizers)):
+        results[i] = (counts, digest, False, None)
+    return results
+
+def _count_blob_batch(blobs: List[bytes], settings: _CountSettings = _CountSettings()) -> List[FileResult]:
+    """
+    Tokenize a batch of file contents read from git objects.
+
+    Like _count_file_batch, but for contents already in memory: binary contents
+    get counts None, contents of at least settings.stream_threshold bytes are
+    tokenized in chunks, and contents above settings.sample_above are estimated
+    from samples. Digests are always None; blobs are identified by their SHA.
+    """
+    results: List[FileResult] = [({}, None, False, None)] * len(blobs)
+    contents = []
+    pending = []
+    for i, raw in enumerate(blobs):
+        size = len(raw)
+        if _looks_binary(raw[:BINARY_SNIFF_SIZE], size <= BINARY_SNIFF_SIZE):
+            results[i] = _BINARY_RESULT
+        elif settings.sample_above is not None and size > settings.sample_above:
+            results[i] = (_estimate_sampled_counts(io.BytesIO(raw), size, settings.tokenizers), None, False, None)
+        elif size >= settings.stream_threshold:
+            chunks = decoded_chunks(io.BytesIO(raw), settings.chunk_size)
+            results[i] = (_count_text_chunks(chunks, settings.chunk_size, settings.tokenizers)[0], None, False, None)
+        else:
+            contents.append(_decode_text(raw))
+            pending.append(i)
+
+    for i, counts in zip(pending, _count_all(contents, settings.tokenizers)):
+        results[i] = (counts, None, False, None)
+    return results
+
+class _BatchCounter:
+    """
+    Counts batches of files in order, in-process or across worker processes.
+
+    submit() returns the batches whose results are ready, in submission order,
+    as (batch, results) pairs, where batch is a list of (file_path, ...) tuples
+    and results the matching _count_file_batch results. At most 2 * workers
+    batches are in flight, so memory stays bounded however many files are
+    submitted. finish() returns the remaining batches. A scan that produces a
+    single batch is counted in-process without starting any workers.
+    count_batch replaces _count_file_batch, e.g. with _count_blob_batch for
+    (content, ...) tuples. A shared executor (see create_tokenizer_pool) is
+    used as is and left running by close().
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        settings: _CountSettings = _CountSettings(),
+        count_batch=_count_file_batch,
+        executor: Optional[Executor] = None
+    ):
+        self.workers = workers
+        self.settings = settings
+        self.count_batch = count_batch
+        self._executor = executor
+        self._owns_executor = executor is None
+        # (batch, future) pairs; the future is None for a batch counted in-process
+        self._in_flight = deque()
+
+    def _count(self, batch) -> List[FileResult]:
+        return self.count_batch([item[0] for item in batch], self.settings)
+
+    def _start(self, batch):
+        return self._executor.submit(self.count_batch, [item[0] for item in batch], self.settings)
+
+    def submit(self, batch) -> List[Tuple[list, List[FileResult]]]:
+        if self.workers <= 1:
+            return [(batch, self._count(batch))]
+        if self._executor is None:
+            if not self._in_flight:
+                # Held back until a second batch shows that workers are worth starting
+                self._in_flight.append((batch, None))
+                return []
+            self._executor = create_tokenizer_pool(self.workers)
+            held, _ = self._in_flight.popleft()
+            self._in_flight.append((held, self._start(held)))
+        self._in_flight.append((batch, self._start(batch)))
+
+        ready = []
+        while len(self._in_flight) > 2 * self.workers or (self._in_flight and self._in_flight[0][1].done()):
+            done_batch, future = self._in_flight.popleft()
+            ready.append((done_batch, future.result()))
+        return ready
+
+    def finish(self) -> List[Tuple[list, List[FileResult]]]:
+        ready = []
+        while self._in_flight:
+            batch, future = self._in_flight.popleft()
+            ready.append((batch, future.result() if future is not None else self._count(batch)))
+        return ready
+
+    def close(self):
+        """Stop the workers, dropping batches that have not started (e.g. on cancel)."""
+        if not self._owns_executor:
+            for _, future in self._in_flight:
+                if future is not None:
+                    future.cancel()
+            self._in_flight.clear()
+            return
+        self._in_flight.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+def create_tokenizer_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Start a pool of tokenizer processes.
+
+    Pass it as process_repository's executor to share it between scans, e.g. of
+    several repositories, instead of starting new processes for each scan.
+    """
+    # 'spawn' gives every worker its own freshly loaded tokenizer instead of a
+    # forked copy of the parent's Rust tokenizer state.
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def resolve_workers(workers: Optional[int]) -> int:
+    """Return the effective worker count; None or values below 1 mean one per CPU."""
+    if workers is None or workers < 1:
+        return os.cpu_count() or 1
+    return workers
+
+class ScanCancelled(Exception):
+    """Raised by process_repository when its ScanProgress is cancelled."""
+
+class ScanProgress:
+    """
+    Live progress of a process_repository call, readable from other threads.
+
+    files_discovered counts files found while walking, files_to_process the
+    files selected for counting (binary files drop out once read), and files_tokenized / bytes_processed the
+    files counted so far (including cache hits). cancel() makes the scan stop
+    at its next checkpoint and raise ScanCancelled.
+    """
+
+    def __init__(self):
+        self.stage = 'pending'
+        self.files_discovered = 0
+        self.files_to_process = 0
+        self.files_tokenized = 0
+        self.bytes_processed = 0
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        """Raise ScanCancelled if cancel() was called."""
+        if self._cancelled.is_set():
+            raise ScanCancelled()
+
+    def snapshot(self) -> Dict[str, object]:
+        """Return the current counters as a dict."""
+        return {
+            'stage': self.stage,
+            'files_discovered': self.files_discovered,
+            'files_to_process': self.files_to_process,
+            'files_tokenized': self.files_tokenized,
+            'bytes_processed': self.bytes_processed,
+        }
 
 def format_number(num: int) -> str:
     """Format a number with thousands separator and appropriate suffix."""
@@ -230,22 +832,708 @@ def format_number(num: int) -> str:
         return f"{num/1_000_000:.1f}M"
     return f"{num:,}"
 
+class FileTokenCount(NamedTuple):
+    """Per-file record yielded by iter_file_token_counts."""
+    path: str
+    # Lower-cased extension ('.no_extension' if none); None if the file could not be classified
+    extension: Optional[str]
+    # Token count of the primary tokenizer
+    tokens: int
+    # Token count of every requested tokenizer, by name
+    counts: Dict[str, int]
+    # File size in bytes, if known
+    size: Optional[int]
+    # True if the counts came from the cache instead of tokenizing
+    cached: bool
+    # Why the file was not counted, or None on success
+    error: Optional[str]
+    # Modification time of a worktree file, if known
+    mtime_ns: Optional[int] = None
+
+def _file_extension(file_path: str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    return extension or '.no_extension' # Use special key for files without extension
+
+def scan_directory(path: str) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """
+    List a directory once with os.scandir and split it into (dirs, files).
+
+    Entry types come from the directory listing itself where the OS provides
+    them, so no per-entry stat is needed. Symlinks to directories count as
+    directories. Raises OSError if the directory cannot be listed.
+    """
+    dirs = []
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            (dirs if is_dir else files).append(entry)
+    return dirs, files
+
+def _list_walk_directory(path: str) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """scan_directory for walking: unreadable directories are skipped, as os.walk does."""
+    try:
+        return scan_directory(path)
+    except OSError:
+        return [], []
+
+def walk_files(
+    repo_path: str,
+    matcher: Optional[ExclusionMatcher] = None,
+    progress: Optional[ScanProgress] = None,
+    threads: int = 1,
+    ignore_files: Sequence[str] = ()
+) -> Iterator[Tuple[os.DirEntry, str]]:
+    """
+    Yield (entry, relative_path) for every file under repo_path, with '/'-separated relative paths.
+
+    Excluded directories are pruned before they are listed, and symlinked
+    directories are not followed. With threads > 1, directories are listed
+    concurrently by a thread pool, which hides the latency of slow or network
+    filesystems; files then arrive in no particular order. ignore_files names
+    the ignore_files.IGNORE_FILES to honor: what they exclude is pruned the
+    same way, with each ignore file compiled once.
+    """
+    if matcher is None:
+        matcher = ExclusionMatcher()
+    if progress is None:
+        progress = ScanProgress()
+    root_rules = IgnoreRules.for_root(repo_path, ignore_files)
+
+    def entered(path: str, relative_root: str, files: List[os.DirEntry], rules: Optional[IgnoreRules]):
+        if rules is None or not rules.nested:
+            return rules
+        return rules.entered(path, relative_root, {entry.name for entry in files})
+
+    def subdirectories(dirs: List[os.DirEntry], relative_root: str, rules: Optional[IgnoreRules]):
+        for entry in dirs:
+            relative_path = relative_root + entry.name
+            if entry.is_symlink() or matcher.excludes_dir(entry.name, relative_path):
+                continue
+            if rules is None or not rules.excludes(relative_path, True):
+                yield entry.path, relative_path + '/', rules
+
+    def listed(files: List[os.DirEntry], relative_root: str, rules: Optional[IgnoreRules]):
+        progress.files_discovered += len(files)
+        for entry in files:
+            relative_path = relative_root + entry.name
+            if rules is None or not rules.excludes(relative_path, False):
+                yield entry, relative_path
+
+    if threads <= 1:
+        # Depth-first, in the same order as os.walk
+        stack = [(repo_path, '', root_rules)]
+        while stack:
+            progress.check_cancelled()
+            path, relative_root, rules = stack.pop()
+            dirs, files = _list_walk_directory(path)
+            rules = entered(path, relative_root, files, rules)
+            yield from listed(files, relative_root, rules)
+            stack.extend(reversed(list(subdirectories(dirs, relative_root, rules))))
+        return
+
+    # Directories waiting to be listed, and listings in progress (at most 2 per thread)
+    backlog = deque([(repo_path, '', root_rules)])
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='walk') as pool:
+        try:
+            while backlog or in_flight:
+                progress.check_cancelled()
+                while backlog and len(in_flight) < 2 * threads:
+                    path, relative_root, rules = backlog.popleft()
+                    in_flight[pool.submit(_list_walk_directory, path)] = (path, relative_root, rules)
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, relative_root, rules = in_flight.pop(future)
+                    dirs, files = future.result()
+                    rules = entered(path, relative_root, files, rules)
+                    backlog.extend(subdirectories(dirs, relative_root, rules))
+                    yield from listed(files, relative_root, rules)
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+def iter_candidate_files(
+    repo_path: str,
+    exclude_dirs: Optional[Set[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    skip_above: Optional[int] = None,
+    progress: Optional[ScanProgress] = None,
+    walk_threads: int = 1,
+    ignore_files: Sequence[str] = ()
+) -> Iterator[Tuple[str, Optional[str], Optional[os.stat_result], Optional[str]]]:
+    """
+    Yield (file_path, extension, file_stat, error) for each file that process_repository would count.
+
+    This is the selection of a scan without the counting, for callers that
+    only need the files and their sizes (estimates, polling a live index).
+    Files are walked, filtered by extension and exclusion patterns, and yielded
+    one at a time without being opened; binary files are only recognized when
+    they are read for counting (see _count_file_batch). Files larger than
+    skip_above bytes are left out. file_stat is None if the file could not be
+    stat'ed. A file that fails these checks with an error is yielded with
+    extension None and the error message. repo_path may also be a single file.
+    """
+    if progress is None:
+        progress = ScanProgress()
+    # --- Handle single file case ---
+    if os.path.isfile(repo_path):
+        progress.files_discovered = 1
+        extension = _file_extension(repo_path)
+        if extension in FILE_EXTENSIONS:
+            try:
+                file_stat = os.stat(repo_path)
+            except OSError as e:
+                # Removed or made unreadable since isfile()
+                yield repo_path, None, None, str(e)
+                return
+            if skip_above is None or file_stat.st_size <= skip_above:
+                yield repo_path, extension, file_stat, None
+        return
+
+    if not os.path.isdir(repo_path):
+        return
+
+    # --- Handle directory case ---
+    matcher = ExclusionMatcher(exclude_dirs, exclude_patterns)
+    for entry, relative_path in walk_files(repo_path, matcher, progress, walk_threads, ignore_files):
+        try:
+            # Extension and patterns only need the name, so check them before any I/O
+            extension = _file_extension(entry.name)
+            if extension not in FILE_EXTENSIONS or matcher.excludes_file(entry.name, relative_path):
+                continue
+
+            # DirEntry caches the stat for the cache lookup and progress
+            try:
+                file_stat = entry.stat()
+            except OSError:
+                file_stat = None
+            if skip_above is not None and file_stat is not None and file_stat.st_size > skip_above:
+                continue
+            yield entry.path, extension, file_stat, None
+
+        except Exception as e: # Catch potential errors during path processing
+             yield entry.path, None, None, str(e)
+
+def _iter_listed_files(
+    repo_path: str,
+    paths: Iterable[str],
+    exclude_dirs: Optional[Set[str]],
+    exclude_patterns: Optional[List[str]],
+    skip_above: Optional[int],
+    progress: ScanProgress,
+    ignore_files: Sequence[str] = ()
+):
+    """
+    Yield (file_path, extension, file_stat, None) for each of paths that a walk of repo_path would count.
+
+    Paths outside repo_path, and files that no longer exist, are left out.
+    """
+    classify = file_classifier(exclude_dirs, exclude_patterns, repo_path, ignore_files)
+    for file_path in paths:
+        progress.check_cancelled()
+        progress.files_discovered += 1
+        relative_path = os.path.relpath(file_path, repo_path).replace(os.sep, '/')
+        if relative_path.startswith('../'):
+            continue
+        extension = classify(relative_path)
+        if extension is None:
+            continue
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            continue
+        if not stat.S_ISREG(file_stat.st_mode):
+            continue
+        if skip_above is None or file_stat.st_size <= skip_above:
+            yield file_path, extension, file_stat, None
+
+def file_classifier(
+    exclude_dirs: Optional[Set[str]] = None,
+    exclude_patterns: Optional[List[str]] = None,
+    root: Optional[str] = None,
+    ignore_files: Sequence[str] = ()
+) -> Callable[[str], Optional[str]]:
+    """
+    Return classify(path), giving the extension of a file that would be counted, or None if it is not.
+
+    Paths are '/'-separated and relative to the repository root. Files are
+    selected as when walking a checkout: by extension and exclusions, where an
+    excluded directory excludes everything below it. With the root of a
+    worktree, ignore_files are honored as walk_files does, reading the ignore
+    files of each directory on the way. Directories are looked up once, so
+    classify stays cheap for many files, but does not see ignore files that
+    appear later.
+    """
+    matcher = ExclusionMatcher(exclude_dirs, exclude_patterns)
+    root_rules = IgnoreRules.for_root(root, ignore_files) if root is not None else None
+    excluded_dirs = {'': False}
+    dir_rules = {}
+
+    def rules_in(dir_path: str) -> Optional[IgnoreRules]:
+        # The ignore rules in effect in a directory that is not excluded
+        if dir_path not in dir_rules:
+            parent = dir_path.rpartition('/')[0]
+            rules = rules_in(parent) if dir_path else root_rules
+            if rules is not None and rules.nested:
+                path = os.path.join(root, *dir_path.split('/')) if dir_path else root
+                present = [name for name in rules.nested if os.path.isfile(os.path.join(path, name))]
+                rules = rules.entered(path, dir_path + '/' if dir_path else '', present)
+            dir_rules[dir_path] = rules
+        return dir_rules[dir_path]
+
+    def dir_excluded(dir_path: str) -> bool:
+        if dir_path not in excluded_dirs:
+            parent, _, name = dir_path.rpartition('/')
+            if dir_excluded(parent) or matcher.excludes_dir(name, dir_path):
+                excluded_dirs[dir_path] = True
+            else:
+                rules = rules_in(parent)
+                excluded_dirs[dir_path] = rules is not None and rules.excludes(dir_path, True)
+        return excluded_dirs[dir_path]
+
+    def classify(path: str) -> Optional[str]:
+        directory, _, name = path.rpartition('/')
+        extension = _file_extension(name)
+        if extension not in FILE_EXTENSIONS or dir_excluded(directory) or matcher.excludes_file(name, path):
+            return None
+        rules = rules_in(directory)
+        if rules is not None and rules.excludes(path, False):
+            return None
+        return extension
+
+    return classify
+
+def _gitignore_literal(pattern: str) -> bool:
+    """Return True if an exclusion pattern means the same as a literal .gitignore pattern."""
+    return not any(c in pattern for c in ('*', '?', '[', '\\')) and not pattern.startswith(('!', '#'))
+
+def sparse_checkout_patterns(exclude_dirs: Optional[Set[str]] = None, exclude_patterns: Optional[List[str]] = None) -> List[str]:
+    """
+    Return non-cone sparse-checkout patterns for the files a scan with these exclusions may count.
+
+    Files are included by extension (matched case-insensitively, like
+    FILE_EXTENSIONS), and excluded directories and file patterns are removed
+    where .gitignore syntax can express them exactly. Patterns it cannot are
+    left to the scan, so the checkout may hold more files than are counted,
+    but never fewer.
+    """
+    def any_case(text):
+        return ''.join(f'[{c.lower()}{c.upper()}]' if c.isalpha() else c for c in text)
+
+    # Only the last suffix decides the extension, e.g. '.blade.php' files are '.php'
+    patterns = sorted({'*.' + any_case(extension.rsplit('.', 1)[1]) for extension in FILE_EXTENSIONS})
+    matcher = ExclusionMatcher(exclude_dirs, exclude_patterns)
+    patterns.extend(f'!**/{name}/**' for name in sorted(matcher.exclude_dirs) if _gitignore_literal(name))
+    for pattern in exclude_patterns or []:
+        pattern = pattern.replace(os.sep, '/')
+        if '/' not in pattern:
+            # fnmatch and .gitignore globs agree on names without '/' or escapes
+            if not pattern.startswith(('!', '#')) and '\\' not in pattern:
+                patterns.append(f'!{pattern}')
+        elif _gitignore_literal(pattern):
+            path = pattern.strip('/')
+            if not pattern.endswith('/'):
+                patterns.append(f'!/{path}')
+            patterns.append(f'!/{path}/**')
+    return patterns
+
+def _iter_blob_counts(
+    repo_path: str,
+    shas: List[str],
+    settings: _CountSettings,
+    workers: Optional[int],
+    batch_size: int,
+    cache: Optional[TokenCache],
+    progress: ScanProgress,
+    executor: Optional[Executor] = None
+) -> Iterator[Tuple[str, Optional[Dict[str, int]], bool, Optional[str]]]:
+    """
+    Yield (sha, counts, cached, error) for each of the given blobs, in no particular order.
+
+    Blobs in the cache's blob table are answered first, without being read.
+    The others are read through git cat-file --batch, tokenized in batches and
+    stored in the cache, except for sampled estimates. counts is None for a
+    binary blob.
+    """
+    cached = cache.get_blob_counts(shas, settings.tokenizers) if cache is not None else {}
+    for sha, counts in cached.items():
+        yield sha, counts, True, None
+    progress.check_cancelled()
+
+    def counted(batch, results):
+        if cache is not None:
+            for (content, sha), (counts, _, _, error) in zip(batch, results):
+                estimated = settings.sample_above is not None and len(content) > settings.sample_above
+                if error is None and not estimated:
+                    cache.put_blob_counts(sha, settings.tokenizers, counts)
+            # Committed before yielding, so the write lock is not held while the caller works
+            cache.commit()
+        for (_, sha), (counts, _, _, error) in zip(batch, results):
+            yield sha, counts, False, error
+        progress.check_cancelled()
+
+    counter = _BatchCounter(resolve_workers(workers), settings, _count_blob_batch, executor)
+    try:
+        batch = []
+        for sha, content in read_blobs(repo_path, [sha for sha in shas if sha not in cached]):
+            if content is None:
+                yield sha, {}, False, f"Missing git object {sha}"
+                continue
+            batch.append((content, sha))
+            if len(batch) >= batch_size:
+                for done_batch, results in counter.submit(batch):
+                    yield from counted(done_batch, results)
+                batch = []
+        if batch:
+            for done_batch, results in counter.submit(batch):
+                yield from counted(done_batch, results)
+        for done_batch, results in counter.finish():
+            yield from counted(done_batch, results)
+    finally:
+        counter.close()
+        if cache is not None:
+            cache.flush()
+
+def _iter_git_token_counts(
+    repo_path: str,
+    git_ref: str,
+    options: ScanOptions,
+    cache: Optional[TokenCache],
+    progress: ScanProgress,
+    executor: Optional[Executor] = None
+) -> Iterator[FileTokenCount]:
+    """
+    iter_file_token_counts for the files of a git commit, read from the object database.
+
+    The tree of git_ref is listed with git ls-tree and filtered like a walk of
+    a checkout. Each unique blob is then counted once (see _iter_blob_counts),
+    however many paths share it; the records of the other paths are marked
+    cached. Record paths are repo_path joined with each file's path in the tree.
+    """
+    tokenizer = options.tokenizer
+    skip_above = options.skip_above
+    classify = file_classifier(options.exclude_dirs, options.exclude_patterns)
+
+    # (file_path, extension, size) of every file, grouped by blob SHA in tree order
+    files_by_blob: Dict[str, List[Tuple[str, str, int]]] = {}
+    progress.stage = 'discovering'
+    for entry in iter_tree(repo_path, resolve_commit(repo_path, git_ref)):
+        progress.files_discovered += 1
+        extension = classify(entry.path)
+        if extension is None or (skip_above is not None and entry.size > skip_above):
+            continue
+        progress.files_to_process += 1
+        files_by_blob.setdefault(entry.sha, []).append((os.path.join(repo_path, entry.path), extension, entry.size))
+    progress.check_cancelled()
+
+    progress.stage = 'tokenizing'
+    blob_counts = _iter_blob_counts(
+        repo_path, list(files_by_blob), options.count_settings(), options.workers, max(1, options.batch_size),
+        cache, progress, executor
+    )
+    for sha, counts, cached, error in blob_counts:
+        for i, (file_path, extension, size) in enumerate(files_by_blob.pop(sha)):
+            if error is not None:
+                yield FileTokenCount(file_path, extension, 0, {}, size, False, error)
+                continue
+            if counts is None:
+                # Binary files are only recognized once read
+                progress.files_to_process -= 1
+                continue
+            progress.files_tokenized += 1
+            progress.bytes_processed += size
+            yield FileTokenCount(file_path, extension, counts[tokenizer], counts, size, cached or i > 0, None)
+    progress.stage = 'done'
+
+def _git_scan_key(options: ScanOptions) -> str:
+    """Fingerprint of the options that decide how a commit's files are counted, for stored commit results."""
+    key = (
+        sorted(ExclusionMatcher(options.exclude_dirs, options.exclude_patterns).exclude_dirs),
+        sorted(options.exclude_patterns or ()),
+        options.max_file_size if options.large_file_policy != 'exact' else None,
+        options.large_file_policy,
+    )
+    return hashlib.sha256(repr(key).encode()).hexdigest()[:16]
+
+def _count_git_changes(
+    repo_path: str,
+    base: str,
+    commit: str,
+    base_counts: CommitCounts,
+    options: ScanOptions,
+    cache: TokenCache,
+    progress: ScanProgress,
+    executor: Optional[Executor] = None
+) -> CommitCounts:
+    """
+    Update the per-extension results of commit base to those of commit.
+
+    Only the files changed between the two commits are looked at: the counts
+    of their old blobs are subtracted and those of their new blobs added. Both
+    come from the blob cache where possible, so only new contents are read and
+    tokenized.
+    """
+    classify = file_classifier(options.exclude_dirs, options.exclude_patterns)
+    skip_above = options.skip_above
+    tokens = {name: dict(extension_tokens) for name, extension_tokens in base_counts[0].items()}
+    files = dict(base_counts[1])
+
+    # (extension, old_sha, new_sha) of every changed file that is counted at either commit
+    changes = []
+    for change in iter_tree_changes(repo_path, base, commit):
+        extension = classify(change.path)
+        if extension is not None:
+            changes.append((extension, change.old_sha, change.new_sha))
+    shas = list(dict.fromkeys(
+        sha for _, old_sha, new_sha in changes for sha in (old_sha, new_sha) if sha is not None
+    ))
+    if skip_above is not None:
+        # Skipped blobs count as absent at their commit
+        sizes = read_blob_sizes(repo_path, shas)
+        shas = [sha for sha in shas if sizes.get(sha, 0) <= skip_above]
+        kept = set(shas)
+        changes = [
+            (extension, old_sha if old_sha in kept else None, new_sha if new_sha in kept else None)
+            for extension, old_sha, new_sha in changes
+        ]
+
+    progress.stage = 'tokenizing'
+    progress.files_to_process = len(shas)
+    blob_counts = {}
+    blob_results = _iter_blob_counts(
+        repo_path, shas, options.count_settings(), options.workers, max(1, options.batch_size), cache, progress, executor
+    )
+    for sha, counts, _, error in blob_results:
+        blob_counts[sha] = counts if error is None else {}
+        progress.files_tokenized += 1
+
+    for extension, old_sha, new_sha in changes:
+        for sha, sign in ((old_sha, -1), (new_sha, 1)):
+            if sha is None or blob_counts[sha] is None:
+                continue
+            files[extension] = files.get(extension, 0) + sign
+            for name, extension_tokens in tokens.items():
+                extension_tokens[extension] = extension_tokens.get(extension, 0) + sign * blob_counts[sha].get(name, 0)
+
+    # Extensions without files left drop out, as in a full scan
+    for extension in [extension for extension, count in files.items() if count <= 0]:
+        del files[extension]
+        for extension_tokens in tokens.values():
+            extension_tokens.pop(extension, None)
+    progress.stage = 'done'
+    return tokens, files
+
+def iter_file_token_counts(
+    repo_path: str,
+    options: Optional[ScanOptions] = None,
+    cache: Optional[TokenCache] = None,
+    progress: Optional[ScanProgress] = None,
+    git_ref: Optional[str] = None,
+    executor: Optional[Executor] = None,
+    paths: Optional[Iterable[str]] = None,
+    **settings
+) -> Iterator[FileTokenCount]:
+    """
+    Walk, filter and tokenize files, yielding a FileTokenCount per file as it is counted.
+
+    The stages run as a pipeline: files are tokenized in batches while the walk
+    continues, so the first records arrive right away and memory stays bounded
+    by the batches in flight rather than the number of files. Records come in
+    batch order, except that files answered from the cache are yielded as soon
+    as they are seen. Arguments are as for process_repository, with settings
+    (ScanOptions fields by name) overriding options; a path that is neither a
+    file nor a directory yields nothing. paths, absolute paths of files under
+    repo_path, limits the scan to those files instead of walking repo_path;
+    they are selected as a walk would select them.
+    """
+    options = scan_options(options, **settings)
+    if progress is None:
+        progress = ScanProgress()
+
+    if git_ref is not None:
+        yield from _iter_git_token_counts(repo_path, git_ref, options, cache, progress, executor)
+        return
+
+    tokenizer = options.tokenizer
+    tokenizers = options.tokenizers
+    skip_above = options.skip_above
+    batch_size = max(1, options.batch_size)
+
+    def counted(batch, results) -> Iterator[FileTokenCount]:
+        if cache is not None:
+            for (file_path, _, file_stat), (counts, digest, content_hit, error) in zip(batch, results):
+                if error is None and counts is not None and file_stat is not None and digest is not None:
+                    cache.put_counts(file_path, file_stat.st_size, file_stat.st_mtime_ns, digest, counts, content_hit)
+            # Committed before yielding, so the write lock is not held while the caller works
+            cache.commit()
+        for (file_path, extension, file_stat), (counts, digest, content_hit, error) in zip(batch, results):
+            size = file_stat.st_size if file_stat is not None else None
+            mtime_ns = file_stat.st_mtime_ns if file_stat is not None else None
+            if error is not None:
+                yield FileTokenCount(file_path, extension, 0, {}, size, False, error, mtime_ns)
+                continue
+            if counts is None:
+                # Binary files are only recognized once read
+                progress.files_to_process -= 1
+                continue
+            progress.files_tokenized += 1
+            progress.bytes_processed += size or 0
+            yield FileTokenCount(file_path, extension, counts[tokenizer], counts, size, content_hit, None, mtime_ns)
+        progress.check_cancelled()
+
+    counter = _BatchCounter(
+        resolve_workers(options.workers), options.count_settings(cache.path if cache is not None else None),
+        executor=executor
+    )
+    try:
+        progress.stage = 'discovering'
+        batch = []
+        if paths is not None:
+            candidates = _iter_listed_files(
+                repo_path, paths, options.exclude_dirs, options.exclude_patterns, skip_above, progress,
+                options.ignore_files
+            )
+        else:
+            candidates = iter_candidate_files(
+                repo_path, options.exclude_dirs, options.exclude_patterns, skip_above, progress,
+                options.walk_threads, options.ignore_files
+            )
+        for file_path, extension, file_stat, error in candidates:
+            progress.check_cancelled()
+            if error is not None:
+                yield FileTokenCount(file_path, None, 0, {}, None, False, error)
+                continue
+            progress.files_to_process += 1
+
+            # Files unchanged since the last cached scan are counted without being read
+            if cache is not None and file_stat is not None:
+                counts = cache.get_counts(file_path, file_stat.st_size, file_stat.st_mtime_ns, tokenizers)
+                if counts is not None:
+                    progress.files_tokenized += 1
+                    progress.bytes_processed += file_stat.st_size
+                    yield FileTokenCount(
+                        file_path, extension, counts[tokenizer], counts, file_stat.st_size, True, None, file_stat.st_mtime_ns
+                    )
+                    continue
+
+            batch.append((file_path, extension, file_stat))
+            if len(batch) >= batch_size:
+                for done_batch, results in counter.submit(batch):
+                    yield from counted(done_batch, results)
+                batch = []
+
+        progress.stage = 'tokenizing'
+        if batch:
+            for done_batch, results in counter.submit(batch):
+                yield from counted(done_batch, results)
+        for done_batch, results in counter.finish():
+            yield from counted(done_batch, results)
+        progress.stage = 'done'
+    finally:
+        # Shuts worker processes down promptly if iteration stops early
+        counter.close()
+        if cache is not None:
+            cache.flush()
+
 def process_repository(
     repo_path: str,
     total_only: bool = False,
     exclude_dirs: Optional[Set[str]] = None,
-    exclude_patterns: Optional[List[str]] = None
+    exclude_patterns: Optional[List[str]] = None,
+    options: Optional[ScanOptions] = None,
+    cache: Optional[TokenCache] = None,
+    progress: Optional[ScanProgress] = None,
+    executor: Optional[Executor] = None,
+    git_ref: Optional[str] = None,
+    git_base: Optional[str] = None,
+    tokenizer_totals: Optional[Dict[str, int]] = None,
+    on_file: Optional[Callable[[str, str, Dict[str, int]], None]] = None,
+    on_record: Optional[Callable[[FileTokenCount], None]] = None,
+    directory_tree: Optional[DirectoryTree] = None,
+    top_files: Optional[TopFiles] = None,
+    token_histogram: Optional[TokenHistogram] = None,
+    **settings
 ) -> Tuple[int, Dict[str, int], Dict[str, int]]:
     """
     Process files in the repository, count tokens, and apply exclusions.
 
+    Aggregates the per-file records of iter_file_token_counts. The scan
+    settings, the fields of ScanOptions, are given as options, or by name
+    (e.g. workers=4) to override them; exclude_dirs and exclude_patterns
+    may also be given positionally.
+
     Args:
         repo_path: The path to the repository directory or a single file.
         total_only: If True, only return the total token count and suppress output.
+        options: Optional ScanOptions with the settings below.
         exclude_dirs: A set of directory names to exclude entirely.
         exclude_patterns: A list of glob/fnmatch patterns to exclude files/directories.
                           Patterns with '/' match against relative paths (e.g., 'node_modules/', '*.log').
                           Patterns without '/' match against filenames only (e.g., '*.tmp', '.DS_Store').
+        workers: Number of processes used for tokenization. 1 (the default) tokenizes
+                 in-process; None or 0 uses one process per CPU. Totals are identical
+                 regardless of the worker count.
+        batch_size: Number of files read and tokenized per batched tokenizer call.
+        cache: Optional TokenCache. Files whose size and mtime (or, failing that,
+               content digest) match a cached entry are not re-tokenized, and new
+               counts are written back. Hit/miss counters are kept on the cache.
+        max_file_size: Optional size in bytes above which large_file_policy applies.
+        large_file_policy: 'exact' counts large files exactly by streaming them, 'skip'
+                           leaves them out entirely, and 'sample' estimates them from
+                           evenly spaced samples (see estimate_tokens_sampled).
+        stream_threshold: Files of at least this many bytes are tokenized in chunks
+                          with bounded memory (see count_tokens_streaming).
+        tokenizer: Name of the tokenizer the returned counts use (see backends.get_backend).
+        extra_tokenizers: Further tokenizers to count with in the same pass; each file
+                          is read once and fed to every tokenizer.
+        tokenizer_totals: Optional dict that is filled with the total token count of
+                          the primary and every extra tokenizer, by tokenizer name.
+        progress: Optional ScanProgress that is updated as the scan runs. If it is
+                  cancelled, the scan stops early and raises ScanCancelled.
+        on_file: Optional callback invoked as on_file(file_path, extension, counts)
+                 for every file as soon as it is counted, with counts mapping each
+                 tokenizer name to the file's token count. Lets callers show
+                 partial results while the scan runs.
+        walk_threads: Number of threads listing directories (see walk_files). Values
+                      above 1 speed up walking high-latency filesystems such as
+                      network or bind-mounted drives.
+        git_ref: If given, repo_path must be a git repository (bare or not), and the
+                 files of this commit are read from its object database instead of
+                 the worktree (see git_scan). Only tracked files are counted, and
+                 each distinct file content is tokenized once. With a cache, blob
+                 counts are cached by SHA, and the per-extension results of the
+                 commit are stored; a commit that was already scanned with the same
+                 exclusions and size policy is answered from the cache.
+        git_base: With git_ref and a cache, a commit whose results are stored in the
+                  cache (typically the previous commit scanned). Only the files that
+                  changed between git_base and git_ref are counted, and their deltas
+                  are applied to the stored per-extension results. Falls back to a full
+                  scan if git_base was not scanned. on_file is not called for files
+                  that are not counted.
+        executor: Optional pool of tokenizer processes (see create_tokenizer_pool) to
+                  count in, shared with other scans; workers should be its size.
+        on_record: Optional callback invoked with every FileTokenCount record,
+                   including files that failed, as soon as it is produced (see
+                   report.FileReportWriter). Like on_file, it is not called for
+                   results answered from stored commit counts.
+        ignore_files: Ignore files to honor while walking, from ignore_files.IGNORE_FILES:
+                      '.gitignore' loads the .gitignore of every directory, and
+                      '.dockerignore' the one in repo_path. Ignored directories are
+                      pruned before they are listed. Git scans already list only
+                      tracked files and do not use them.
+        directory_tree: Optional empty DirectoryTree that is filled, in the same pass,
+                        with the token and file totals of every directory, and
+                        finished (see dir_tree).
+        top_files: Optional TopFiles that is given every counted file, keeping the
+                   ones with the most tokens (see file_stats).
+        token_histogram: Optional TokenHistogram that every counted file is added to.
+                         Stored commit results have no per-file records, so with a
+                         directory_tree, top_files or token_histogram a commit is
+                         scanned even if its results are in the cache.
 
     Returns:
         A tuple containing:
@@ -253,146 +1541,288 @@ def process_repository(
         - extension_stats: A dictionary mapping file extensions to token counts.
         - file_counts: A dictionary mapping file extensions to the number of files counted.
     """
+    if exclude_dirs is not None:
+        settings['exclude_dirs'] = exclude_dirs
+    if exclude_patterns is not None:
+        settings['exclude_patterns'] = exclude_patterns
+    options = scan_options(options, **settings)
+    if not os.path.exists(repo_path):
+        if not total_only:
+            get_console().print(f"[red]Error: Path is not a valid directory or file: {repo_path}[/red]")
+        return 0, {}, {}
+
     total_tokens = 0
     extension_stats = {}
     file_counts = {}
+    tokenizer = options.tokenizer
+    tokenizers = options.tokenizers
+    totals = tokenizer_totals if tokenizer_totals is not None else {}
+    totals.update(dict.fromkeys(tokenizers, 0))
+    if progress is None:
+        progress = ScanProgress()
+
+    # Stored results of a git commit, or of a base commit plus the diff, avoid a full scan
+    # unless per-file results are wanted
+    per_file = directory_tree is not None or top_files is not None or token_histogram is not None
+    scan_key = None
+    commit_tokens = None
+    if git_ref is not None and cache is not None:
+        commit = resolve_commit(repo_path, git_ref)
+        scan_key = _git_scan_key(options)
+        commit_counts = cache.get_commit_counts(commit, scan_key, tokenizers) if not per_file else None
+        if commit_counts is None and git_base is not None and not per_file:
+            base = resolve_commit(repo_path, git_base)
+            base_counts = cache.get_commit_counts(base, scan_key, tokenizers)
+            if base_counts is not None:
+                commit_counts = _count_git_changes(repo_path, base, commit, base_counts, options, cache, progress, executor)
+                cache.put_commit_counts(commit, scan_key, commit_counts)
+        if commit_counts is not None:
+            cache.flush()
+            progress.stage = 'done'
+            extension_tokens, file_counts = commit_counts
+            for name in tokenizers:
+                totals[name] = sum(extension_tokens[name].values())
+            return totals[tokenizer], dict(extension_tokens[tokenizer]), dict(file_counts)
+        git_ref = commit
+        commit_tokens = {name: {} for name in tokenizers}
+
+    # Files arrive grouped by directory, so each directory's relative path is computed once
+    tree_root = repo_path if os.path.isdir(repo_path) else os.path.dirname(repo_path)
+    last_directory = None
+    tree_directory = ''
+
+    for record in iter_file_token_counts(
+        repo_path, options, cache=cache, progress=progress, git_ref=git_ref, executor=executor
+    ):
+        if on_record is not None:
+            on_record(record)
+        if record.extension is None:
+            if not total_only:
+                get_console().print(f"[yellow]Skipping file due to path processing error {record.path}: {record.error}[/yellow]")
+            continue
+
+        # Files that fail to read still count as files of their extension
+        file_counts[record.extension] = file_counts.get(record.extension, 0) + 1
+        extension_stats.setdefault(record.extension, 0)
+        if directory_tree is not None:
+            directory = os.path.dirname(record.path)
+            if directory != last_directory:
+                last_directory = directory
+                tree_directory = os.path.relpath(directory, tree_root).replace(os.sep, '/')
+                tree_directory = '' if tree_directory == '.' else tree_directory
+            directory_tree.add(tree_directory, record.tokens)
+        if record.error is not None:
+            if not total_only:
+                get_console().print(f"[red]Error processing {record.path}: {record.error}[/red]")
+            continue
+
+        total_tokens += record.tokens
+        extension_stats[record.extension] += record.tokens
+        if top_files is not None:
+            top_files.add(record.path, record.tokens)
+        if token_histogram is not None:
+            token_histogram.add(record.tokens)
+        for name in tokenizers:
+            totals[name] += record.counts[name]
+            if commit_tokens is not None:
+                commit_tokens[name][record.extension] = commit_tokens[name].get(record.extension, 0) + record.counts[name]
+        if on_file is not None:
+            on_file(record.path, record.extension, record.counts)
+
+    if commit_tokens is not None:
+        cache.put_commit_counts(git_ref, scan_key, (commit_tokens, file_counts))
+        cache.flush()
+    if directory_tree is not None:
+        directory_tree.finish()
+    return total_tokens, extension_stats, file_counts
 
-    # Define default directories to always exclude
-    default_exclude_dirs = {'.git', 'venv', '.venv', '__pycache__', '.pytest_cache', '.mypy_cache'}
-
-    # --- Handle single file case ---
-    if os.path.isfile(repo_path):
-        file_path = repo_path
-        extension = os.path.splitext(file_path)[1].lower()
-        if not extension: extension = '.no_extension' # Use special key for files without extension
-
-        if extension in FILE_EXTENSIONS and not is_binary(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    content = f.read()
-                    tokens = count_tokens(content)
-                    return tokens, {extension: tokens}, {extension: 1}
-            except Exception as e:
-                 if not total_only:
-                     console.print(f"[red]Error processing file {file_path}: {str(e)}[/red]")
-                 return 0, {}, {}
-        else:
-            # File is binary or not in recognized extensions
-            return 0, {}, {}
-
-    # --- Handle directory case ---
-    # Combine default and provided exclude directories
-    combined_exclude_dirs = default_exclude_dirs.copy()
-    if exclude_dirs:
-        combined_exclude_dirs.update(exclude_dirs)
-
-    # Ensure exclude_patterns is a list and prepare patterns
-    if exclude_patterns is None:
-        exclude_patterns = []
-
-    # Separate patterns for path matching (containing '/') and filename matching
-    path_patterns = [p.replace(os.sep, '/') for p in exclude_patterns if '/' in p]
-    name_patterns = [p for p in exclude_patterns if '/' not in p]
-
-    # Add combined_exclude_dirs as path patterns (e.g., '.git/')
-    path_patterns.extend([f"{d.strip('/')}/" for d in combined_exclude_dirs])
-
-
-    # Stage 1: Walk and collect all potential files, applying basic dir pruning
-    all_potential_files = []
-    if not os.path.isdir(repo_path):
-         if not total_only:
-              console.print(f"[red]Error: Path is not a valid directory or file: {repo_path}[/red]")
-         return 0, {}, {}
-
-    for root, dirs, files in os.walk(repo_path, topdown=True):
-        # Prune based on exact directory names (combined_exclude_dirs)
-        dirs[:] = [d for d in dirs if d not in combined_exclude_dirs]
-
-        # Further prune based on path patterns matching the directory's relative path
-        dirs_to_remove = set()
-        for d in dirs:
-             try:
-                 relative_dir_path = os.path.relpath(os.path.join(root, d), repo_path)
-                 normalized_relative_dir_path = Path(relative_dir_path).as_posix()
-                 if any(fnmatch.fnmatch(normalized_relative_dir_path, pattern.strip('/')) or \
-                        fnmatch.fnmatch(normalized_relative_dir_path + '/', pattern) # Match 'dir' or 'dir/'
-                        for pattern in path_patterns):
-                     dirs_to_remove.add(d)
-             except ValueError: # Handle cases where relpath might fail (e.g. different drives on Windows)
-                 pass # If relpath fails, we can't reliably check path patterns here
-        dirs[:] = [d for d in dirs if d not in dirs_to_remove]
-
-        # Add files from non-pruned directories to potential list
-        for file in files:
-            all_potential_files.append(os.path.join(root, file))
-
-
-    # Stage 2: Filter the collected list based on patterns
-    all_files_to_process = []
-    temp_file_counts = {} # Temporary counts before final processing
-
-    for file_path in all_potential_files:
-        try:
-            # Check against filename patterns
-            file_name = os.path.basename(file_path)
-            if any(fnmatch.fnmatch(file_name, pattern) for pattern in name_patterns):
-                continue
-
-            # Check against path patterns
-            relative_path = os.path.relpath(file_path, repo_path)
-            normalized_relative_path = Path(relative_path).as_posix()
-            if any(fnmatch.fnmatch(normalized_relative_path, pattern) for pattern in path_patterns):
-                continue
-
-            # If not excluded, check extension and binary status
-            extension = os.path.splitext(file_path)[1].lower()
-            if not extension: extension = '.no_extension' # Use special key
-
-            if extension in FILE_EXTENSIONS and not is_binary(file_path):
-                all_files_to_process.append((file_path, extension))
-                temp_file_counts[extension] = temp_file_counts.get(extension, 0) + 1
-
-        except Exception as e: # Catch potential errors during path processing
-             if not total_only:
-                 console.print(f"[yellow]Skipping file due to path processing error {file_path}: {str(e)}[/yellow]")
+# Options of the former single-dash command line: flags, and options given as -name=value
+_LEGACY_FLAGS = frozenset({'total', 'cache', 'git', 'mirror-cache'})
+_LEGACY_OPTIONS = frozenset({
+    'format', 'workers', 'walk-threads', 'batch-size', 'cache', 'max-file-size', 'large-files', 'tokenizer',
+    'git', 'base', 'mirror-cache', 'save-tokenizer'
+})
 
+def _legacy_args(args: List[str]) -> List[str]:
+    """
+    Accept the former single-dash options ('-total', '-workers=8') as their '--' form.
 
-    # Stage 3: Process the filtered list
-    file_counts = temp_file_counts # Use the counts from the filtered list
-    for file_path, extension in (track(all_files_to_process, description="[bold blue]Processing files") if not total_only else all_files_to_process):
-        try:
-            # Ensure extension is recorded even if file reading fails later
-            if extension not in extension_stats:
-                 extension_stats[extension] = 0
-                 # file_counts already populated in Stage 2
-
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
-                tokens = count_tokens(content)
-                total_tokens += tokens
-                if extension not in extension_stats:
-                    extension_stats[extension] = tokens
-                else:
-                    extension_stats[extension] += tokens
-        except Exception as e:
-            if not total_only:
-                console.print(f"[red]Error processing {file_path}: {str(e)}[/red]")
+    Only those options are rewritten, and only before '--', so other
+    dash-prefixed arguments ('-5', '-*.min.js') reach argparse unchanged.
+    argparse never takes such an argument as the value of the option before
+    it, so everything before '--' is in option position.
+    """
+    rewritten = []
+    for index, arg in enumerate(args):
+        if arg == '--':
+            return rewritten + args[index:]
+        name, has_value, _ = arg[1:].partition('=')
+        legacy = arg.startswith('-') and not arg.startswith('--')
+        if legacy and (name in _LEGACY_OPTIONS if has_value else name in _LEGACY_FLAGS):
+            arg = '-' + arg
+        rewritten.append(arg)
+    return rewritten
+
+def add_exclusion_arguments(parser: argparse.ArgumentParser, ignore_files: bool = True):
+    """
+    Add the --exclude-preset, --exclude-dir and --exclude options (see exclusions_from_args).
 
-    return total_tokens, extension_stats, file_counts
+    ignore_files also adds --gitignore and --dockerignore (see ignore_files_from_args),
+    for commands that walk directories.
+    """
+    group = parser.add_argument_group('exclusions')
+    group.add_argument('--exclude-preset', action='append', default=[], choices=sorted(EXCLUDE_PRESETS),
+                       help='Exclude a group of directories and files, as in the web UI (repeatable)')
+    group.add_argument('--exclude-dir', action='append', default=[], metavar='NAME',
+                       help='Skip every directory with this name (repeatable)')
+    group.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                       help="Skip files matching a glob; patterns with '/' match relative paths, "
+                            "e.g. 'build/' or '*.min.js' (repeatable)")
+    if not ignore_files:
+        return
+    group.add_argument('--gitignore', action='store_true',
+                       help='Skip what the .gitignore files of the scanned directories ignore')
+    group.add_argument('--dockerignore', action='store_true',
+                       help='Skip what the .dockerignore of the scanned directory ignores')
+
+def ignore_files_from_args(args: argparse.Namespace) -> Tuple[str, ...]:
+    """Return the ignore files selected by add_exclusion_arguments' options, for process_repository."""
+    return tuple(name for name, selected in (('.gitignore', args.gitignore), ('.dockerignore', args.dockerignore)) if selected)
+
+def exclusions_from_args(args: argparse.Namespace) -> Tuple[Set[str], List[str]]:
+    """Return the (exclude_dirs, exclude_patterns) selected by add_exclusion_arguments' options."""
+    exclude_dirs, exclude_patterns = preset_exclusions(args.exclude_preset)
+    exclude_dirs.update(args.exclude_dir)
+    exclude_patterns.extend(args.exclude)
+    return exclude_dirs, exclude_patterns
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='token-counter',
+        description='Count the tokens in a local directory or remote git repository. '
+                    'See also `token-counter history --help`, `token-counter batch --help` and `token-counter pack --help`.'
+    )
+    parser.add_argument('target', nargs='?', help='Local directory or remote repository URL')
+    parser.add_argument('--total', action='store_true', help='Only print the total token count')
+    parser.add_argument('--format', choices=REPORT_FORMATS,
+                        help='Write a per-file report to stdout as files are counted, instead of tables')
+    parser.add_argument('--top', type=int, nargs='?', const=DEFAULT_TOP_FILES, default=0, metavar='N',
+                        help=f'List the N files with the most tokens (default: {DEFAULT_TOP_FILES})')
+    parser.add_argument('--histogram', action='store_true', help='Show how many files have how many tokens')
+    add_exclusion_arguments(parser)
+
+    performance = parser.add_argument_group('performance')
+    performance.add_argument('--workers', type=int, default=1, metavar='N',
+                             help='Tokenizer processes (default: 1, counting in-process; 0: one per CPU)')
+    performance.add_argument('--walk-threads', type=int, default=1, metavar='N',
+                             help='Threads listing directories; helps on network filesystems (default: 1)')
+    performance.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, metavar='N',
+                             help=f'Files per tokenizer batch (default: {DEFAULT_BATCH_SIZE})')
+    performance.add_argument('--cache', nargs='?', const='', default=None, metavar='DIR',
+                             help='Cache counts so re-scans only tokenize changed files, '
+                                  'in DIR or the default cache directory')
+    performance.add_argument('--max-file-size', type=int, metavar='BYTES',
+                             help='Size above which --large-files applies')
+    performance.add_argument('--large-files', choices=LARGE_FILE_POLICIES, default='exact',
+                             help='Count larger files exactly by streaming them (default), skip them, or sample them')
+    performance.add_argument('--tokenizer', default=TOKENIZER_NAME, metavar='NAME', help=f'Tokenizer to count with (default: {TOKENIZER_NAME})')
+
+    from .estimate import DEFAULT_SAMPLE_FILES, ESTIMATE_MODES
+    estimate = parser.add_argument_group('estimates')
+    estimate.add_argument('--estimate', nargs='?', const='stat', choices=ESTIMATE_MODES, metavar='MODE',
+                          help='Estimate tokens from file sizes instead of tokenizing: with calibrated '
+                               'bytes-per-token ratios only (stat, the default), or by tokenizing a random '
+                               'sample of each extension (sample), which also calibrates the ratios')
+    estimate.add_argument('--sample-files', type=int, default=DEFAULT_SAMPLE_FILES, metavar='N',
+                          help=f'Files tokenized per extension with --estimate sample (default: {DEFAULT_SAMPLE_FILES})')
+
+    git = parser.add_argument_group('git')
+    git.add_argument('--git', nargs='?', const='HEAD', default=None, metavar='REF',
+                     help='Count the committed files of REF (default: HEAD) from git objects')
+    git.add_argument('--base', metavar='REF',
+                     help='With --git and --cache, only count the changes since REF, an earlier scanned commit')
+    git.add_argument('--mirror-cache', nargs='?', const='', default=None, metavar='DIR',
+                     help='Keep a mirror of a remote repository, in DIR or the default mirror directory, '
+                          'and only fetch its changes on later runs')
+    parser.add_argument('--save-tokenizer', metavar='FILE',
+                        help='Save the tokenizer to FILE, for use with TOKEN_COUNTER_TOKENIZER_FILE, and exit')
+    return parser
 
 def main():
-    # Check for correct number of arguments
-    if len(sys.argv) < 2:
-        console.print("[red]Usage: token-counter <repository_url_or_path> [-total][/red]")
-        sys.exit(1)
-        
-    # Check for -total flag
-    total_only = "-total" in sys.argv
-    target = sys.argv[1] if sys.argv[1] != "-total" else sys.argv[2]
-    
-    # Suppress all warnings if total_only is True
-    if total_only:
+    if sys.argv[1:2] == ["history"]:
+        from .history import history_main
+        history_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["batch"]:
+        from .batch import batch_main
+        batch_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["pack"]:
+        from .pack import pack_main
+        pack_main(sys.argv[2:])
+        return
+
+    parser = _build_parser()
+    args = parser.parse_args(_legacy_args(sys.argv[1:]))
+    console = get_console()
+
+    if args.save_tokenizer:
+        export_tokenizer(args.save_tokenizer)
+        console.print(f"[green]Saved {TOKENIZER_NAME} tokenizer to {args.save_tokenizer}[/green]")
+        return
+    if args.target is None:
+        # e.g. "--cache /path", where the path was taken as the cache directory
+        parser.error("a target directory or repository URL is required; "
+                     "give it before --cache, --git or --mirror-cache, or use --cache=DIR")
+    if args.base is not None and (args.git is None or args.cache is None):
+        parser.error("--base requires --git and --cache")
+    if args.estimate is not None and (args.git is not None or args.format is not None or args.top or args.histogram):
+        parser.error("--estimate cannot be combined with --git, --format, --top or --histogram")
+
+    total_only = args.total
+    report_format = args.format
+    if report_format is not None:
+        # stdout carries the report
+        from rich.console import Console
+        console = Console(stderr=True)
+    # Only the result is written with --total or --format
+    quiet = total_only or report_format is not None
+    target = args.target
+    exclude_dirs, exclude_patterns = exclusions_from_args(args)
+    options = ScanOptions(
+        exclude_dirs=exclude_dirs,
+        exclude_patterns=exclude_patterns,
+        ignore_files=ignore_files_from_args(args),
+        tokenizer=args.tokenizer,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        walk_threads=args.walk_threads,
+        max_file_size=args.max_file_size,
+        large_file_policy=args.large_files
+    )
+    estimate_mode = args.estimate
+    # Estimates keep their calibration in the cache, so it is always opened for them
+    cache = TokenCache(args.cache or None) if args.cache is not None or estimate_mode is not None else None
+    tokenizer = args.tokenizer
+    git_ref = args.git
+    git_base = args.base
+    use_mirror = args.mirror_cache is not None
+    mirror_dir = args.mirror_cache or None
+
+    # Count with each model's own tokenizer where one is available locally
+    model_tokenizers = {}
+    if estimate_mode is not None:
+        # Estimates are only calibrated for the one tokenizer
+        model_tokenizers = {model: tokenizer for model in CONTEXT_WINDOWS}
+    elif not quiet:
+        model_tokenizers = {
+            model: resolve_model_tokenizer(MODEL_TOKENIZERS.get(model), tokenizer)
+            for model in CONTEXT_WINDOWS
+        }
+    tokenizer_totals = {}
+
+    # Suppress all warnings if only the result is written
+    if quiet:
         import logging
         logging.getLogger('transformers').setLevel(logging.ERROR)
 
@@ -400,59 +1830,168 @@ def main():
 
     # Check if the target is a local directory
     if os.path.isdir(target):
-        if not total_only:
-            console.print(f"[green]Analyzing local directory: {target}[/green]")
+        if not quiet:
+            if git_ref is not None:
+                console.print(f"[green]Analyzing {git_ref} of local repository: {target}[/green]")
+            else:
+                console.print(f"[green]Analyzing local directory: {target}[/green]")
         analyze_path = target
     else:
-        # Clone the repository to a temporary directory
-        temp_dir = tempfile.mkdtemp()
-        if not total_only:
-            console.print(f"[yellow]Cloning repository: {target}[/yellow]")
+        if not quiet:
+            console.print(f"[yellow]{'Updating mirror of' if use_mirror else 'Cloning'} repository: {target}[/yellow]")
         try:
-            Repo.clone_from(target, temp_dir)
-            analyze_path = temp_dir
+            source = update_mirror(target, mirror_dir) if use_mirror else target
+            if use_mirror and git_ref is not None:
+                # The mirror has every ref, and its objects are read in place
+                analyze_path = source
+            else:
+                # Clone the repository to a temporary directory
+                temp_dir = tempfile.mkdtemp()
+                analyze_path = temp_dir
+                if git_ref is not None:
+                    # Objects are read directly, so a bare clone of the one commit is enough
+                    clone_for_scan(source, temp_dir, git_ref)
+                    git_ref = 'HEAD'
+                else:
+                    # Only the latest commit, and only files that can be counted, are checked out
+                    clone_worktree(source, temp_dir, sparse_patterns=sparse_checkout_patterns(exclude_dirs, exclude_patterns))
         except Exception as e:
             console.print(f"[red]Error cloning repository: {str(e)}[/red]")
-            shutil.rmtree(temp_dir)
+            if temp_dir:
+                shutil.rmtree(temp_dir)
             sys.exit(1)
 
+    # Largest files and the tokens-per-file distribution, only collected for the tables
+    top_files = TopFiles(args.top) if args.top > 0 and not quiet else None
+    token_histogram = TokenHistogram() if args.histogram and not quiet else None
+
+    # Progress bar driven by process_repository's on_file hook
+    progress = ScanProgress()
+    on_file = None
+    progress_display = contextlib.nullcontext()
+    report = None
+    estimates = None
+    if report_format is not None:
+        from .report import FileReportWriter
+        report = FileReportWriter(sys.stdout, report_format, analyze_path)
+    elif estimate_mode is not None:
+        if not total_only:
+            progress_display = console.status("[bold blue]Estimating tokens")
+    elif not total_only:
+        from rich.progress import Progress
+        progress_display = Progress(console=console)
+        progress_task = progress_display.add_task("[bold blue]Processing files", total=None)
+
+        def on_file(file_path, extension, counts):
+            progress_display.update(progress_task, total=progress.files_to_process, completed=progress.files_tokenized)
+
     try:
-        # Pass empty sets/lists if None (already handled in process_repository, but safe)
-        total_tokens, extension_stats, file_counts = process_repository(
-            analyze_path,
-            total_only=total_only,
-            exclude_dirs=set(),      # CLI doesn't support custom excludes yet
-            exclude_patterns=[]  # CLI doesn't support custom excludes yet
-        )
+        # Size-based estimates, or exact counts with the scan settings gathered in options
+        with progress_display:
+            if estimate_mode is not None:
+                from .estimate import estimate_repository, total_estimate
+                estimates, sampled = estimate_repository(
+                    analyze_path,
+                    options,
+                    sample_files=args.sample_files if estimate_mode == 'sample' else 0,
+                    calibration=cache.get_ratio_sums(tokenizer),
+                    cache=cache,
+                    progress=progress
+                )
+                if sampled:
+                    cache.add_ratio_sums(sampled, tokenizer)
+                total_tokens, total_error = total_estimate(estimates)
+                extension_stats = {estimate.extension: estimate.tokens for estimate in estimates}
+                file_counts = {estimate.extension: estimate.files for estimate in estimates}
+                tokenizer_totals[tokenizer] = total_tokens
+            else:
+                total_tokens, extension_stats, file_counts = process_repository(
+                    analyze_path,
+                    total_only=quiet,
+                    options=options._replace(extra_tokenizers=sorted(set(model_tokenizers.values()) - {tokenizer})),
+                    cache=cache,
+                    progress=progress,
+                    git_ref=git_ref,
+                    git_base=git_base,
+                    tokenizer_totals=tokenizer_totals,
+                    on_file=on_file,
+                    on_record=report.write if report is not None else None,
+                    top_files=top_files,
+                    token_histogram=token_histogram
+                )
     except Exception as e:
         if not total_only:
             console.print(f"[red]Error analyzing repository: {str(e)}[/red]")
         if temp_dir:
             shutil.rmtree(temp_dir)
         sys.exit(1)
+    finally:
+        if cache is not None:
+            cache.close()
 
     # Print results
-    if total_only:
+    if report is not None:
+        report.finish(total_tokens, extension_stats, file_counts)
+    elif total_only:
         # Only print the total number
         print(total_tokens)
+    elif estimates is not None:
+        console.print("\n[bold cyan]Results:[/bold cyan]")
+        console.print(
+            f"Estimated tokens: [green]{format_number(total_tokens)}[/green] ({total_tokens:,}), "
+            f"95% interval {format_number(max(0, total_tokens - total_error))}-{format_number(total_tokens + total_error)}"
+        )
     else:
         console.print("\n[bold cyan]Results:[/bold cyan]")
         console.print(f"Total tokens: [green]{format_number(total_tokens)}[/green] ({total_tokens:,})")
-
-    if not total_only:
-        # Create and populate extension table
-        ext_table = Table(title="\n[bold]Tokens by file extension[/bold]")
-        ext_table.add_column("Extension", style="cyan")
-        ext_table.add_column("Tokens", justify="right", style="green")
-        ext_table.add_column("Files", justify="right", style="yellow")
-
-        for ext, count in sorted(extension_stats.items(), key=lambda x: x[1], reverse=True):
-            ext_table.add_row(
-                ext,
-                f"{format_number(count)} ({count:,})",
-                f"{file_counts[ext]} file{'s' if file_counts[ext] != 1 else ''}"
+        if cache is not None:
+            cache_stats = cache.stats()
+            console.print(
+                f"Cache: {cache_stats['hits']:,} unchanged, {cache_stats['content_hits']:,} matched by content, "
+                f"{cache_stats['misses']:,} tokenized"
             )
-        console.print(ext_table)
+
+    if not quiet:
+        from rich.table import Table
+
+        if estimates is not None:
+            ext_table = Table(title="\n[bold]Estimated tokens by file extension[/bold]")
+            ext_table.add_column("Extension", style="cyan")
+            ext_table.add_column("Tokens", justify="right", style="green")
+            ext_table.add_column("95% interval", justify="right")
+            ext_table.add_column("Files", justify="right", style="yellow")
+            ext_table.add_column("Size", justify="right")
+            ext_table.add_column("Bytes/token", justify="right")
+            ext_table.add_column("Basis", style="dim")
+            for estimate in estimates:
+                if estimate.source == 'sample':
+                    basis = f"{estimate.sampled} file{'s' if estimate.sampled != 1 else ''} sampled"
+                else:
+                    basis = estimate.source
+                ext_table.add_row(
+                    estimate.extension,
+                    f"{estimate.tokens:,}",
+                    f"±{estimate.error:,}" if estimate.error else "-",
+                    f"{estimate.files} file{'s' if estimate.files != 1 else ''}",
+                    format_number(estimate.bytes),
+                    f"{estimate.bytes_per_token:.2f}" if estimate.bytes_per_token is not None else "-",
+                    basis
+                )
+            console.print(ext_table)
+        else:
+            # Create and populate extension table
+            ext_table = Table(title="\n[bold]Tokens by file extension[/bold]")
+            ext_table.add_column("Extension", style="cyan")
+            ext_table.add_column("Tokens", justify="right", style="green")
+            ext_table.add_column("Files", justify="right", style="yellow")
+
+            for ext, count in sorted(extension_stats.items(), key=lambda x: x[1], reverse=True):
+                ext_table.add_row(
+                    ext,
+                    f"{format_number(count)} ({count:,})",
+                    f"{file_counts[ext]} file{'s' if file_counts[ext] != 1 else ''}"
+                )
+            console.print(ext_table)
 
         # Group results by technology category
         tech_stats = {}
@@ -476,43 +2015,53 @@ def main():
             )
         console.print(tech_table)
 
-        # Create and populate context window table
-        windows = {
-            # OpenAI Models
-            "GPT-3.5 (4K)": 4096,
-            "GPT-4 (8K)": 8192,
-            "GPT-4 (32K)": 32768,
-            "GPT-4 Turbo (128K)": 128000,
-
-            # Anthropic Models
-            "Claude 2 (100K)": 100000,
-            "Claude 3 Opus (200K)": 200000,
-            "Claude 3 Sonnet (200K)": 200000,
-            "Claude 3 Haiku (200K)": 200000,
-
-            # Google Models
-            "Gemini Pro (32K)": 32768,
-            "PaLM 2 (8K)": 8192,
-
-            # Meta Models
-            "Llama 2 (4K)": 4096,
-            "Code Llama (100K)": 100000,
-
-            # Other Models
-            "Mistral Large (32K)": 32768,
-            "Mixtral 8x7B (32K)": 32768,
-            "Yi-34B (200K)": 200000,
-            "Cohere Command (128K)": 128000,
-        }
+        if top_files is not None:
+            report_root = analyze_path if os.path.isdir(analyze_path) else os.path.dirname(analyze_path)
+            top_table = Table(title="\n[bold]Largest files[/bold]")
+            top_table.add_column("File", style="cyan", overflow="fold")
+            top_table.add_column("Tokens", justify="right", style="green")
+            for file_path, count in top_files.largest():
+                top_table.add_row(os.path.relpath(file_path, report_root), f"{format_number(count)} ({count:,})")
+            console.print(top_table)
+
+        if token_histogram is not None:
+            histogram_table = Table(
+                title=f"\n[bold]Tokens per file[/bold] (median under {token_histogram.quantile(0.5) + 1:,}, "
+                      f"90% under {token_histogram.quantile(0.9) + 1:,})"
+            )
+            histogram_table.add_column("Tokens", justify="right", style="cyan")
+            histogram_table.add_column("Files", justify="right", style="yellow")
+            histogram_table.add_column("Total tokens", justify="right", style="green")
+            histogram_table.add_column("")
+            rows = token_histogram.describe()
+            most_files = max((row['files'] for row in rows), default=0)
+            for row in rows:
+                if row['max'] is None:
+                    label = f"{row['min']:,}+"
+                elif row['max'] == row['min']:
+                    label = f"{row['min']:,}"
+                else:
+                    label = f"{row['min']:,}-{row['max']:,}"
+                bar = '#' * round(30 * row['files'] / most_files) if most_files else ''
+                histogram_table.add_row(label, f"{row['files']:,}", format_number(row['tokens']), f"[blue]{bar}[/blue]")
+            console.print(histogram_table)
 
+        # Create and populate context window table
         context_table = Table(title="\n[bold]Context Window Comparisons[/bold]")
         context_table.add_column("Model", style="blue")
+        context_table.add_column("Tokenizer", style="dim")
         context_table.add_column("Context Usage", justify="right")
 
-        for model, window in windows.items():
-            percentage = (total_tokens / window) * 100
+        for model, window in CONTEXT_WINDOWS.items():
+            model_tokenizer = model_tokenizers[model]
+            percentage = (tokenizer_totals[model_tokenizer] / window) * 100
             color = "red" if percentage > 100 else "green"
-            context_table.add_row(model, f"[{color}]{percentage:.1f}%[/{color}]")
+            exact = MODEL_TOKENIZERS.get(model) == model_tokenizer
+            context_table.add_row(
+                model,
+                model_tokenizer if exact else f"{model_tokenizer} (approx.)",
+                f"[{color}]{percentage:.1f}%[/{color}]"
+            )
         console.print(context_table)
 
     if temp_dir:
@@ -0,0 +1,88 @@
+"""Tests for the tokenizer backend registry."""
+
+import base64
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from codebase_token_counter import backends
+from codebase_token_counter.cache import TokenCache
+from codebase_token_counter.token_counter import count_tokens, export_tokenizer, process_repository
+
+class WordBackend(backends.TokenizerBackend):
+    """Counts whitespace-separated words."""
+
+    def count(self, text):
+        return len(text.split())
+
+@pytest.fixture
+def tokenizer_dir(monkeypatch):
+    """Point the registry at an empty tokenizer directory and forget loaded backends."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        monkeypatch.setattr(backends, "TOKENIZER_DIR", temp_dir)
+        monkeypatch.setattr(backends, "_backends", {})
+        monkeypatch.setattr(backends, "_loaders", dict(backends._loaders))
+        yield temp_dir
+
+def test_registered_backend(tokenizer_dir):
+    """Test registering a custom backend and falling back for missing ones."""
+    backends.register_tokenizer("words", lambda: WordBackend("words"))
+
+    assert count_tokens("one two three", tokenizer="words") == 3
+    assert backends.is_available("words")
+    assert "words" in backends.available_tokenizers()
+    assert backends.resolve_model_tokenizer("words") == "words"
+    assert backends.resolve_model_tokenizer("missing") == backends.DEFAULT_TOKENIZER
+    with pytest.raises(LookupError):
+        backends.get_backend("missing")
+
+def test_tokenizer_files_are_discovered(tokenizer_dir):
+    """Test loading tokenizer.json and .tiktoken files from the tokenizer directory."""
+    export_tokenizer(str(Path(tokenizer_dir, "local-gpt2.json")))
+    text = "def add(a, b):\n    return a + b\n"
+    assert count_tokens(text, tokenizer="local-gpt2") == count_tokens(text)
+
+    pytest.importorskip("tiktoken")
+    # Every single byte as a token, plus one merge
+    ranks = [bytes([i]) for i in range(256)] + [b"ab"]
+    Path(tokenizer_dir, "tiny.tiktoken").write_text(
+        "".join(f"{base64.b64encode(token).decode()} {rank}\n" for rank, token in enumerate(ranks))
+    )
+    assert count_tokens("ab ab", tokenizer="tiny") == 3
+
+def test_single_pass_counts_every_tokenizer(tokenizer_dir):
+    """Test that process_repository counts with extra tokenizers in the same pass."""
+    backends.register_tokenizer("words", lambda: WordBackend("words"))
+    with tempfile.TemporaryDirectory() as repo_path, tempfile.TemporaryDirectory() as cache_dir:
+        Path(repo_path, "main.py").write_text("print('Hello, world!')\n")
+        Path(repo_path, "README.md").write_text("# Test Repository\n\nThis is a test.\n")
+
+        totals = {}
+        with TokenCache(cache_dir) as cache:
+            total_tokens, _, _ = process_repository(
+                repo_path, total_only=True, extra_tokenizers=["words"], tokenizer_totals=totals, cache=cache
+            )
+        assert totals == {"gpt2": total_tokens, "words": 9}
+
+        # Cached counts are reused for every tokenizer
+        cached_totals = {}
+        with TokenCache(cache_dir) as cache:
+            process_repository(repo_path, total_only=True, extra_tokenizers=["words"], tokenizer_totals=cached_totals, cache=cache)
+            assert cache.stats() == {'hits': 2, 'content_hits': 0, 'misses': 0}
+        assert cached_totals == totals
+
+def test_default_tokenizer_is_not_downloaded(tokenizer_dir, monkeypatch):
+    """Test that GPT-2 only loads from local files, with a hint to save it when they are missing."""
+    transformers = pytest.importorskip("transformers")
+    calls = []
+
+    def from_pretrained(name, **kwargs):
+        calls.append(kwargs)
+        raise OSError(f"{name} is not in the cache")
+
+    monkeypatch.delenv(backends.TOKENIZER_FILE_ENV, raising=False)
+    monkeypatch.setattr(transformers.AutoTokenizer, "from_pretrained", from_pretrained)
+    with pytest.raises(LookupError, match="--save-tokenizer"):
+        backends.get_backend()
+    assert calls == [{"local_files_only": True}]
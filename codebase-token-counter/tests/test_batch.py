@@ -0,0 +1,76 @@
+"""Tests for counting many repositories from a manifest."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+from git import Repo
+
+from codebase_token_counter.batch import BatchTarget, batch_main, iter_batch_results, read_manifest
+from codebase_token_counter.token_counter import create_tokenizer_pool, process_repository
+from tests.test_repository import create_test_repo
+
+def test_read_manifest():
+    """Test that manifest lines give targets with optional refs, skipping comments."""
+    lines = ["# repositories\n", "\n", "https://example.com/a.git v1.0\n", "  ./local  \n"]
+    assert read_manifest(lines) == [BatchTarget("https://example.com/a.git", "v1.0"), BatchTarget("./local")]
+
+def test_batch_results_match_single_scans():
+    """Test that a batch with a local, a cloned and a missing target reports each one, removing clones."""
+    for repo_path in create_test_repo():
+        expected = process_repository(repo_path, total_only=True)
+        targets = [BatchTarget(repo_path), BatchTarget(f"file://{repo_path}"), BatchTarget("file:///no/such/repo")]
+        before = set(os.listdir(tempfile.gettempdir()))
+        executor = create_tokenizer_pool(2)
+        try:
+            results = list(iter_batch_results(targets, clone_jobs=2, workers=2, batch_size=1, executor=executor))
+        finally:
+            executor.shutdown()
+
+        assert sorted(result['target'] for result in results) == sorted(target.target for target in targets)
+        for result in results:
+            if result['target'] == "file:///no/such/repo":
+                assert result['error'].startswith("Clone failed")
+            else:
+                assert (result['total_tokens'], result['extensions'], result['files']) == expected
+        assert set(os.listdir(tempfile.gettempdir())) <= before
+
+def test_batch_main_counts_manifest_refs():
+    """Test `token-counter batch` on a manifest with a branch, a commit ID and a missing repository."""
+    for repo_path in create_test_repo():
+        repo = Repo(repo_path)
+        first_commit = repo.head.commit.hexsha
+        Path(repo_path, "main.py").write_text("print('Hello, world!')\nprint('Goodbye!')\n")
+        repo.index.add(["main.py"])
+        repo.index.commit("Second commit")
+        at_first = process_repository(repo_path, total_only=True, git_ref=first_commit)
+        at_head = process_repository(repo_path, total_only=True)
+        assert at_first != at_head
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest = Path(temp_dir, "manifest.txt")
+            manifest.write_text(
+                f"file://{repo_path} {first_commit}\n"
+                f"file://{repo_path} {repo.active_branch.name}\n"
+                f"{repo_path} {first_commit}\n"
+                "file:///no/such/repo\n"
+            )
+            output = Path(temp_dir, "results.jsonl")
+            with pytest.raises(SystemExit) as exit_info:
+                batch_main([str(manifest), "--output", str(output), "--workers", "1", "--clone-jobs", "2"])
+            assert exit_info.value.code == 1
+            results = [json.loads(line) for line in output.read_text().splitlines()]
+
+        assert len(results) == 4
+        counted = {
+            (result['target'].startswith('file://'), result['ref']): (result['total_tokens'], result['extensions'], result['files'])
+            for result in results if 'error' not in result
+        }
+        assert counted == {
+            (True, first_commit): at_first,
+            (True, repo.active_branch.name): at_head,
+            (False, first_commit): at_first,
+        }
+        assert [result['target'] for result in results if 'error' in result] == ["file:///no/such/repo"]
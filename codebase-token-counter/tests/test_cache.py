@@ -0,0 +1,109 @@
+"""Tests for the persistent token cache."""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from codebase_token_counter.cache import TokenCache, lookup_digest
+from codebase_token_counter.token_counter import process_repository
+
+def test_cache_roundtrip_and_eviction():
+    """Test storing, looking up and evicting cached counts."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = TokenCache(cache_dir, max_entries=2)
+        cache.put("/a.py", 10, 1, "digest-a", 3)
+        cache.put("/b.py", 20, 2, "digest-b", 5)
+        cache.put("/c.py", 30, 3, "digest-c", 7)
+
+        assert cache.get("/a.py", 10, 1) == 3
+        assert cache.get("/a.py", 11, 1) is None  # Size changed
+        assert cache.stats() == {'hits': 1, 'content_hits': 0, 'misses': 3}
+
+        cache.flush()
+        assert lookup_digest(cache.path, "gpt2", "digest-b") == 5
+        assert lookup_digest(cache.path, "other-tokenizer", "digest-b") is None
+        cache.close()
+
+        # The least recently used entry is evicted, the recently hit one kept
+        cache = TokenCache(cache_dir)
+        assert cache.get("/a.py", 10, 1) == 3
+        assert cache.get("/b.py", 20, 2) is None
+        assert cache.get("/c.py", 30, 3) == 7
+        cache.close()
+
+def test_process_repository_reuses_cached_counts():
+    """Test that a re-scan only tokenizes changed files."""
+    with tempfile.TemporaryDirectory() as repo_path, tempfile.TemporaryDirectory() as cache_dir:
+        Path(repo_path, "main.py").write_text("print('Hello, world!')\n")
+        Path(repo_path, "README.md").write_text("# Test Repository\n")
+
+        with TokenCache(cache_dir) as cache:
+            first = process_repository(repo_path, total_only=True, cache=cache)
+            assert cache.stats() == {'hits': 0, 'content_hits': 0, 'misses': 2}
+
+        # Touch one file without changing its content
+        os.utime(Path(repo_path, "main.py"), ns=(1, 1))
+        with TokenCache(cache_dir) as cache:
+            second = process_repository(repo_path, total_only=True, cache=cache)
+            assert cache.stats() == {'hits': 1, 'content_hits': 1, 'misses': 0}
+
+        assert first == second
+
+def test_blob_and_commit_counts():
+    """Test the blob SHA and commit result tables used by git scans."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with TokenCache(cache_dir) as cache:
+            cache.put_blob_counts("sha-text", ("gpt2", "cl100k_base"), {"gpt2": 4, "cl100k_base": 3})
+            cache.put_blob_counts("sha-binary", ("gpt2",), None)
+            cache.put_commit_counts("commit", "key", ({"gpt2": {".py": 9, ".md": 0}}, {".py": 2, ".md": 1}))
+
+        with TokenCache(cache_dir) as cache:
+            assert cache.get_blob_counts(["sha-text", "sha-binary", "sha-new"], ("gpt2",)) == {
+                "sha-text": {"gpt2": 4}, "sha-binary": None
+            }
+            assert cache.get_blob_counts(["sha-binary"], ("gpt2", "cl100k_base")) == {}
+            assert cache.get_commit_counts("commit", "key", ("gpt2",)) == ({"gpt2": {".py": 9, ".md": 0}}, {".py": 2, ".md": 1})
+            assert cache.get_commit_counts("commit", "other-key", ("gpt2",)) is None
+            assert cache.get_commit_counts("commit", "key", ("gpt2", "cl100k_base")) is None
+
+def test_eviction_by_size_and_lookups_from_threads():
+    """Test that eviction keeps the database within max_bytes, and digests can be looked up from any thread."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = TokenCache(cache_dir, max_bytes=None)
+        for i in range(5000):
+            cache.put(f"/src/file{i}.py", i, i, f"digest-{i}", i)
+        cache.flush()
+        full = cache.used_bytes()
+        cache.max_bytes = full // 4
+        cache.evict()
+        assert cache.used_bytes() <= full // 4
+        # The most recently stored entries are kept
+        assert cache.get("/src/file4999.py", 4999, 4999) == 4999
+        assert cache.get("/src/file0.py", 0, 0) is None
+
+        # Each thread gets its own reader connection
+        assert lookup_digest(cache.path, "gpt2", "digest-4999") == 4999
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            assert list(executor.map(lambda _: lookup_digest(cache.path, "gpt2", "digest-4999"), range(4))) == [4999] * 4
+        cache.close()
+
+def test_caches_on_one_database_write_concurrently():
+    """Test that two caches on the same database can both store batches while a scan is running."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Neither cache is closed until both have stored everything, as in two overlapping scans
+        stored = threading.Barrier(2)
+
+        def store(name):
+            with TokenCache(cache_dir) as cache:
+                for batch in range(20):
+                    for i in range(50):
+                        cache.put(f"/{name}/file{batch}-{i}.py", i, batch, f"{name}-{batch}-{i}", i)
+                    cache.commit()
+                stored.wait(timeout=10)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(store, ("first", "second")))
+        with TokenCache(cache_dir) as cache:
+            assert cache.get("/first/file19-49.py", 49, 19) == 49
+            assert cache.get("/second/file19-49.py", 49, 19) == 49
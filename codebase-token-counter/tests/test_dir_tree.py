@@ -0,0 +1,36 @@
+"""Tests for per-directory token totals."""
+
+import os
+
+import pytest
+
+from codebase_token_counter.dir_tree import DirectoryTree
+from codebase_token_counter.token_counter import process_repository
+from tests.test_repository import create_test_repo
+
+def test_directory_tree_rolls_up_totals():
+    """Test that every directory's totals match a scan of that directory alone."""
+    for repo_path in create_test_repo():
+        os.makedirs(os.path.join(repo_path, "src", "core", "deep"))
+        with open(os.path.join(repo_path, "src", "core", "deep", "model.py"), "w") as f:
+            f.write("class Model:\n    layers = [1, 2, 3]\n" * 20)
+
+        tree = DirectoryTree()
+        total_tokens, _, file_counts = process_repository(repo_path, total_only=True, directory_tree=tree)
+        assert tree.finished
+        assert (tree.tokens[0], tree.files[0]) == (total_tokens, sum(file_counts.values()))
+
+        for directory in ("src", "src/core", "src/core/deep", "tests", "static"):
+            node = tree.find(directory)
+            tokens, _, files = process_repository(os.path.join(repo_path, directory), total_only=True)
+            assert (tree.tokens[node], tree.files[node]) == (tokens, sum(files.values()))
+            assert tree.path(node) == directory
+
+        root = tree.describe(0)
+        names = [child['name'] for child in root['children']]
+        assert sorted(names) == ["src", "static", "tests"]
+        assert [child['tokens'] for child in root['children']] == sorted((child['tokens'] for child in root['children']), reverse=True)
+        assert tree.describe(tree.find("src"))['children'][0]['directories'] == 1
+        assert tree.find("missing") is None
+        with pytest.raises(ValueError):
+            tree.add("src", 1)
@@ -0,0 +1,62 @@
+"""Tests for token estimates from file sizes."""
+
+import tempfile
+from pathlib import Path
+
+from codebase_token_counter.cache import TokenCache
+from codebase_token_counter.estimate import DEFAULT_BYTES_PER_TOKEN, RatioStats, estimate_repository, total_estimate
+from codebase_token_counter.token_counter import process_repository
+from tests.test_repository import create_test_repo
+
+def test_ratio_stats():
+    """Test the ratio and its standard error from sums."""
+    stats = RatioStats()
+    for size, tokens in [(100, 25), (200, 50), (400, 100)]:
+        stats = stats.add(size, tokens)
+    assert stats.tokens_per_byte == 0.25
+    # Every file has the same ratio, so there is no spread
+    assert stats.standard_error() == 0
+    assert stats.merge(RatioStats().add(100, 50)).standard_error() > 0
+    assert RatioStats().add(100, 25).standard_error() is None
+
+def test_estimate_repository_samples_and_calibrates():
+    """Test that sampling every file is exact, and stored ratios calibrate a stat-only estimate."""
+    for repo_path in create_test_repo():
+        total_tokens, extension_stats, file_counts = process_repository(repo_path, total_only=True)
+
+        # Without calibration, every extension uses the default ratio
+        estimates, sampled = estimate_repository(repo_path)
+        assert sampled == {}
+        assert {estimate.source for estimate in estimates} == {'default'}
+        assert {estimate.extension: estimate.files for estimate in estimates} == file_counts
+        for estimate in estimates:
+            assert estimate.tokens == round(estimate.bytes / DEFAULT_BYTES_PER_TOKEN)
+
+        # The test repository has at most three files per extension
+        estimates, sampled = estimate_repository(repo_path, sample_files=3)
+        assert {estimate.source for estimate in estimates} == {'exact'}
+        assert {estimate.extension: estimate.tokens for estimate in estimates} == extension_stats
+        assert total_estimate(estimates) == (total_tokens, 0)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = TokenCache(cache_dir)
+            cache.add_ratio_sums(sampled)
+            cache.add_ratio_sums(sampled)
+            assert cache.get_ratio_sums()['.py'] == tuple(sampled['.py'].merge(sampled['.py']))
+            assert cache.get_ratio_sums('other-tokenizer') == {}
+
+            # Files grow without new calibration; ratios apply to the new sizes
+            Path(repo_path, "main.py").write_text(Path(repo_path, "main.py").read_text() * 3)
+            estimates, _ = estimate_repository(repo_path, calibration=cache.get_ratio_sums())
+            cache.close()
+        by_extension = {estimate.extension: estimate for estimate in estimates}
+        assert {estimate.source for estimate in estimates} == {'calibrated'}
+        python = by_extension['.py']
+        assert python.tokens == round(python.bytes * sampled['.py'].tokens_per_byte)
+        assert python.error > 0
+        assert by_extension['.md'].tokens == extension_stats['.md']
+
+        # One file sampled out of three is extrapolated, with an interval
+        estimates, _ = estimate_repository(repo_path, sample_files=1, seed=1)
+        python = next(estimate for estimate in estimates if estimate.extension == '.py')
+        assert python.source == 'sample' and python.sampled == 1 and python.error > 0
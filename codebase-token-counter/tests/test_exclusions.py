@@ -0,0 +1,44 @@
+"""Tests for the compiled exclusion matcher."""
+
+import fnmatch
+
+from codebase_token_counter.exclusions import EXCLUDE_PRESETS, ExclusionMatcher, PatternSet
+
+def test_matcher_follows_path_and_name_rules():
+    """Test directory names, path patterns and name patterns."""
+    dirs, patterns = EXCLUDE_PRESETS['dependencies']
+    matcher = ExclusionMatcher(dirs, patterns + ['*.log', 'Thumbs.db', 'src/gen/*.py', 'data?/'])
+
+    # Excluded names apply at any depth, path patterns to the whole relative path
+    assert matcher.excludes_dir('bower_components', 'web/bower_components')
+    assert matcher.excludes_dir('.git', '.git')
+    assert matcher.excludes_dir('node_modules', 'node_modules')
+    assert not matcher.excludes_dir('node_modules', 'web/node_modules')
+    assert matcher.excludes_dir('pkg.egg-info', 'pkg.egg-info')
+    assert matcher.excludes_dir('pkg.egg-info', 'src/pkg.egg-info')  # '*' also matches '/'
+    assert matcher.excludes_dir('data1', 'data1')
+    assert not matcher.excludes_dir('src', 'src')
+    # Without a relative path only names are checked
+    assert not matcher.excludes_dir('node_modules', None)
+
+    assert matcher.excludes_file('debug.log', 'logs/debug.log')
+    assert matcher.excludes_file('Thumbs.db', 'img/Thumbs.db')
+    assert matcher.excludes_file('a.py', 'src/gen/a.py')
+    assert matcher.excludes_file('a.py', 'src/gen/sub/a.py')
+    assert not matcher.excludes_file('a.py', 'src/a.py')
+    assert not matcher.excludes_file('main.py', 'main.py')
+
+def test_matcher_agrees_with_fnmatch():
+    """Test that compiled patterns answer like fnmatch for each pattern kind."""
+    patterns = ['*.md', 'README', 'test_*.py', '[ab]*.txt', 'x?z', '*']
+    names = ['a.md', 'README', 'README.md', 'test_x.py', 'a.txt', 'c.txt', 'xyz', 'xz', '', 'b.md.bak']
+    for pattern in patterns:
+        matcher = ExclusionMatcher(set(), [pattern])
+        pattern_set = PatternSet([pattern])
+        for name in names:
+            assert matcher.excludes_file(name, 'dir/' + name) == fnmatch.fnmatch(name, pattern), (pattern, name)
+            assert pattern_set.matches(name) == fnmatch.fnmatch(name, pattern), (pattern, name)
+    combined = PatternSet(patterns[:-1])
+    assert [name for name in names if combined.matches(name)] == [
+        name for name in names if any(fnmatch.fnmatch(name, pattern) for pattern in patterns[:-1])
+    ]
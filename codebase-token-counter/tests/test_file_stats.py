@@ -0,0 +1,43 @@
+"""Tests for the largest files and the tokens-per-file histogram."""
+
+import random
+
+from codebase_token_counter.file_stats import TokenHistogram, TopFiles
+from codebase_token_counter.token_counter import iter_file_token_counts, process_repository
+from tests.test_repository import create_test_repo
+
+def test_top_files_and_histogram():
+    """Test that the bounded heap keeps the largest files and buckets hold their token ranges."""
+    rng = random.Random(7)
+    files = [(f"file{i}.py", rng.choice([0, 1, 5, rng.randint(0, 10 ** 6)])) for i in range(2000)]
+    top_files = TopFiles(25)
+    histogram = TokenHistogram()
+    for path, tokens in files:
+        top_files.add(path, tokens)
+        histogram.add(tokens)
+    assert top_files.largest() == [(path, tokens) for tokens, path in sorted(((t, p) for p, t in files), reverse=True)[:25]]
+
+    rows = histogram.describe()
+    assert sum(row['files'] for row in rows) == len(files)
+    assert sum(row['tokens'] for row in rows) == sum(tokens for _, tokens in files)
+    assert (rows[0]['min'], rows[0]['max']) == (0, 0)
+    for path, tokens in files:
+        low, high = histogram.bounds(histogram.bucket(tokens))
+        assert low <= tokens <= high
+    histogram.remove(5)
+    assert histogram.files[histogram.bucket(5)] == sum(1 for _, tokens in files if 4 <= tokens <= 7) - 1
+    assert histogram.bounds(len(histogram.files) - 1)[1] is None
+    assert TopFiles(0).largest() == []
+
+def test_scan_collects_file_stats():
+    """Test that process_repository feeds every counted file to TopFiles and TokenHistogram."""
+    for repo_path in create_test_repo():
+        top_files = TopFiles(3)
+        histogram = TokenHistogram()
+        total_tokens, _, file_counts = process_repository(
+            repo_path, total_only=True, top_files=top_files, token_histogram=histogram
+        )
+        records = sorted(((record.tokens, record.path) for record in iter_file_token_counts(repo_path)), reverse=True)
+        assert top_files.largest() == [(path, tokens) for tokens, path in records[:3]]
+        assert sum(histogram.files) == sum(file_counts.values())
+        assert sum(histogram.tokens) == total_tokens
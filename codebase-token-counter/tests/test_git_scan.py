@@ -0,0 +1,108 @@
+"""Tests for counting files from the git object database."""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+from git import Repo
+
+from codebase_token_counter.cache import TokenCache
+from codebase_token_counter.git_scan import clone_for_scan, clone_worktree, iter_tree, read_blobs, update_mirror
+from codebase_token_counter.token_counter import iter_file_token_counts, process_repository, sparse_checkout_patterns
+from tests.test_repository import create_test_repo
+
+def test_git_scan_matches_worktree():
+    """Test that counting HEAD's blobs gives the worktree totals, ignoring untracked files."""
+    for repo_path in create_test_repo():
+        expected = process_repository(repo_path, total_only=True)
+        Path(repo_path, "untracked.py").write_text("print('not committed')\n")
+
+        assert process_repository(repo_path, total_only=True, git_ref='HEAD') == expected
+        assert process_repository(repo_path, total_only=True, git_ref='HEAD', workers=2, batch_size=1) == expected
+        with pytest.raises(ValueError):
+            process_repository(repo_path, total_only=True, git_ref='no-such-ref')
+
+def test_identical_blobs_are_tokenized_once():
+    """Test that files sharing a blob SHA are counted from a single read."""
+    for repo_path in create_test_repo():
+        repo = Repo(repo_path)
+        Path(repo_path, "copy.py").write_text(Path(repo_path, "main.py").read_text())
+        repo.index.add(["copy.py"])
+        repo.index.commit("Copy main.py")
+
+        entries = {entry.path: entry for entry in iter_tree(repo_path)}
+        assert entries["copy.py"].sha == entries["main.py"].sha
+        assert [content for _, content in read_blobs(repo_path, [entries["main.py"].sha])] == [b"print('Hello, world!')\n"]
+
+        records = {os.path.basename(r.path): r for r in iter_file_token_counts(repo_path, git_ref='HEAD')}
+        assert records["copy.py"].tokens == records["main.py"].tokens
+        assert records["main.py"].cached != records["copy.py"].cached
+
+def test_bare_shallow_clone():
+    """Test scanning a bare, depth-1 clone without a checkout."""
+    for repo_path in create_test_repo():
+        expected = process_repository(repo_path, total_only=True)
+        with tempfile.TemporaryDirectory() as clone_dir:
+            clone_for_scan(f"file://{repo_path}", clone_dir)
+
+            assert not os.path.exists(os.path.join(clone_dir, "main.py"))
+            assert process_repository(clone_dir, total_only=True, git_ref='HEAD') == expected
+
+def test_incremental_counts_from_base_commit():
+    """Test that counting only the diff from a stored base commit gives the full scan's results."""
+    for repo_path in create_test_repo():
+        repo = Repo(repo_path)
+        base = repo.head.commit.hexsha
+        Path(repo_path, "src/utils.py").write_text("def add(a, b):\n    return a + b + 0\n")
+        Path(repo_path, "static/extra.css").write_text("p { margin: 0; }\n")
+        repo.index.add(["src/utils.py", "static/extra.css"])
+        repo.index.remove(["README.md"], working_tree=True)
+        repo.index.commit("Change files")
+        expected_totals, totals = {}, {}
+        expected = process_repository(repo_path, total_only=True, git_ref='HEAD', tokenizer_totals=expected_totals)
+
+        with tempfile.TemporaryDirectory() as cache_dir, TokenCache(cache_dir) as cache:
+            process_repository(repo_path, total_only=True, git_ref=base, cache=cache)
+            tokenized = cache.stats()['misses']
+
+            result = process_repository(repo_path, total_only=True, git_ref='HEAD', git_base=base, cache=cache, tokenizer_totals=totals)
+            assert result == expected and totals == expected_totals
+            assert '.md' not in result[1]
+            # Only the two new blobs were tokenized
+            assert cache.stats()['misses'] == tokenized + 2
+
+def test_sparse_worktree_clone():
+    """Test that a sparse clone only checks out the files the scan counts, with the same results."""
+    for repo_path in create_test_repo():
+        repo = Repo(repo_path)
+        for path in ("node_modules/lib/index.js", "docs/notes.md", "static/logo.png", "src/Upper.PY"):
+            Path(repo_path, path).parent.mkdir(parents=True, exist_ok=True)
+            Path(repo_path, path).write_text(f"// {path}\n")
+        repo.index.add(["node_modules/lib/index.js", "docs/notes.md", "static/logo.png", "src/Upper.PY"])
+        repo.index.commit("Add more files")
+        exclude_dirs, exclude_patterns = {"node_modules"}, ["*.md"]
+        expected = process_repository(repo_path, total_only=True, exclude_dirs=exclude_dirs, exclude_patterns=exclude_patterns)
+
+        with tempfile.TemporaryDirectory() as clone_dir:
+            clone_worktree(f"file://{repo_path}", clone_dir, sparse_patterns=sparse_checkout_patterns(exclude_dirs, exclude_patterns))
+
+            for path in ("node_modules", "docs/notes.md", "README.md", "static/logo.png"):
+                assert not os.path.exists(os.path.join(clone_dir, path))
+            assert os.path.exists(os.path.join(clone_dir, "src/Upper.PY"))
+            assert process_repository(clone_dir, total_only=True, exclude_dirs=exclude_dirs, exclude_patterns=exclude_patterns) == expected
+
+def test_mirror_is_updated_in_place():
+    """Test that a mirror is cloned once and then fetches new commits."""
+    for repo_path in create_test_repo():
+        repo = Repo(repo_path)
+        with tempfile.TemporaryDirectory() as mirror_dir:
+            mirror = update_mirror(f"file://{repo_path}", mirror_dir)
+            assert process_repository(mirror, total_only=True, git_ref='HEAD') == process_repository(repo_path, total_only=True)
+
+            Path(repo_path, "new.py").write_text("print('new')\n")
+            repo.index.add(["new.py"])
+            repo.index.commit("Add new.py")
+            assert update_mirror(f"file://{repo_path}", mirror_dir) == mirror
+            assert os.listdir(mirror_dir) == [os.path.basename(mirror)]
+            assert process_repository(mirror, total_only=True, git_ref='HEAD') == process_repository(repo_path, total_only=True)
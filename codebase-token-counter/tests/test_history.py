@@ -0,0 +1,88 @@
+"""Tests for token counts over a commit history."""
+
+import csv
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+from git import Repo
+
+from codebase_token_counter.cache import TokenCache
+from codebase_token_counter.history import iter_token_history, list_commits, write_history_csv, write_history_json
+from codebase_token_counter.token_counter import main, process_repository
+from tests.test_repository import create_test_repo
+
+def add_commits(repo_path):
+    """Add three commits on top of the test repository."""
+    repo = Repo(repo_path)
+    for i in range(3):
+        Path(repo_path, f"module_{i}.py").write_text(f"def f{i}():\n    return {i}\n")
+        Path(repo_path, "main.py").write_text(f"print('version {i}')\n")
+        repo.index.add([f"module_{i}.py", "main.py"])
+        repo.index.commit(f"Commit {i}")
+
+def test_list_commits_steps_and_keeps_newest():
+    """Test commit selection with a step, oldest first and ending at the ref."""
+    for repo_path in create_test_repo():
+        add_commits(repo_path)
+        all_commits = list_commits(repo_path)
+        assert len(all_commits) == 4
+        assert all_commits[-1][0] == Repo(repo_path).head.commit.hexsha
+
+        stepped = list_commits(repo_path, step=2)
+        assert [commit for commit, _ in stepped] == [all_commits[0][0], all_commits[2][0], all_commits[3][0]]
+
+def test_history_matches_full_scans():
+    """Test that each point of the history equals a full scan of its commit."""
+    for repo_path in create_test_repo():
+        add_commits(repo_path)
+        commits = list_commits(repo_path)
+        with tempfile.TemporaryDirectory() as cache_dir, TokenCache(cache_dir) as cache:
+            points = list(iter_token_history(repo_path, commits, cache))
+            # Each unique blob is tokenized once: 5 initial files, then main.py and module_i.py per commit
+            assert cache.stats()['misses'] == 5 + 3 * 2
+
+        for point, (commit, date) in zip(points, commits):
+            assert (point.commit, point.date) == (commit, date)
+            assert (point.total_tokens, point.extension_stats, point.file_counts) == process_repository(
+                repo_path, total_only=True, git_ref=commit
+            )
+
+        output = io.StringIO()
+        write_history_json(iter(points), output)
+        assert [entry['total_tokens'] for entry in json.loads(output.getvalue())] == [p.total_tokens for p in points]
+
+        output = io.StringIO()
+        write_history_csv(iter(points), output)
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        assert [int(row['total_tokens']) for row in rows] == [p.total_tokens for p in points]
+        assert [int(row['.py']) for row in rows] == [p.extension_stats['.py'] for p in points]
+
+def test_history_command_writes_csv_and_json(monkeypatch, capsys):
+    """Test `token-counter history` on a local repository (CSV to stdout) and a cloned one (JSON to a file)."""
+    for repo_path in create_test_repo():
+        add_commits(repo_path)
+        commits = list_commits(repo_path, step=2)
+        expected = [process_repository(repo_path, total_only=True, git_ref=commit)[0] for commit, _ in commits]
+
+        monkeypatch.setattr(sys, "argv", ["token-counter", "history", repo_path, "--step", "2"])
+        main()
+        rows = list(csv.DictReader(io.StringIO(capsys.readouterr().out)))
+        assert [(row['commit'], row['date']) for row in rows] == commits
+        assert [int(row['total_tokens']) for row in rows] == expected
+        assert {'.py', '.md', '.css'} <= set(rows[0])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = Path(temp_dir, "history.json")
+            monkeypatch.setattr(sys, "argv", [
+                "token-counter", "history", f"file://{repo_path}", "--step", "2", "--format", "json",
+                "--output", str(output), "--cache", temp_dir
+            ])
+            main()
+            entries = json.loads(output.read_text())
+        assert [(entry['commit'], entry['total_tokens']) for entry in entries] == [
+            (commit, tokens) for (commit, _), tokens in zip(commits, expected)
+        ]
+        assert capsys.readouterr().out == ""
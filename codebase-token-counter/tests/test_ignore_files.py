@@ -0,0 +1,54 @@
+"""Tests for honoring .gitignore and .dockerignore files."""
+
+from pathlib import Path
+
+import pytest
+
+from codebase_token_counter.ignore_files import IgnoreRules, compile_ignore_lines
+from codebase_token_counter.token_counter import process_repository, walk_files
+from tests.test_repository import create_test_repo
+
+def test_gitignore_rules():
+    """Test .gitignore syntax: unanchored names, anchors, directory-only rules, '**' and negation."""
+    rules = IgnoreRules(levels=(('', compile_ignore_lines([
+        "# comment", "*.log", "!keep.log", "/dist", "cache/", "docs/**/*.html", "\\#notes", "trailing\\ ",
+    ])),))
+    assert rules.excludes("a/b/debug.log", False)
+    assert not rules.excludes("a/keep.log", False)
+    assert rules.excludes("dist", True) and not rules.excludes("src/dist", True)
+    assert rules.excludes("src/cache", True) and not rules.excludes("src/cache", False)
+    assert rules.excludes("docs/index.html", False) and rules.excludes("docs/a/b/page.html", False)
+    assert not rules.excludes("src/docs/index.html", False)
+    assert rules.excludes("#notes", False) and rules.excludes("trailing ", False)
+
+def test_ignore_files_prune_walk():
+    """Test that nested .gitignore files and the root .dockerignore prune the scan."""
+    for repo_path in create_test_repo():
+        files = {
+            ".gitignore": "build/\n*.log\n",
+            "build/out.js": "var built = 1;\n",
+            "debug.log": "log line\n",
+            "src/.gitignore": "generated_*.py\n!generated_keep.py\n",
+            "src/generated_a.py": "x = 1\n",
+            "src/generated_keep.py": "y = 2\n",
+            "tests/.gitignore": "*\n",
+            ".dockerignore": "static\nsrc/utils.py\n",
+        }
+        for path, content in files.items():
+            Path(repo_path, path).parent.mkdir(parents=True, exist_ok=True)
+            Path(repo_path, path).write_text(content)
+
+        def walked(*ignore_files, threads=1):
+            return {relative_path for _, relative_path in walk_files(repo_path, threads=threads, ignore_files=ignore_files)}
+
+        assert walked('.gitignore') == {
+            ".gitignore", ".dockerignore", "main.py", "README.md", "src/.gitignore", "src/utils.py",
+            "src/generated_keep.py", "static/style.css",
+        }
+        assert walked('.gitignore', threads=4) == walked('.gitignore')
+        assert walked('.dockerignore') == walked() - {"static/style.css", "src/utils.py"}
+
+        _, _, file_counts = process_repository(repo_path, total_only=True, ignore_files=('.gitignore', '.dockerignore'))
+        assert file_counts == {'.py': 2, '.md': 1}
+        with pytest.raises(ValueError):
+            process_repository(repo_path, total_only=True, ignore_files=('.hgignore',))
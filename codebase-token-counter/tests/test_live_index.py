@@ -0,0 +1,100 @@
+"""Tests for live indexes kept current as files change."""
+
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from codebase_token_counter.file_stats import TopFiles
+from codebase_token_counter.live_index import LiveIndex, LiveIndexManager
+from codebase_token_counter.token_counter import process_repository
+from tests.test_repository import create_test_repo
+
+def wait_for_results(index, expected, timeout=10):
+    """Return the index's results once they equal expected, or the last results after timeout."""
+    deadline = time.monotonic() + timeout
+    results = index.results()
+    while results != expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+        results = index.results()
+    return results
+
+class RecordingExecutor(ThreadPoolExecutor):
+    """Counts the batches submitted to it."""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+def test_live_index_follows_changes():
+    """Test that a polling index matches a fresh scan after files are created, changed and deleted."""
+    for repo_path in create_test_repo():
+        index = LiveIndex(repo_path, ignore_files=('.gitignore',), watch='poll', poll_interval=0.1)
+        index.start()
+        try:
+            assert index.wait(30)
+            assert index.mode == 'poll'
+
+            def expected():
+                return process_repository(repo_path, total_only=True, ignore_files=('.gitignore',))
+
+            assert index.results() == expected()
+
+            Path(repo_path, "src/new.py").write_text("def added():\n    return 42\n")
+            Path(repo_path, "README.md").write_text("# Rewritten\n\nWith more words than before.\n")
+            Path(repo_path, "main.py").unlink()
+            assert wait_for_results(index, expected()) == expected()
+
+            shutil.move(str(Path(repo_path, "src")), str(Path(repo_path, "lib")))
+            Path(repo_path, ".gitignore").write_text("static/\n")
+            assert wait_for_results(index, expected()) == expected()
+            assert '.css' not in index.results()[1]
+
+            totals = {}
+            index.results(totals)
+            assert totals == {'gpt2': index.results()[0]}
+            tree = index.directory_tree()
+            assert tree.tokens[0] == index.results()[0]
+            assert tree.find("src") is None and tree.find("lib") is not None
+            assert sum(index.token_histogram().tokens) == index.results()[0]
+            top_files = TopFiles(2)
+            process_repository(repo_path, total_only=True, ignore_files=('.gitignore',), top_files=top_files)
+            assert index.top_files(2).largest() == top_files.largest()
+        finally:
+            index.stop()
+        assert index.status == 'stopped'
+        assert index.results() == (0, {}, {})
+
+def test_manager_evicts_least_recently_used():
+    """Test that indexes beyond the memory limit are evicted, least recently used first."""
+    for repo_path in create_test_repo():
+        other_path = Path(repo_path, "src")
+        executor = RecordingExecutor()
+        manager = LiveIndexManager(memory_limit=10 ** 9, watch='poll', poll_interval=60, workers=2, executor=executor)
+        try:
+            first = manager.start(repo_path)
+            assert first.wait(30)
+            second = manager.start(str(other_path))
+            assert second.wait(30)
+            # Both builds were counted in the shared pool
+            assert first.results() == process_repository(repo_path, total_only=True)
+            assert executor.submitted == 2
+            assert manager.start(repo_path) is first
+            assert manager.get(repo_path, exclude_dirs={'tests'}) is None
+
+            # The first index was used last, so the second makes room
+            manager.memory_limit = first.memory_bytes
+            manager.enforce_limit()
+            assert second.status == 'evicted'
+            assert manager.get(str(other_path)) is None
+            assert manager.get(repo_path) is first
+            assert [index.id for index in manager.indexes()] == [first.id]
+        finally:
+            manager.close()
+        # Closing the indexes leaves the shared pool running
+        assert executor.submit(len, 'ok').result() == 2
+        executor.shutdown()
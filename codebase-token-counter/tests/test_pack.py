@@ -0,0 +1,112 @@
+"""Tests for packing files into a context window."""
+
+import io
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from codebase_token_counter.live_index import LiveIndex
+from codebase_token_counter.pack import (
+    BUNDLE_SEAM_TOKENS, PackFile, count_pack_files, pack_files, parse_window, write_bundle
+)
+from codebase_token_counter.token_counter import count_tokens, main
+from tests.test_repository import create_test_repo
+
+def test_pack_files_by_priority():
+    """Test that files are taken by priority tier, then order, while they fit the budget."""
+    files = [
+        PackFile('/r/src/big.py', 'src/big.py', 60, 2, mtime_ns=1),
+        PackFile('/r/src/small.py', 'src/small.py', 10, 2, mtime_ns=2),
+        PackFile('/r/README.md', 'README.md', 20, 2, mtime_ns=3),
+        PackFile('/r/docs/guide.md', 'docs/guide.md', 30, 2, mtime_ns=4),
+        PackFile('/r/setup.py', 'setup.py', 5, 2, mtime_ns=5),
+    ]
+
+    # src/ first, then Markdown, most recently modified first within each: big.py and
+    # README.md no longer fit, and setup.py, last, only fits with one more token
+    result = pack_files(files, 50, priorities=['src/', '*.md'], order='recent')
+    assert [file.relative_path for file in result.selected] == ['docs/guide.md', 'src/small.py']
+    assert result.tokens == 12 + 32
+    assert (result.files, result.skipped) == (5, 3)
+    result = pack_files(files, 51, priorities=['src/', '*.md'], order='recent')
+    assert [file.relative_path for file in result.selected] == ['docs/guide.md', 'setup.py', 'src/small.py']
+
+    # Without priorities, the smallest files first fit the most files
+    result = pack_files(files, 70, order='small')
+    assert [file.relative_path for file in result.selected] == ['README.md', 'setup.py', 'src/small.py']
+    assert pack_files(files, 1000, max_file_tokens=30).skipped == 1
+    assert pack_files(files, 0).selected == []
+    with pytest.raises(ValueError):
+        pack_files(files, 10, order='largest')
+
+def test_parse_window():
+    """Test window sizes and model names."""
+    assert parse_window('128k') == (128000, None)
+    assert parse_window('1M') == (1000000, None)
+    assert parse_window('4096') == (4096, None)
+    assert parse_window('claude 3 opus') == (200000, 'Claude 3 Opus (200K)')
+    with pytest.raises(ValueError):
+        parse_window('Claude')
+    with pytest.raises(ValueError):
+        parse_window('no such model')
+
+def test_bundle_fits_budget():
+    """Test that the bundle of the selected files has at most the tokens they were packed with."""
+    for repo_path in create_test_repo():
+        files = count_pack_files(repo_path)
+        assert sorted(file.relative_path for file in files) == [
+            'README.md', 'main.py', 'src/utils.py', 'static/style.css', 'tests/test_utils.py'
+        ]
+        result = pack_files(files, sum(file.cost for file in files) - 1, order='path')
+        assert result.skipped == 1
+        bundle = io.StringIO()
+        write_bundle(result.selected, bundle)
+        assert bundle.getvalue().startswith('<file path="README.md">\n# Test Repository')
+        # Only the margin for tokens merging at the seams of each file is left over
+        assert result.tokens - BUNDLE_SEAM_TOKENS * len(result.selected) <= count_tokens(bundle.getvalue()) <= result.tokens
+
+        # A live index packs the same files without a scan
+        index = LiveIndex(repo_path, watch='poll', poll_interval=60)
+        index.start()
+        try:
+            assert index.wait(30)
+            assert sorted(index.pack_files()) == sorted(file._replace(overhead=0) for file in files)
+        finally:
+            index.stop()
+
+def test_pack_counts_large_files_exactly():
+    """Test that files the 'sample' policy would estimate are counted exactly for a pack."""
+    with tempfile.TemporaryDirectory() as repo_path:
+        # Sampled windows of uneven text extrapolate to a different count
+        text = "word " * 200_000 + "".join(f"{i}, " for i in range(100_000))
+        Path(repo_path, "data.txt").write_text(text)
+        (file,) = count_pack_files(repo_path, max_file_size=1000, large_file_policy='sample')
+        assert file.tokens == count_tokens(text)
+
+def test_pack_command_bundle_fits_window(monkeypatch):
+    """Test that `token-counter pack` lists and bundles files within the window, less the reserve."""
+    for repo_path in create_test_repo():
+        files = count_pack_files(repo_path)
+        window = sum(file.cost for file in files) + 10
+        reserve = 20
+        with tempfile.TemporaryDirectory() as temp_dir:
+            listing = Path(temp_dir, "pack.json")
+            bundle = Path(temp_dir, "bundle.txt")
+            monkeypatch.setattr(sys, "argv", [
+                "token-counter", "pack", repo_path, "--window", str(window), "--reserve", str(reserve),
+                "--priority", "src/", "--format", "json", "--output", str(listing), "--bundle", str(bundle)
+            ])
+            main()
+            packed = json.loads(listing.read_text())
+            bundle_text = bundle.read_text()
+
+        assert (packed["window"], packed["budget"]) == (window, window - reserve)
+        # The priority is packed first, whatever else fits
+        assert "src/utils.py" in [file["path"] for file in packed["files"]]
+        assert 0 < len(packed["files"]) < len(files)
+        assert count_tokens(bundle_text) <= packed["tokens"] <= packed["budget"]
+        for file in packed["files"]:
+            assert f'<file path="{file["path"]}">' in bundle_text
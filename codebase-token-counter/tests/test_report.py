@@ -0,0 +1,38 @@
+"""Tests for the per-file reports."""
+
+import csv
+import io
+import json
+
+import pytest
+
+from codebase_token_counter.report import FileReportWriter
+from codebase_token_counter.token_counter import process_repository
+from tests.test_repository import create_test_repo
+
+def test_reports_match_scan_results():
+    """Test that every format lists each counted file once, with the scan's totals."""
+    for repo_path in create_test_repo():
+        results = {}
+        for report_format in ('json', 'jsonl', 'csv'):
+            output = io.StringIO()
+            report = FileReportWriter(output, report_format, repo_path)
+            totals = process_repository(repo_path, total_only=True, on_record=report.write)
+            report.finish(*totals)
+            results[report_format] = (output.getvalue(), totals)
+
+        document = json.loads(results['json'][0])
+        total_tokens, extension_stats, file_counts = results['json'][1]
+        assert (document['total_tokens'], document['extensions'], document['files']) == (total_tokens, extension_stats, file_counts)
+        rows = document['file_tokens']
+        assert sorted(row['path'] for row in rows) == ["README.md", "main.py", "src/utils.py", "static/style.css", "tests/test_utils.py"]
+        assert sum(row['tokens'] for row in rows) == total_tokens
+
+        assert [json.loads(line) for line in results['jsonl'][0].splitlines()] == rows
+        csv_rows = list(csv.DictReader(io.StringIO(results['csv'][0])))
+        assert [(row['path'], int(row['tokens']), int(row['bytes'])) for row in csv_rows] == [
+            (row['path'], row['tokens'], row['bytes']) for row in rows
+        ]
+
+        with pytest.raises(ValueError):
+            FileReportWriter(io.StringIO(), 'xml', repo_path)
@@ -4,8 +4,12 @@ import os
 import tempfile
 import shutil
 from pathlib import Path
+import pytest
 from git import Repo
-from codebase_token_counter.token_counter import process_repository
+from codebase_token_counter.token_counter import (
+    process_repository, iter_candidate_files, iter_file_token_counts, scan_options, walk_files, ScanOptions,
+    ScanProgress, ScanCancelled
+)
 
 def create_test_repo():
     """Create a test repository with sample files."""
@@ -59,3 +63,144 @@ def test_process_repository():
         # Check if token counts are reasonable
         for ext, count in extension_stats.items():
             assert count > 0  # Each file should have at least one token
+
+def test_parallel_processing_matches_serial():
+    """Test that worker processes and batching produce the same totals as the serial path."""
+    for repo_path in create_test_repo():
+        serial = process_repository(repo_path, total_only=True)
+        parallel = process_repository(repo_path, total_only=True, workers=2, batch_size=1)
+
+        assert parallel == serial
+
+def test_scan_options():
+    """Test that one ScanOptions scans as its settings do by name, and that named settings override it."""
+    for repo_path in create_test_repo():
+        options = ScanOptions(exclude_dirs={'src'}, workers=2, batch_size=1)
+        excluded = process_repository(repo_path, total_only=True, exclude_dirs={'src'})
+        assert process_repository(repo_path, total_only=True, options=options) == excluded
+        assert process_repository(repo_path, total_only=True, options=options, exclude_dirs=set()) == \
+            process_repository(repo_path, total_only=True)
+
+    assert scan_options(options, tokenizer='words').tokenizers == ('words',)
+    assert scan_options(extra_tokenizers=['words', 'gpt2']).tokenizers == ('gpt2', 'words')
+    with pytest.raises(TypeError):
+        scan_options(exclude_dir={'src'})
+    with pytest.raises(ValueError):
+        scan_options(options, large_file_policy='truncate')
+
+def test_large_file_policies():
+    """Test streaming, skipping and sampling of files above the size limit."""
+    for repo_path in create_test_repo():
+        Path(repo_path, "dump.sql").write_text("INSERT INTO users VALUES (1, 'alice');\n" * 2000)
+        total_tokens, extension_stats, file_counts = process_repository(repo_path, total_only=True)
+
+        # Streaming every file gives the same totals
+        assert process_repository(repo_path, total_only=True, stream_threshold=64) == (total_tokens, extension_stats, file_counts)
+
+        # Skipped files are left out entirely
+        _, skipped_stats, skipped_counts = process_repository(repo_path, total_only=True, max_file_size=10_000, large_file_policy='skip')
+        assert '.sql' not in skipped_stats and '.sql' not in skipped_counts
+        assert skipped_stats['.py'] == extension_stats['.py']
+
+        # Sampled files are estimated
+        _, sampled_stats, sampled_counts = process_repository(repo_path, total_only=True, max_file_size=10_000, large_file_policy='sample')
+        assert sampled_counts['.sql'] == 1
+        assert abs(sampled_stats['.sql'] - extension_stats['.sql']) <= extension_stats['.sql'] * 0.05
+
+def test_scan_progress_and_cancellation():
+    """Test that progress counters are filled in and that a cancelled scan stops."""
+    for repo_path in create_test_repo():
+        progress = ScanProgress()
+        process_repository(repo_path, total_only=True, batch_size=2, progress=progress)
+
+        assert progress.stage == 'done'
+        assert progress.files_discovered >= 5
+        assert progress.files_to_process == progress.files_tokenized == 5
+        assert progress.bytes_processed == sum(
+            os.path.getsize(os.path.join(repo_path, name))
+            for name in ["main.py", "README.md", "src/utils.py", "tests/test_utils.py", "static/style.css"]
+        )
+
+        cancelled = ScanProgress()
+        cancelled.cancel()
+        with pytest.raises(ScanCancelled):
+            process_repository(repo_path, total_only=True, progress=cancelled)
+        assert cancelled.files_tokenized == 0
+
+def test_on_file_callback_reports_every_file():
+    """Test that the on_file hook sees every counted file and adds up to the totals."""
+    for repo_path in create_test_repo():
+        seen = []
+        total_tokens, extension_stats, file_counts = process_repository(
+            repo_path, total_only=True, batch_size=2,
+            on_file=lambda path, extension, counts: seen.append((path, extension, counts['gpt2']))
+        )
+
+        assert len(seen) == sum(file_counts.values())
+        assert sum(tokens for _, _, tokens in seen) == total_tokens
+        for extension, tokens in extension_stats.items():
+            assert sum(t for _, ext, t in seen if ext == extension) == tokens
+
+def test_iter_file_token_counts_streams_records():
+    """Test that the generator API yields one record per file, matching process_repository."""
+    for repo_path in create_test_repo():
+        total_tokens, extension_stats, file_counts = process_repository(repo_path, total_only=True)
+
+        records = iter_file_token_counts(repo_path, batch_size=2)
+        first = next(records)
+        assert first.error is None and first.tokens > 0
+        records = [first, *records]
+
+        assert sorted(os.path.relpath(r.path, repo_path) for r in records) == sorted(
+            os.path.normpath(name) for name in ["main.py", "README.md", "src/utils.py", "tests/test_utils.py", "static/style.css"]
+        )
+        assert sum(r.tokens for r in records) == total_tokens
+        assert all(r.counts == {'gpt2': r.tokens} and r.size > 0 and not r.cached for r in records)
+
+def test_walk_files_threads_match_serial():
+    """Test that threaded walking finds the same files and does not follow directory symlinks."""
+    for repo_path in create_test_repo():
+        os.symlink(os.path.join(repo_path, "src"), os.path.join(repo_path, "src_link"))
+
+        serial = [relative_path for _, relative_path in walk_files(repo_path)]
+        threaded = [relative_path for _, relative_path in walk_files(repo_path, threads=4)]
+
+        assert sorted(threaded) == sorted(serial)
+        assert "src/utils.py" in serial
+        assert not any(path.startswith("src_link/") for path in serial)
+
+def test_iter_candidate_files_selects_without_reading(monkeypatch):
+    """Test that candidate files are the files a scan counts, with their stats and no content read."""
+    for repo_path in create_test_repo():
+        candidates = list(iter_candidate_files(repo_path, exclude_dirs={'tests'}, ignore_files=('.gitignore',)))
+        assert sorted(os.path.relpath(file_path, repo_path) for file_path, _, _, _ in candidates) == [
+            "README.md", "main.py", os.path.join("src", "utils.py"), os.path.join("static", "style.css")
+        ]
+        for file_path, extension, file_stat, error in candidates:
+            assert error is None
+            assert extension == os.path.splitext(file_path)[1]
+            assert file_stat.st_size == os.path.getsize(file_path)
+
+        # Larger files are left out, and a single file is its own candidate
+        small = [file_path for file_path, _, _, _ in iter_candidate_files(repo_path, skip_above=25)]
+        assert os.path.join(repo_path, "README.md") not in small
+        main_path = os.path.join(repo_path, "main.py")
+        assert [file_path for file_path, _, _, _ in iter_candidate_files(main_path)] == [main_path]
+
+        # A single file removed before it is stat'ed is yielded with its error, as the walk does
+        os.unlink(main_path)
+        monkeypatch.setattr(os.path, "isfile", lambda path: True)
+        [(file_path, extension, file_stat, error)] = list(iter_candidate_files(main_path))
+        assert (file_path, extension, file_stat) == (main_path, None, None)
+        assert "No such file" in error
+
+def test_binary_files_are_skipped_when_read():
+    """Test that binary files with text extensions are left out, whether read whole or streamed."""
+    for repo_path in create_test_repo():
+        expected = process_repository(repo_path, total_only=True)
+        Path(repo_path, "data.json").write_bytes(b"{\0}" + bytes(range(256)) * 100)
+
+        for stream_threshold in (64, 8 * 1024 * 1024):
+            progress = ScanProgress()
+            assert process_repository(repo_path, total_only=True, stream_threshold=stream_threshold, progress=progress) == expected
+            assert progress.files_to_process == progress.files_tokenized == 5
@@ -6,9 +6,13 @@ import pytest
 from pathlib import Path
 from codebase_token_counter.token_counter import (
     count_tokens,
+    count_tokens_streaming,
+    estimate_tokens_sampled,
     is_binary,
     format_number,
-    FILE_EXTENSIONS
+    FILE_EXTENSIONS,
+    MAX_SPLIT_TOKEN_ERROR,
+    _find_split
 )
 
 def test_token_counting():
@@ -93,3 +97,74 @@ def test_total_only_mode(capsys):
     finally:
         # Clean up
         os.unlink(test_path)
+
+def test_tokenizer_file_roundtrip(monkeypatch):
+    """Test counting with a tokenizer loaded from a pre-serialized file."""
+    from codebase_token_counter import backends, token_counter
+
+    code = "def hello_world():\n    print('Hello, world!')\n"
+    expected = count_tokens(code)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tokenizer_path = os.path.join(temp_dir, "tokenizer.json")
+        token_counter.export_tokenizer(tokenizer_path)
+
+        monkeypatch.setenv(backends.TOKENIZER_FILE_ENV, tokenizer_path)
+        monkeypatch.setattr(backends, "_backends", {})
+        assert count_tokens(code) == expected
+
+def test_streaming_token_counting():
+    """Test chunked counting against whole-file counting."""
+    import base64
+    import random
+
+    code = "def hello_world(name):\n    print(f'Hello, {name}!')\n\n\n    return  name\r\n" * 500
+    blob = base64.b64encode(random.Random(0).randbytes(30000)).decode()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        code_path = os.path.join(temp_dir, "code.py")
+        blob_path = os.path.join(temp_dir, "blob.txt")
+        Path(code_path).write_bytes(code.encode())
+        Path(blob_path).write_text(blob)
+
+        # Splits at newline/space boundaries are exact
+        expected = count_tokens(code.replace("\r\n", "\n"))
+        assert count_tokens_streaming(code_path, chunk_size=100) == expected
+
+        # A newline after a blank line is not a boundary: "\n\nword" pre-tokenizes
+        # as "\n", "\n", "word", but "\n\n" on its own is a single token
+        assert _find_split("x\n\nfoo bar", 0) == (len("x\n\nfoo"), True)
+        paragraphs = "word more\n\n" * 500
+        paragraphs_path = os.path.join(temp_dir, "paragraphs.txt")
+        Path(paragraphs_path).write_text(paragraphs)
+        assert count_tokens_streaming(paragraphs_path, chunk_size=20) == count_tokens(paragraphs)
+
+        # Text without whitespace is cut where chunks end, within the documented bound
+        forced_splits = len(blob) // 1000
+        assert abs(count_tokens_streaming(blob_path, chunk_size=1000) - count_tokens(blob)) <= MAX_SPLIT_TOKEN_ERROR * forced_splits
+
+        # Sampling a uniform file extrapolates close to the exact count
+        estimate = estimate_tokens_sampled(code_path, windows=4, window_size=2000)
+        assert abs(estimate - expected) <= expected * 0.05
+
+def test_command_line_options():
+    """Test that options parse in both spellings and that exclusion options combine."""
+    from codebase_token_counter.token_counter import _build_parser, _legacy_args, exclusions_from_args
+
+    parser = _build_parser()
+    args = parser.parse_args(_legacy_args(["repo", "-total", "-workers=4", "-cache", "-git=v1.0"]))
+    assert (args.target, args.total, args.workers, args.cache, args.git) == ("repo", True, 4, '', "v1.0")
+    # Other dash-prefixed arguments, and anything after '--', are left alone
+    assert _legacy_args(["-10", "-x.min.js", "-totals", "-workers", "--exclude=-x", "-tokenizer=gpt2"]) == [
+        "-10", "-x.min.js", "-totals", "-workers", "--exclude=-x", "--tokenizer=gpt2"
+    ]
+    args = parser.parse_args(_legacy_args(["-total", "--", "-total"]))
+    assert (args.target, args.total) == ("-total", True)
+
+    args = parser.parse_args([
+        "repo", "--exclude-preset", "docs", "--exclude-dir", "generated", "--exclude", "*.min.js", "--git"
+    ])
+    exclude_dirs, exclude_patterns = exclusions_from_args(args)
+    assert {"docs", "generated"} <= exclude_dirs
+    assert "*.md" in exclude_patterns and "*.min.js" in exclude_patterns
+    assert (args.git, args.cache) == ("HEAD", None)